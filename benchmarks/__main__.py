@@ -0,0 +1,47 @@
+"""
+Runs the hot path micro benchmarks (see benchmarks.hot_paths)
+
+Writes the results as JSON with --output. With --baseline, compares them to
+the results of an earlier run and exits with 1 if a benchmark got slower by
+more than --threshold (a share, 0.25 = 25%). Exits with 2 if no benchmark
+matches --filter.
+
+Run with: python -m benchmarks [--output results.json] [--baseline baseline.json] [--threshold 0.25] [--filter unpack]
+"""
+import argparse
+import sys
+
+from benchmarks.hot_paths import run_benchmarks, get_benchmarks, build_report, write_report, read_report, \
+    compare_results, BenchmarkFixtures, DEFAULT_REGRESSION_THRESHOLD
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Run the hot path micro benchmarks")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare the results to this earlier --output")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="slowdown that counts as regression (default: %s)" % DEFAULT_REGRESSION_THRESHOLD)
+    parser.add_argument("--filter", help="only run benchmarks with this in their name")
+    args = parser.parse_args()
+
+    # Fail on a missing baseline or a filter without benchmarks before running anything
+    baseline = read_report(args.baseline) if args.baseline else None
+    if not get_benchmarks(BenchmarkFixtures(), args.filter):
+        parser.error("no benchmark matches --filter %s" % args.filter)
+    results = run_benchmarks(args.filter)
+    if args.output:
+        write_report(build_report(results), args.output)
+        print("Wrote results to %s" % args.output)
+    if baseline is None:
+        sys.exit(0)
+
+    comparisons, regressions = compare_results(results, baseline["results"], args.threshold)
+    print("\nCompared to %s (%s, Python %s)" % (args.baseline, baseline["created_at"], baseline["python_version"]))
+    print("%-60s %12s %12s %8s" % ("benchmark", "baseline µs", "µs", "change"))
+    for name, baseline_us, current_us, ratio in comparisons:
+        print("%-60s %12.3f %12.3f %+7.0f%%%s" % (
+            name, baseline_us, current_us, (ratio - 1) * 100, "  REGRESSION" if name in regressions else ""))
+    if regressions:
+        print("%s of %s benchmarks regressed by more than %.0f%%" % (len(regressions), len(comparisons), args.threshold * 100))
+        sys.exit(1)
+    print("No regressions beyond %.0f%%" % (args.threshold * 100))
@@ -0,0 +1,356 @@
+"""
+Micro benchmarks of the decode, process and serialize hot paths
+
+Covers header parsing, unpack_udp_packet and serialize() per F1 22
+packet type, F12022Processor.process_serialized_packet per packet type,
+the processors' packet stats,
+the lap telemetry's update, clean_frame and flashback handling, lap
+serialization and the session's lap_times payload of 10, 50 and 70 lap
+races. Packets come from a synthetic race (see benchmarks.race_traffic).
+Each benchmark reports the best time per operation of REPEAT rounds.
+
+Run all of them with JSON output and baseline comparison: python -m benchmarks
+Run with: python -m benchmarks.hot_paths
+"""
+import json
+import logging
+import platform
+import time
+import timeit
+
+import config
+from benchmarks.race_traffic import SyntheticRace, PACKET_ID_FINAL_CLASSIFICATION
+from benchmarks.telemetry_memory import generate_telemetry
+from receiver.game_version import parse_game_version_from_udp_packet, unpack_packet_header
+from receiver.http_client import set_http_client
+from receiver.lap_telemetry_base import LapTelemetryBase
+from receiver.processor_stats import ProcessorStats, STAGE_DECODE
+from receiver.replay import NoopUploadSink
+from receiver.f12022.lap import F12022Lap
+from receiver.f12022.processor import F12022Processor
+from receiver.f12022.session import F12022Session
+from receiver.f12022.packets.helpers import unpack_udp_packet, HeaderFieldsToPacketType
+from receiver.f12022.packets.setup import PacketCarSetupData
+
+
+# Rounds per benchmark, the fastest one counts
+REPEAT = 5
+# Rounds of operations with an untimed setup last at least this long, setup included
+MIN_ROUND_SECONDS = 0.2
+# 90 second lap at 60Hz
+LAP_FRAME_COUNT = 5400
+# Frames removed by a flashback (5 seconds at 60Hz)
+FLASHBACK_FRAME_COUNT = 300
+# Session sizes of the lap_times payload benchmark, 90 second laps at 20Hz
+SESSION_LAP_COUNTS = [10, 50, 70]
+SESSION_FRAMES_PER_LAP = 1800
+# Benchmarks slower than the baseline by more than this share are regressions
+# (sub-microsecond benchmarks vary by ~20% between runs)
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+
+def measure(operation, ops_per_call=1, setup=None, repeat=REPEAT):
+    """
+    Return the best seconds per operation over repeat rounds
+    operation runs ops_per_call operations per call; setup, if given, runs untimed before every call
+    """
+    if setup is None:
+        timer = timeit.Timer(operation)
+        number, _ = timer.autorange()
+        return min(timer.repeat(repeat, number)) / number / ops_per_call
+    best_seconds = None
+    for _ in range(repeat):
+        round_seconds, call_count = 0, 0
+        round_end_time = time.perf_counter() + MIN_ROUND_SECONDS
+        while not call_count or time.perf_counter() < round_end_time:
+            setup()
+            start_time = time.perf_counter()
+            operation()
+            round_seconds += time.perf_counter() - start_time
+            call_count += 1
+        seconds = round_seconds / call_count / ops_per_call
+        best_seconds = seconds if best_seconds is None else min(best_seconds, seconds)
+    return best_seconds
+
+
+# Packets of the synthetic race that get benchmarked, by benchmark name (events by
+# their event code), and their packet type in the processor benchmarks
+SAMPLE_PACKETS = {
+    "PacketCarDamageData": "car_damage",
+    "PacketCarSetupData": "setup",
+    "PacketCarStatusData": "car_status",
+    "PacketCarTelemetryData": "telemetry",
+    "PacketEventData[FLBK]": "flashback",
+    "PacketEventData[PENA]": "penalty",
+    "PacketFinalClassificationData": "final_classification",
+    "PacketLapData": "lap",
+    "PacketParticipantsData": "participants",
+    "PacketSessionData": "session",
+}
+
+
+class BenchmarkFixtures:
+    """
+    Races, sessions and telemetry shared by benchmarks
+    Each gets built on first use, so benchmarks that get filtered out cost nothing
+    """
+
+    def __init__(self):
+        self.fixtures = {}
+
+    def get(self, name, build):
+        if name not in self.fixtures:
+            self.fixtures[name] = build()
+        return self.fixtures[name]
+
+    def get_sample_packets(self):
+        return self.get("sample_packets", get_sample_packets)
+
+    def get_race_processor(self):
+        return self.get("race_processor", lambda: build_race_processor(*self.get_sample_packets()))
+
+    def get_frame_values(self):
+        return self.get("frame_values", lambda: list(generate_telemetry(LAP_FRAME_COUNT)))
+
+    def get_session(self, lap_count):
+        return self.get("session[%s]" % lap_count, lambda: build_session(lap_count))
+
+
+def get_sample_packets():
+    """
+    Return the race and {name: datagram} of the last packet of each type of a synthetic race
+    The race doesn't send setup packets, so a blank one is added
+    """
+    race = SyntheticRace(lap_count=3, send_rate_hz=60, flashback_laps=[2], penalty_laps=[2])
+    packets = {}
+    for _, packet in race:
+        packet_type = HeaderFieldsToPacketType[unpack_packet_header(packet).packetId]
+        name = packet_type.__name__
+        if name == "PacketEventData":
+            name += "[%s]" % unpack_udp_packet(packet).eventStringCode.decode()
+        packets[name] = packet
+    packets[PacketCarSetupData.__name__] = bytes(race.create_packet(PacketCarSetupData, 5))
+    missing_names = set(SAMPLE_PACKETS) - set(packets)
+    if missing_names:
+        raise ValueError("Synthetic race has no %s packets" % ", ".join(sorted(missing_names)))
+    return race, packets
+
+
+def build_race_processor(race, packets):
+    """ Processor in the last lap of the race: everything but the final classification """
+    processor = F12022Processor("key_123", True)
+    for _, packet in race:
+        if unpack_packet_header(packet).packetId != PACKET_ID_FINAL_CLASSIFICATION:
+            processor.process(packet)
+    return processor
+
+
+def fill_lap_telemetry(lap_telemetry, frame_values):
+    for telemetry_values in frame_values:
+        lap_telemetry.update(telemetry_values)
+
+
+def measure_unpack(fixtures, name):
+    packet = fixtures.get_sample_packets()[1][name]
+    header = unpack_packet_header(packet)
+    packet_type = HeaderFieldsToPacketType[header.packetId]
+    return measure(lambda: unpack_udp_packet(packet, header, packet_type, player_car_only=True))
+
+
+def measure_serialize(fixtures, name):
+    packet = fixtures.get_sample_packets()[1][name]
+    return measure(unpack_udp_packet(packet, player_car_only=True).serialize)
+
+
+def measure_process_serialized_packet(fixtures, name):
+    processor = fixtures.get_race_processor()
+    packet_data = unpack_udp_packet(fixtures.get_sample_packets()[1][name], player_car_only=True).serialize()
+    # Penalties pile up on their lap otherwise
+    setup = processor.session.lap_list[packet_data["lap_number"]].penalties.clear \
+        if packet_data.get("event_type") == "penalty" else None
+    return measure(lambda: processor.process_serialized_packet(packet_data), setup=setup)
+
+
+def get_packet_benchmarks(fixtures):
+    """ Header parsing, decoding and serializing, like the F1 22 processor does it """
+    yield "parse_game_version_from_udp_packet", lambda: measure(
+        lambda: parse_game_version_from_udp_packet(fixtures.get_sample_packets()[1]["PacketCarTelemetryData"]))
+    for name in sorted(SAMPLE_PACKETS):
+        yield "unpack_udp_packet[%s]" % name, lambda name=name: measure_unpack(fixtures, name)
+        yield "serialize[%s]" % name, lambda name=name: measure_serialize(fixtures, name)
+
+
+def get_processor_benchmarks(fixtures):
+    """ process_serialized_packet per packet type, in the last lap of a race """
+    for name in sorted(SAMPLE_PACKETS):
+        yield "process_serialized_packet[%s]" % SAMPLE_PACKETS[name], \
+            lambda name=name: measure_process_serialized_packet(fixtures, name)
+
+
+def measure_processor_stats(sample_interval):
+    stats = ProcessorStats("F1 2022", sample_interval=sample_interval, log_interval=None)
+    return measure(lambda: stats.start_packet(6).stage_done(STAGE_DECODE))
+
+
+def get_processor_stats_benchmarks(fixtures):
+    """ Overhead of the processors' packet stats, for unsampled and sampled packets """
+    yield "ProcessorStats.start_packet[unsampled]", lambda: measure_processor_stats(10 ** 9)
+    yield "ProcessorStats.start_packet[sampled]", lambda: measure_processor_stats(1)
+
+
+def measure_telemetry_update(fixtures):
+    frame_values = fixtures.get_frame_values()
+    return measure(
+        lambda: fill_lap_telemetry(LapTelemetryBase(1, session_type=10), frame_values), ops_per_call=len(frame_values))
+
+
+def measure_clean_frame(fixtures):
+    frame_values = fixtures.get_frame_values()
+    lap_telemetry = LapTelemetryBase(1, session_type=10)
+    fill_lap_telemetry(lap_telemetry, frame_values)
+    return measure(lambda: lap_telemetry.clean_frame(frame_values[-1]["frame_identifier"]))
+
+
+def build_lap(frame_values):
+    lap = F12022Lap(lap_number=1, session_type=10, telemetry_enabled=True)
+    lap.init_telemetry()
+    fill_lap_telemetry(lap.telemetry, frame_values)
+    lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 30000, 30000, 30000
+    return lap
+
+
+def measure_flashback(fixtures):
+    frame_values = fixtures.get_frame_values()
+    lap = build_lap(frame_values)
+    flashback_frame_number = frame_values[-1]["frame_identifier"] - FLASHBACK_FRAME_COUNT
+    flashed_back_values = [values for values in frame_values if values["frame_identifier"] > flashback_frame_number]
+    return measure(
+        lambda: lap.process_flashback_event(flashback_frame_number),
+        # Drive the flashed back frames again
+        setup=lambda: fill_lap_telemetry(lap.telemetry, flashed_back_values))
+
+
+def measure_json_serialize(fixtures):
+    lap = build_lap(fixtures.get_frame_values())
+    return measure(lap.json_serialize, setup=lap.invalidate_serialized_lap)
+
+
+def get_telemetry_benchmarks(fixtures):
+    """ Lap telemetry updates, frame cleanup, flashbacks and lap serialization """
+    yield "LapTelemetryBase.update", lambda: measure_telemetry_update(fixtures)
+    yield "LapTelemetryBase.clean_frame", lambda: measure_clean_frame(fixtures)
+    yield "process_flashback_event", lambda: measure_flashback(fixtures)
+    yield "LapBase.json_serialize", lambda: measure_json_serialize(fixtures)
+
+
+def build_session(lap_count):
+    session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5)
+    frame_values = list(generate_telemetry(SESSION_FRAMES_PER_LAP))
+    for lap_number in range(1, lap_count + 1):
+        lap = session.add_lap(lap_number)
+        lap.init_telemetry()
+        fill_lap_telemetry(lap.telemetry, frame_values)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 30000, 30000, 30000
+    return session
+
+
+def invalidate_laps(laps):
+    for lap in laps:
+        lap.invalidate_serialized_lap()
+
+
+def measure_lap_times_list(fixtures, lap_count, cold):
+    session = fixtures.get_session(lap_count)
+    laps = list(session.lap_list.values())
+    if cold:
+        return measure(session.get_f1laps_lap_times_list, setup=lambda: invalidate_laps(laps), repeat=3)
+    return measure(session.get_f1laps_lap_times_list, setup=lambda: invalidate_laps(laps[-1:]))
+
+
+def get_session_benchmarks(fixtures):
+    """ The lap_times payload: cold, and after a new lap with the other laps cached """
+    for lap_count in SESSION_LAP_COUNTS:
+        yield "get_f1laps_lap_times_list[%s laps]" % lap_count, \
+            lambda lap_count=lap_count: measure_lap_times_list(fixtures, lap_count, cold=False)
+        yield "get_f1laps_lap_times_list[%s laps, cold]" % lap_count, \
+            lambda lap_count=lap_count: measure_lap_times_list(fixtures, lap_count, cold=True)
+
+
+BENCHMARK_GROUPS = [
+    get_packet_benchmarks,
+    get_processor_benchmarks,
+    get_processor_stats_benchmarks,
+    get_telemetry_benchmarks,
+    get_session_benchmarks,
+]
+
+
+def get_benchmarks(fixtures, name_filter=None):
+    """ Return (name, measure) of all benchmarks (with name_filter in their name); nothing gets built yet """
+    return [(name, run) for get_group_benchmarks in BENCHMARK_GROUPS for name, run in get_group_benchmarks(fixtures)
+            if not name_filter or name_filter in name]
+
+
+def run_benchmarks(name_filter=None, report=print):
+    """ Run all benchmarks (with name_filter in their name); returns {name: µs per operation} """
+    benchmarks = get_benchmarks(BenchmarkFixtures(), name_filter)
+    results = {}
+    # Final classification packets sync the session
+    previous_http_client = set_http_client(NoopUploadSink())
+    # Session and lap logs would drown the report
+    logging.disable(logging.INFO)
+    try:
+        for name, run in benchmarks:
+            results[name] = run() * 1e6
+            report("%-60s %12.3f µs" % (name, results[name]))
+    finally:
+        logging.disable(logging.NOTSET)
+        set_http_client(previous_http_client)
+    return results
+
+
+def build_report(results):
+    """ Machine readable results, with the environment they were measured in """
+    return {
+        "app_version": config.VERSION,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "unit": "us_per_op",
+        "results": results,
+    }
+
+
+def write_report(report, path):
+    with open(path, "w") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+
+
+def read_report(path):
+    with open(path) as report_file:
+        return json.load(report_file)
+
+
+def compare_results(results, baseline_results, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Compare results to a baseline's results
+    Returns (name, baseline µs, µs, ratio) of all benchmarks in both, and the names of the regressions
+    """
+    comparisons = []
+    regressions = []
+    for name in sorted(results):
+        if not baseline_results.get(name):
+            continue
+        ratio = results[name] / baseline_results[name]
+        comparisons.append((name, baseline_results[name], results[name], ratio))
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return comparisons, regressions
+
+
+def run():
+    return run_benchmarks()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,207 @@
+"""
+Local stand-in for the F1Laps API
+
+Implements the endpoints the app uses: laps/, grandprixs/sessions/ (create,
+update and list by udp_session_uid) and the user settings and app version
+endpoints of the GUI. Latency, error rate and uplink speed are configurable,
+so the sync paths can be measured without the real server.
+
+Start it on its own with: python -m benchmarks.mock_f1laps_api
+"""
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import config
+from receiver.http_client import CAPABILITIES_HEADER, CAPABILITY_GZIP_REQUESTS
+from receiver.session_sync import FULL_SYNC_REQUIRED_STATUS_CODE, CAPABILITY_PARTIAL_LAP_TIMES
+
+
+# Bodies are read in chunks of this size when the uplink is throttled
+READ_CHUNK_BYTES = 16 * 1024
+
+
+class MockF1LapsAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def handle_request(self, method):
+        mock_api = self.server.mock_api
+        body = self.read_body(mock_api.uplink_mbits)
+        if mock_api.latency_ms:
+            time.sleep(mock_api.latency_ms / 1000)
+        url = urlsplit(self.path)
+        status_code, response = mock_api.handle(method, url.path, parse_qs(url.query), self.headers, body)
+        response_body = json.dumps(response).encode("utf-8") if response is not None else b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header(CAPABILITIES_HEADER, ", ".join(mock_api.get_capabilities()))
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def read_body(self, uplink_mbits):
+        remaining_bytes = int(self.headers.get("Content-Length") or 0)
+        chunks = []
+        while remaining_bytes:
+            chunk = self.rfile.read(min(READ_CHUNK_BYTES, remaining_bytes))
+            if not chunk:
+                break
+            remaining_bytes -= len(chunk)
+            chunks.append(chunk)
+            if uplink_mbits:
+                time.sleep(len(chunk) * 8 / (uplink_mbits * 1000 * 1000))
+        return b"".join(chunks)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockF1LapsAPI:
+    """
+    latency_ms: added to every response
+    error_rate: share of lap and session requests that fail with a 500
+    uplink_mbits: request bodies are read at this speed (None = unthrottled)
+    accepts_gzip: advertises CAPABILITY_GZIP_REQUESTS if True; compressed bodies get a 400 if False, like a server that parses them as JSON
+    supports_partial_updates: advertises CAPABILITY_PARTIAL_LAP_TIMES if True; partial session updates get a 409 if False
+    """
+
+    def __init__(self, latency_ms=0, error_rate=0, uplink_mbits=None, accepts_gzip=True, supports_partial_updates=True, seed=22):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.uplink_mbits = uplink_mbits
+        self.accepts_gzip = accepts_gzip
+        self.supports_partial_updates = supports_partial_updates
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+
+        # Stored data
+        self.laps = []
+        self.sessions = {}
+
+        # Counters
+        self.request_counts = {}
+        self.status_code_counts = {}
+        self.bytes_received = 0
+
+    def start(self):
+        """ Start serving on a free local port; returns the API base URL """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MockF1LapsAPIHandler)
+        self.server.daemon_threads = True
+        self.server.mock_api = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.get_base_url()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_base_url(self):
+        return "http://127.0.0.1:%s/api/" % self.server.server_address[1]
+
+    def handle(self, method, path, query, headers, body):
+        """ Return the status code and JSON response of a request """
+        parts = [part for part in path.split("/") if part]
+        # api/<game version>/<endpoint...>
+        endpoint = "/".join(parts[2:])
+        with self.lock:
+            self.bytes_received += len(body)
+            status_code, response = self.route(method, endpoint, query, headers, body)
+            key = "%s %s" % (method, self.get_endpoint_name(endpoint))
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+            self.status_code_counts[status_code] = self.status_code_counts.get(status_code, 0) + 1
+        return status_code, response
+
+    def get_capabilities(self):
+        capabilities = []
+        if self.accepts_gzip:
+            capabilities.append(CAPABILITY_GZIP_REQUESTS)
+        if self.supports_partial_updates:
+            capabilities.append(CAPABILITY_PARTIAL_LAP_TIMES)
+        return capabilities
+
+    def get_endpoint_name(self, endpoint):
+        if endpoint.startswith("grandprixs/sessions/") and endpoint != "grandprixs/sessions":
+            return "grandprixs/sessions/<id>/"
+        return endpoint + "/"
+
+    def route(self, method, endpoint, query, headers, body):
+        if endpoint == "telemetry/app/version/current":
+            return 200, {"version": config.VERSION}
+        if not headers.get("Authorization", "").startswith("Token "):
+            return 401, {"detail": "Authentication credentials were not provided."}
+        if endpoint == "telemetry/app/user/settings":
+            return 200, {"telemetry_enabled": True, "subscription_plan": "monthly", "subscription_expires": None}
+        if method in ("POST", "PUT"):
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 500, {"detail": "Mock server error"}
+            if headers.get("Content-Encoding") == "gzip":
+                if not self.accepts_gzip:
+                    return 400, {"detail": "JSON parse error"}
+                body = gzip.decompress(body)
+            params = json.loads(body)
+        if endpoint == "laps" and method == "POST":
+            self.laps.append(params)
+            return 201, {"id": len(self.laps)}
+        if endpoint == "grandprixs/sessions" and method == "POST":
+            return self.create_session(params)
+        if endpoint == "grandprixs/sessions" and method == "GET":
+            session_uid = query.get("udp_session_uid", [None])[0]
+            results = [{"id": session_id} for session_id, session in self.sessions.items()
+                       if str(session["udp_session_uid"]) == session_uid]
+            return 200, {"results": results}
+        if endpoint.startswith("grandprixs/sessions/") and method == "PUT":
+            return self.update_session(endpoint.split("/")[-1], params)
+        return 404, {"detail": "Not found."}
+
+    def create_session(self, params):
+        if any(session["udp_session_uid"] == params["udp_session_uid"] for session in self.sessions.values()):
+            return 400, {"detail": "Session already exists"}
+        session_id = str(len(self.sessions) + 1)
+        self.sessions[session_id] = dict(params, laps={lap["lap_number"]: lap for lap in params["lap_times"]})
+        return 201, {"id": session_id}
+
+    def update_session(self, session_id, params):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return 404, {"detail": "Not found."}
+        if params.get("lap_times_partial"):
+            if not self.supports_partial_updates:
+                return FULL_SYNC_REQUIRED_STATUS_CODE, {"detail": "Send all laps"}
+            laps = session["laps"]
+        else:
+            laps = {}
+        laps.update({lap["lap_number"]: lap for lap in params["lap_times"]})
+        session.update(params, laps=laps)
+        return 200, {"id": session_id}
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.request_counts),
+                "status_codes": dict(self.status_code_counts),
+                "bytes_received": self.bytes_received,
+            }
+
+
+if __name__ == "__main__":
+    mock_api = MockF1LapsAPI()
+    print("Mock F1Laps API running at %s (Ctrl+C to stop)" % mock_api.start())
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        mock_api.stop()
@@ -0,0 +1,46 @@
+"""
+Micro benchmark for decoding the F1 22 per-car array packets
+
+Compares decoding the full packet (all 22 cars) and serializing it with
+decoding only the player's car via PlayerCarDecoder, per packet type.
+
+Run with: python -m benchmarks.player_car_decoding
+"""
+import ctypes
+import timeit
+
+from receiver.game_version import unpack_packet_header
+from receiver.f12022.packets.helpers import unpack_udp_packet, PacketTypeToPlayerCarDecoder, HeaderFieldsToPacketType
+
+
+ITERATIONS = 20000
+
+
+def build_packet(packet_type):
+    packet = packet_type()
+    packet.header.packetFormat = 2022
+    packet.header.packetId = {v: k for k, v in HeaderFieldsToPacketType.items()}[packet_type]
+    packet.header.playerCarIndex = 19
+    # Keep the receive buffer writable, like the receiver's ring buffer slots
+    return memoryview(bytearray(packet))
+
+
+def run(iterations=ITERATIONS):
+    results = {}
+    print("%-24s %6s %14s %14s %8s" % ("packet", "bytes", "full µs", "player car µs", "speedup"))
+    for packet_type in PacketTypeToPlayerCarDecoder:
+        packet = build_packet(packet_type)
+        header = unpack_packet_header(packet)
+        full = timeit.timeit(lambda: unpack_udp_packet(packet, header, packet_type).serialize(), number=iterations)
+        player_car = timeit.timeit(
+            lambda: unpack_udp_packet(packet, header, packet_type, player_car_only=True).serialize(), number=iterations)
+        full_us = full / iterations * 1e6
+        player_car_us = player_car / iterations * 1e6
+        results[packet_type.__name__] = (full_us, player_car_us)
+        print("%-24s %6s %14.2f %14.2f %7.1fx" % (
+            packet_type.__name__, ctypes.sizeof(packet_type), full_us, player_car_us, full_us / player_car_us))
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,457 @@
+"""
+Synthetic F1 22 race traffic
+
+Builds the datagrams the game sends during a race from the F1 22 packet
+classes: session, participants, lap data, car telemetry, car status and
+car damage of all cars, flashback and penalty events and the final
+classification. The race has a configurable number of laps, cars and
+send rate; flashbacks, pit stops and penalties happen on given laps, and
+packets get dropped at a given rate. Races with the same arguments and
+seed produce the same datagrams.
+
+Write a capture file (replay it with: python replay.py <file>):
+    python -m benchmarks.race_traffic --laps 50 --rate 60 --capture race.f1cap
+Send it to the receiver in real time, or N times as fast with --speed N:
+    python -m benchmarks.race_traffic --laps 50 --udp 127.0.0.1:20777
+Soak test the processors in-process, reporting CPU time and memory:
+    python -m benchmarks.race_traffic --laps 300 --rate 60 --soak
+
+Run with: python -m benchmarks.race_traffic
+"""
+import argparse
+import logging
+import math
+import random
+import socket
+import time
+
+from receiver.capture import PacketCaptureFile
+from receiver.http_client import set_http_client
+from receiver.packet_dispatch import PacketRouter
+from receiver.replay import NoopUploadSink
+from receiver.f12022.packets.session import PacketSessionData
+from receiver.f12022.packets.lap import PacketLapData
+from receiver.f12022.packets.event import PacketEventData
+from receiver.f12022.packets.participants import PacketParticipantsData
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+from receiver.f12022.packets.car_status import PacketCarStatusData
+from receiver.f12022.packets.car_damage import PacketCarDamageData
+from receiver.f12022.packets.final_classification import PacketFinalClassificationData
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+PACKET_FORMAT = 2022
+PACKET_ID_SESSION = 1
+PACKET_ID_LAP = 2
+PACKET_ID_EVENT = 3
+PACKET_ID_PARTICIPANTS = 4
+PACKET_ID_TELEMETRY = 6
+PACKET_ID_CAR_STATUS = 7
+PACKET_ID_FINAL_CLASSIFICATION = 8
+PACKET_ID_CAR_DAMAGE = 10
+
+# Seconds between the packets the game sends at a fixed rate
+SESSION_PACKET_INTERVAL = 0.5
+PARTICIPANTS_PACKET_INTERVAL = 5
+CAR_DAMAGE_PACKET_INTERVAL = 0.5
+
+SESSION_TYPE_RACE = 10
+GAME_MODE_SOLO_GRAND_PRIX = 3
+RESULT_STATUS_FINISHED = 3
+TYRE_COMPOUNDS_VISUAL = [16, 17, 18]
+POINTS = [25, 18, 15, 12, 10, 8, 6, 4, 2, 1]
+# Each car is this much slower per lap than the car ahead
+CAR_PACE_SPREAD = 0.002
+# Share of the lap at which events happen
+PENALTY_LAP_SHARE = 0.3
+FLASHBACK_LAP_SHARE = 0.5
+# Flashbacks go back this many seconds
+FLASHBACK_SECONDS = 5
+# Share of the lap the player spends in the pit lane before and after a stop
+PIT_ENTRY_LAP_SHARE = 0.95
+PIT_EXIT_LAP_SHARE = 0.03
+
+
+class SyntheticRace:
+    """
+    A race of lap_count laps, sent at send_rate_hz (the game's UDP rate setting, 10-60Hz)
+
+    Laps in flashback_laps, pit_laps and penalty_laps get a flashback,
+    a pit stop at their end and a penalty for the player. drop_rate is
+    the share of packets that never arrive; the final classification is
+    always sent.
+    """
+
+    def __init__(self, lap_count=5, send_rate_hz=20, car_count=22, player_car_index=0, lap_time_ms=90000,
+                 track_id=7, track_length=5891, team_id=0, flashback_laps=(), pit_laps=(), penalty_laps=(),
+                 drop_rate=0, seed=22):
+        self.lap_count = lap_count
+        self.send_rate_hz = send_rate_hz
+        self.car_count = car_count
+        self.player_car_index = player_car_index
+        self.track_id = track_id
+        self.track_length = track_length
+        self.team_id = team_id
+        self.flashback_laps = set(flashback_laps)
+        self.pit_laps = sorted(pit_laps)
+        self.penalty_laps = set(penalty_laps)
+        self.drop_rate = drop_rate
+        self.seed = seed
+        self.session_uid = random.Random(seed).getrandbits(64)
+        self.car_lap_times_ms = [lap_time_ms * (1 + CAR_PACE_SPREAD * car_index) for car_index in range(car_count)]
+
+        # Packets are built in place, one instance per packet type
+        self.session_packet = self.create_packet(PacketSessionData, PACKET_ID_SESSION)
+        self.participants_packet = self.create_packet(PacketParticipantsData, PACKET_ID_PARTICIPANTS)
+        self.lap_packet = self.create_packet(PacketLapData, PACKET_ID_LAP)
+        self.telemetry_packet = self.create_packet(PacketCarTelemetryData, PACKET_ID_TELEMETRY)
+        self.car_status_packet = self.create_packet(PacketCarStatusData, PACKET_ID_CAR_STATUS)
+        self.car_damage_packet = self.create_packet(PacketCarDamageData, PACKET_ID_CAR_DAMAGE)
+        self.event_packet = self.create_packet(PacketEventData, PACKET_ID_EVENT)
+        self.final_classification_packet = self.create_packet(PacketFinalClassificationData, PACKET_ID_FINAL_CLASSIFICATION)
+        self.init_static_packets()
+
+        # Counters
+        self.sent_count = 0
+        self.dropped_count = 0
+
+    def create_packet(self, packet_class, packet_id):
+        packet = packet_class()
+        packet.header.packetFormat = PACKET_FORMAT
+        packet.header.gameMajorVersion = 1
+        packet.header.packetVersion = 1
+        packet.header.packetId = packet_id
+        packet.header.sessionUID = self.session_uid
+        packet.header.playerCarIndex = self.player_car_index
+        packet.header.secondaryPlayerCarIndex = 255
+        return packet
+
+    def init_static_packets(self):
+        """ Set the fields that don't change during the race """
+        session = self.session_packet
+        session.totalLaps = self.lap_count
+        session.trackLength = self.track_length
+        session.sessionType = SESSION_TYPE_RACE
+        session.trackId = self.track_id
+        session.gameMode = GAME_MODE_SOLO_GRAND_PRIX
+        session.aiDifficulty = 90
+        session.trackTemperature = 32
+        session.airTemperature = 24
+        session.numWeatherForecastSamples = 1
+        session.weatherForecastSamples[0].sessionType = SESSION_TYPE_RACE
+
+        participants = self.participants_packet
+        participants.numActiveCars = self.car_count
+        for car_index in range(self.car_count):
+            participant = participants.participants[car_index]
+            participant.aiControlled = int(car_index != self.player_car_index)
+            participant.driverId = car_index
+            participant.teamId = self.team_id if car_index == self.player_car_index else car_index // 2
+            participant.raceNumber = car_index + 1
+            participant.name = ("Driver %s" % (car_index + 1)).encode("utf-8")
+
+        for car_index in range(self.car_count):
+            car_status = self.car_status_packet.carStatusData[car_index]
+            car_status.fuelCapacity = 110
+            car_status.maxRPM = 13000
+            car_status.idleRPM = 4000
+            car_status.maxGears = 8
+            self.lap_packet.lapData[car_index].gridPosition = car_index + 1
+            self.lap_packet.lapData[car_index].resultStatus = 2
+
+    def get_player_lap(self, session_time):
+        """ Return the player's lap number and the share of it that's driven """
+        laps_driven = session_time * 1000 / self.car_lap_times_ms[self.player_car_index]
+        return int(laps_driven) + 1, laps_driven % 1
+
+    def generate(self):
+        """ Yield (nanoseconds since the start, datagram) for the whole race """
+        tick_seconds = 1 / self.send_rate_hz
+        ticks_per_session_packet = max(round(SESSION_PACKET_INTERVAL * self.send_rate_hz), 1)
+        ticks_per_participants_packet = max(round(PARTICIPANTS_PACKET_INTERVAL * self.send_rate_hz), 1)
+        ticks_per_car_damage_packet = max(round(CAR_DAMAGE_PACKET_INTERVAL * self.send_rate_hz), 1)
+        pending_flashback_laps = set(self.flashback_laps)
+        pending_penalty_laps = set(self.penalty_laps)
+        # Every run of the race drops the same packets
+        drop_random = random.Random(self.seed)
+        self.sent_count = 0
+        self.dropped_count = 0
+        tick = 0
+        frame = 0
+        session_time = 0
+        while True:
+            lap_number, lap_share = self.get_player_lap(session_time)
+            if lap_number > self.lap_count:
+                break
+            timestamp_ns = round(tick * tick_seconds * 1e9)
+            packets = []
+            if tick % ticks_per_session_packet == 0:
+                packets.append(self.build_packet(self.session_packet, session_time, frame))
+            if tick % ticks_per_participants_packet == 0:
+                packets.append(self.build_packet(self.participants_packet, session_time, frame))
+            packets.append(self.build_lap_packet(session_time, frame))
+            packets.append(self.build_telemetry_packet(session_time, frame))
+            packets.append(self.build_car_status_packet(session_time, frame, lap_number, lap_share))
+            if tick % ticks_per_car_damage_packet == 0:
+                packets.append(self.build_car_damage_packet(session_time, frame, lap_number, lap_share))
+            if lap_number in pending_penalty_laps and lap_share >= PENALTY_LAP_SHARE:
+                pending_penalty_laps.discard(lap_number)
+                packets.append(self.build_penalty_packet(session_time, frame, lap_number))
+            if lap_number in pending_flashback_laps and lap_share >= FLASHBACK_LAP_SHARE:
+                pending_flashback_laps.discard(lap_number)
+                flashback_frames = min(round(FLASHBACK_SECONDS * self.send_rate_hz), frame)
+                frame -= flashback_frames
+                session_time -= flashback_frames * tick_seconds
+                packets.append(self.build_flashback_packet(session_time, frame))
+            for packet in packets:
+                if self.drop_rate and drop_random.random() < self.drop_rate:
+                    self.dropped_count += 1
+                    continue
+                self.sent_count += 1
+                yield timestamp_ns, packet
+            tick += 1
+            frame += 1
+            session_time = frame * tick_seconds
+        self.sent_count += 1
+        yield round(tick * tick_seconds * 1e9), self.build_final_classification_packet(session_time, frame)
+
+    def __iter__(self):
+        return self.generate()
+
+    def build_packet(self, packet, session_time, frame):
+        packet.header.sessionTime = session_time
+        packet.header.frameIdentifier = frame
+        return bytes(packet)
+
+    def build_lap_packet(self, session_time, frame):
+        for car_index in range(self.car_count):
+            car_lap_time_ms = self.car_lap_times_ms[car_index]
+            laps_driven = session_time * 1000 / car_lap_time_ms
+            current_lap_time_ms = (laps_driven % 1) * car_lap_time_ms
+            lap_data = self.lap_packet.lapData[car_index]
+            lap_data.currentLapNum = min(int(laps_driven) + 1, self.lap_count)
+            lap_data.lastLapTimeInMS = round(car_lap_time_ms) if laps_driven >= 1 else 0
+            lap_data.currentLapTimeInMS = round(current_lap_time_ms)
+            lap_data.sector1TimeInMS = round(car_lap_time_ms / 3) if current_lap_time_ms >= car_lap_time_ms / 3 else 0
+            lap_data.sector2TimeInMS = round(car_lap_time_ms / 3) if current_lap_time_ms >= car_lap_time_ms * 2 / 3 else 0
+            lap_data.sector = min(int(current_lap_time_ms * 3 / car_lap_time_ms), 2)
+            lap_data.lapDistance = (laps_driven % 1) * self.track_length
+            lap_data.totalDistance = laps_driven * self.track_length
+            # Cars keep their pace, so they keep their grid position
+            lap_data.carPosition = car_index + 1
+            lap_data.driverStatus = 4
+        player_lap_data = self.lap_packet.lapData[self.player_car_index]
+        lap_number, lap_share = self.get_player_lap(session_time)
+        player_lap_data.pitStatus = self.get_pit_status(lap_number, lap_share)
+        player_lap_data.numPitStops = self.get_pit_stop_count(lap_number)
+        return self.build_packet(self.lap_packet, session_time, frame)
+
+    def get_pit_status(self, lap_number, lap_share):
+        """ 0 = none, 1 = pitting, 2 = in pit area """
+        if lap_number in self.pit_laps and lap_share >= PIT_ENTRY_LAP_SHARE:
+            return 1
+        if lap_number - 1 in self.pit_laps and lap_share < PIT_EXIT_LAP_SHARE:
+            return 2
+        return 0
+
+    def get_pit_stop_count(self, lap_number):
+        return sum(1 for pit_lap in self.pit_laps if pit_lap < lap_number)
+
+    def build_telemetry_packet(self, session_time, frame):
+        for car_index in range(self.car_count):
+            laps_driven = session_time * 1000 / self.car_lap_times_ms[car_index]
+            # Eight straights and corners per lap
+            corner = math.sin(laps_driven * 16 * math.pi)
+            telemetry = self.telemetry_packet.carTelemetryData[car_index]
+            telemetry.speed = round(210 + 90 * corner)
+            telemetry.throttle = max(corner, 0)
+            telemetry.brake = max(-corner, 0)
+            telemetry.steer = -corner * 0.2
+            telemetry.gear = min(int(telemetry.speed / 40) + 1, 8)
+            telemetry.engineRPM = 9000 + round(2500 * corner)
+            telemetry.drs = int(corner > 0.9)
+            if car_index == self.player_car_index:
+                for wheel in range(4):
+                    telemetry.brakesTemperature[wheel] = 500 + round(300 * max(-corner, 0))
+                    telemetry.tyresSurfaceTemperature[wheel] = 95 + round(5 * corner)
+                    telemetry.tyresInnerTemperature[wheel] = 100
+                    telemetry.tyresPressure[wheel] = 23.5
+                telemetry.engineTemperature = 110
+        return self.build_packet(self.telemetry_packet, session_time, frame)
+
+    def build_car_status_packet(self, session_time, frame, lap_number, lap_share):
+        player_car_status = self.car_status_packet.carStatusData[self.player_car_index]
+        pit_stop_count = self.get_pit_stop_count(lap_number)
+        player_car_status.fuelInTank = 110 * (1 - (lap_number - 1 + lap_share) / (self.lap_count + 1))
+        player_car_status.fuelRemainingLaps = self.lap_count + 1 - (lap_number - 1 + lap_share)
+        player_car_status.visualTyreCompound = TYRE_COMPOUNDS_VISUAL[pit_stop_count % len(TYRE_COMPOUNDS_VISUAL)]
+        player_car_status.actualTyreCompound = player_car_status.visualTyreCompound
+        player_car_status.tyresAgeLaps = lap_number - 1 - (self.pit_laps[pit_stop_count - 1] if pit_stop_count else 0)
+        player_car_status.ersStoreEnergy = 2e6 + 1e6 * math.sin(lap_share * 2 * math.pi)
+        return self.build_packet(self.car_status_packet, session_time, frame)
+
+    def build_car_damage_packet(self, session_time, frame, lap_number, lap_share):
+        player_car_damage = self.car_damage_packet.carDamageData[self.player_car_index]
+        pit_stop_count = self.get_pit_stop_count(lap_number)
+        laps_on_tyres = lap_number - 1 + lap_share - (self.pit_laps[pit_stop_count - 1] if pit_stop_count else 0)
+        for wheel in range(4):
+            player_car_damage.tyresWear[wheel] = 1.5 * laps_on_tyres
+        return self.build_packet(self.car_damage_packet, session_time, frame)
+
+    def build_penalty_packet(self, session_time, frame, lap_number):
+        self.event_packet.eventStringCode = b"PENA"
+        penalty = self.event_packet.eventDetails.penalty
+        # Time penalty for corner cutting
+        penalty.penaltyType = 4
+        penalty.infringementType = 7
+        penalty.vehicleIdx = self.player_car_index
+        penalty.otherVehicleIdx = 255
+        penalty.time = 5
+        penalty.lapNum = lap_number
+        penalty.placesGained = 0
+        return self.build_packet(self.event_packet, session_time, frame)
+
+    def build_flashback_packet(self, session_time, frame):
+        """ Sent after the flashback with the frame and session time it went back to """
+        self.event_packet.eventStringCode = b"FLBK"
+        self.event_packet.eventDetails.flashback.flashbackFrameIdentifier = frame
+        self.event_packet.eventDetails.flashback.flashbackSessionTime = session_time
+        return self.build_packet(self.event_packet, session_time, frame)
+
+    def build_final_classification_packet(self, session_time, frame):
+        packet = self.final_classification_packet
+        packet.numCars = self.car_count
+        for car_index in range(self.car_count):
+            classification = packet.classificationData[car_index]
+            classification.position = car_index + 1
+            classification.numLaps = self.lap_count
+            classification.gridPosition = car_index + 1
+            classification.points = POINTS[car_index] if car_index < len(POINTS) else 0
+            classification.resultStatus = RESULT_STATUS_FINISHED
+            classification.bestLapTimeInMS = round(self.car_lap_times_ms[car_index])
+            classification.totalRaceTime = self.lap_count * self.car_lap_times_ms[car_index] / 1000
+            classification.numPitStops = len(self.pit_laps) if car_index == self.player_car_index else 0
+            if car_index == self.player_car_index:
+                classification.numPenalties = len(self.penalty_laps)
+                classification.penaltiesTime = 5 * len(self.penalty_laps)
+        return self.build_packet(packet, session_time, frame)
+
+
+def write_capture(race, path):
+    """ Write the race to a capture file; returns the number of packets """
+    capture_file = PacketCaptureFile(path)
+    start_ns = time.monotonic_ns()
+    for timestamp_ns, packet in race:
+        capture_file.write_packet(start_ns + timestamp_ns, packet)
+    capture_file.close()
+    return capture_file.packet_count
+
+
+def send_udp(race, host, port, speed=1.0):
+    """ Send the race to a UDP port, at the race's pace times speed (None = as fast as possible) """
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_time = time.perf_counter()
+    for timestamp_ns, packet in race:
+        if speed:
+            wait_seconds = timestamp_ns / 1e9 / speed - (time.perf_counter() - start_time)
+            if wait_seconds > 0:
+                time.sleep(wait_seconds)
+        udp_socket.sendto(packet, (host, port))
+    udp_socket.close()
+    return race.sent_count
+
+
+def get_max_rss_mb():
+    """ Peak resident memory of the process, if the platform reports it (Linux reports KB) """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def soak(race, report_interval_laps=10, report=print):
+    """
+    Feed the race to the processors in this process, uploads go to a no-op sink
+    Reports the processors' packets/s, the process's CPU time (including
+    generating the race) and peak memory every report_interval_laps laps
+    """
+    packet_router = PacketRouter("soak", telemetry_enabled=True)
+    previous_http_client = set_http_client(NoopUploadSink())
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    process_seconds = 0
+    next_report_lap = report_interval_laps
+    packet_count = 0
+    report("%6s %10s %12s %10s %12s" % ("lap", "packets", "packets/s", "cpu s", "max rss MB"))
+    # Session and lap logs would drown the report
+    logging.disable(logging.INFO)
+    try:
+        for timestamp_ns, packet in race:
+            packet_start_time = time.perf_counter()
+            packet_router.process_packet(packet)
+            process_seconds += time.perf_counter() - packet_start_time
+            packet_count += 1
+            session = packet_router.processor.session if packet_router.processor else None
+            lap_number = max(session.lap_list) if session and session.lap_list else 0
+            if lap_number >= next_report_lap:
+                next_report_lap += report_interval_laps
+                max_rss_mb = get_max_rss_mb()
+                report("%6s %10s %12.0f %10.1f %12s" % (lap_number, packet_count, packet_count / process_seconds,
+                       time.process_time() - start_cpu_time, "-" if max_rss_mb is None else "%.0f" % max_rss_mb))
+    finally:
+        logging.disable(logging.NOTSET)
+        set_http_client(previous_http_client)
+    return {
+        "packets": packet_count,
+        "seconds": time.perf_counter() - start_time,
+        "process_seconds": process_seconds,
+        "cpu_seconds": time.process_time() - start_cpu_time,
+        "max_rss_mb": get_max_rss_mb(),
+    }
+
+
+def run():
+    race = SyntheticRace(lap_count=10, send_rate_hz=60, flashback_laps=[3], pit_laps=[5], penalty_laps=[7], drop_rate=0.01)
+    print("%s laps at %sHz, %s cars" % (race.lap_count, race.send_rate_hz, race.car_count))
+    stats = soak(race, report_interval_laps=5)
+    print("%s packets (%s dropped) in %.1fs, processed at %.0f packets/s, %.1fs CPU" % (
+        stats["packets"], race.dropped_count, stats["seconds"], stats["packets"] / stats["process_seconds"], stats["cpu_seconds"]))
+    return stats
+
+
+def parse_laps(value):
+    return [int(lap) for lap in value.split(",") if lap]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic F1 22 race traffic")
+    parser.add_argument("--laps", type=int, default=5)
+    parser.add_argument("--rate", type=int, default=20, help="send rate in Hz (10-60)")
+    parser.add_argument("--cars", type=int, default=22)
+    parser.add_argument("--flashbacks", type=parse_laps, default=[], help="laps with a flashback, e.g. 3,12")
+    parser.add_argument("--pits", type=parse_laps, default=[], help="laps at whose end the player pits")
+    parser.add_argument("--penalties", type=parse_laps, default=[], help="laps with a penalty for the player")
+    parser.add_argument("--drop-rate", type=float, default=0, help="share of packets that get dropped")
+    parser.add_argument("--seed", type=int, default=22)
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--capture", help="write a capture file")
+    output.add_argument("--udp", help="send to HOST:PORT")
+    output.add_argument("--soak", action="store_true", help="feed the processors in-process")
+    parser.add_argument("--speed", type=float, default=1.0, help="UDP send speed, 1 is real time, 0 as fast as possible")
+    args = parser.parse_args()
+
+    race = SyntheticRace(lap_count=args.laps, send_rate_hz=args.rate, car_count=args.cars, flashback_laps=args.flashbacks,
+                         pit_laps=args.pits, penalty_laps=args.penalties, drop_rate=args.drop_rate, seed=args.seed)
+    if args.capture:
+        print("Wrote %s packets to %s" % (write_capture(race, args.capture), args.capture))
+    elif args.udp:
+        host, port = args.udp.rsplit(":", 1)
+        print("Sent %s packets to %s" % (send_udp(race, host, int(port), args.speed or None), args.udp))
+    elif args.soak:
+        soak(race)
+    else:
+        run()
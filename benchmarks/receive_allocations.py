@@ -0,0 +1,135 @@
+"""
+Micro benchmark for the UDP receive path
+
+Sends F1 22 car telemetry datagrams over a loopback socket and compares
+the allocations per datagram of the old receive path (recv() + copying
+every struct) with the current one (recv_into() a ring buffer slot +
+decoding the structs in place).
+
+Run with: python -m benchmarks.receive_allocations
+"""
+import socket
+import time
+import tracemalloc
+
+from receiver.game_version import parse_game_version_from_udp_packet, unpack_packet_header
+from receiver.packet_dispatch import get_packet_handler
+from receiver.ring_buffer import PacketRingBuffer
+from receiver.receiver import PACKET_BATCH_SIZE, RECEIVE_NONBLOCKING_FLAG
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+from receiver.f12022.packets.helpers import unpack_udp_packet
+
+
+DATAGRAM_COUNT = 2000
+
+
+def build_car_telemetry_packet():
+    packet = PacketCarTelemetryData()
+    packet.header.packetFormat = 2022
+    packet.header.packetId = 6
+    return bytes(packet)
+
+
+def create_socket_pair():
+    receive_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receive_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    receive_socket.bind(("127.0.0.1", 0))
+    send_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    return receive_socket, send_socket
+
+
+def send_datagrams(send_socket, address, packet, count):
+    for _ in range(count):
+        send_socket.sendto(packet, address)
+
+
+def receive_copying(receive_socket, retained):
+    """ Receive path before the ring buffer: a new bytes object per datagram, every struct copies it """
+    packet = receive_socket.recv(2048)
+    parse_game_version_from_udp_packet(packet)
+    retained.append(unpack_udp_packet(packet))
+    return 1
+
+
+def make_receive_in_place(ring_buffer):
+    def receive_in_place(receive_socket, retained):
+        """ 
+        Current receive path: drain a batch of datagrams into preallocated
+        ring buffer slots with recv_into, then decode them in place 
+        """
+        received_slots = []
+        receive_flags = 0
+        while len(received_slots) < PACKET_BATCH_SIZE:
+            slot_index = ring_buffer.acquire_write_slot()
+            try:
+                length = receive_socket.recv_into(ring_buffer.get_slot(slot_index), 0, receive_flags)
+            except BlockingIOError:
+                ring_buffer.abort(slot_index)
+                break
+            received_slots.append((slot_index, length))
+            if not RECEIVE_NONBLOCKING_FLAG:
+                break
+            receive_flags = RECEIVE_NONBLOCKING_FLAG
+        ring_buffer.commit_batch(received_slots)
+        for slot_index in ring_buffer.pop_batch(PACKET_BATCH_SIZE, timeout=0):
+            view = ring_buffer.view(slot_index)
+            header = unpack_packet_header(view)
+            handler = get_packet_handler(header)
+            retained.append(unpack_udp_packet(view, header, handler.packet_type))
+            ring_buffer.release(slot_index)
+        return len(received_slots)
+    return receive_in_place
+
+
+def measure(receive, packet, count):
+    """ Return (allocated bytes per datagram, allocated blocks per datagram, µs per datagram) """
+    receive_socket, send_socket = create_socket_pair()
+    address = receive_socket.getsockname()
+    retained = []
+    try:
+        # Warm up so type caches etc. don't count as per-datagram allocations
+        send_datagrams(send_socket, address, packet, 10)
+        received_count = 0
+        while received_count < 10:
+            received_count += receive(receive_socket, [])
+
+        send_datagrams(send_socket, address, packet, count)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        received_count = 0
+        while received_count < count:
+            received_count += receive(receive_socket, retained)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, "filename")
+        allocated_bytes = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+        allocated_blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+        retained.clear()
+
+        send_datagrams(send_socket, address, packet, count)
+        start_time = time.perf_counter()
+        received_count = 0
+        while received_count < count:
+            received_count += receive(receive_socket, retained)
+        duration = time.perf_counter() - start_time
+    finally:
+        receive_socket.close()
+        send_socket.close()
+    return allocated_bytes / count, allocated_blocks / count, duration / count * 1e6
+
+
+def run(count=DATAGRAM_COUNT):
+    packet = build_car_telemetry_packet()
+    results = {
+        "copying": measure(receive_copying, packet, count),
+        "in_place": measure(make_receive_in_place(PacketRingBuffer(depth=PACKET_BATCH_SIZE)), packet, count),
+    }
+    print("%s datagrams of %s bytes" % (count, len(packet)))
+    for name, (allocated_bytes, allocated_blocks, microseconds) in results.items():
+        print("%-10s %8.1f bytes/datagram %6.2f blocks/datagram %6.2f µs/datagram" % (
+            name, allocated_bytes, allocated_blocks, microseconds))
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,58 @@
+"""
+Session re-sync cost over a 70 lap race
+
+Multi-lap sessions get re-synced after every lap, with all completed laps
+in the payload. Compares the time spent building the lap_times payload over
+the race with cached lap serialization vs. serializing every lap each time.
+
+Run with: python -m benchmarks.session_resync
+"""
+import time
+
+from benchmarks.telemetry_memory import generate_telemetry
+from receiver.f12022.session import F12022Session
+
+
+LAP_COUNT = 70
+# 20Hz, the game's default UDP rate
+FRAMES_PER_LAP = 1800
+
+
+def drive_race(resync, lap_count=LAP_COUNT, frames_per_lap=FRAMES_PER_LAP, **session_kwargs):
+    """ Drive a race and call resync(session) after each lap; returns the total resync time in ms """
+    lap_telemetry_values = list(generate_telemetry(frames_per_lap))
+    session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5, **session_kwargs)
+    resync_seconds = 0
+    for lap_number in range(1, lap_count + 1):
+        lap = session.add_lap(lap_number)
+        lap.init_telemetry()
+        for telemetry_values in lap_telemetry_values:
+            lap.telemetry.update(telemetry_values)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 30000, 30000, 30000
+        start_time = time.perf_counter()
+        resync(session)
+        resync_seconds += time.perf_counter() - start_time
+    return resync_seconds * 1000
+
+
+def resync_cached(session):
+    return session.get_f1laps_lap_times_list()
+
+
+def resync_uncached(session):
+    for lap in session.lap_list.values():
+        lap.invalidate_serialized_lap()
+    return session.get_f1laps_lap_times_list()
+
+
+def run():
+    uncached_ms = drive_race(resync_uncached)
+    cached_ms = drive_race(resync_cached)
+    print("%s laps of %s frames, re-synced after every lap" % (LAP_COUNT, FRAMES_PER_LAP))
+    print("uncached  %8.0f ms" % uncached_ms)
+    print("cached    %8.0f ms (%.0fx faster)" % (cached_ms, uncached_ms / cached_ms))
+    return uncached_ms, cached_ms
+
+
+if __name__ == "__main__":
+    run()
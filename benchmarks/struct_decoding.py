@@ -0,0 +1,40 @@
+"""
+Micro benchmark for the generated struct decoders
+
+Compares decoding + serializing each F1 22 packet type with ctypes
+(from_buffer on the receive buffer) and with the generated StructDecoder.
+
+Run with: python -m benchmarks.struct_decoding
+"""
+import ctypes
+import timeit
+
+from receiver.f12022.packets.helpers import unpack_udp_packet, HeaderFieldsToPacketType
+
+
+ITERATIONS = 20000
+
+
+def build_packet(packet_type):
+    packet = packet_type()
+    packet.header.packetFormat = 2022
+    packet.header.playerCarIndex = 19
+    return memoryview(bytearray(packet))
+
+
+def run(iterations=ITERATIONS):
+    results = {}
+    print("%-30s %6s %10s %12s" % ("packet", "bytes", "ctypes µs", "generated µs"))
+    for packet_type in HeaderFieldsToPacketType.values():
+        packet = build_packet(packet_type)
+        ctypes_time = timeit.timeit(
+            lambda: unpack_udp_packet(packet, packet_type=packet_type).serialize(), number=iterations)
+        generated_time = timeit.timeit(
+            lambda: unpack_udp_packet(packet, packet_type=packet_type, use_struct_decoder=True).serialize(), number=iterations)
+        results[packet_type.__name__] = (ctypes_time / iterations * 1e6, generated_time / iterations * 1e6)
+        print("%-30s %6s %10.2f %12.2f" % ((packet_type.__name__, ctypes.sizeof(packet_type)) + results[packet_type.__name__]))
+    return results
+
+
+if __name__ == "__main__":
+    run()
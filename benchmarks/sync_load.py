@@ -0,0 +1,148 @@
+"""
+Load test of the F1Laps sync paths against the local mock F1Laps API
+
+Drives F1LapsAPIBase and the F1 22 session sync paths against
+benchmarks.mock_f1laps_api with 20ms server latency, and reports sync
+throughput, p50/p99 sync latency, bytes sent and retries:
+- time trial: every lap gets created individually
+- race full / delta: the session gets synced after every lap, with all
+  laps or only the new ones
+- with errors: 20% of requests fail, the outbox retries what wasn't
+  uploaded by a later sync
+
+Run with: python -m benchmarks.sync_load
+"""
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.mock_f1laps_api import MockF1LapsAPI
+from benchmarks.session_resync import drive_race
+from receiver.api_base import F1LapsAPIBase
+from receiver.http_client import F1LapsHTTPClient
+from receiver.outbox import F1LapsOutbox, OutboxWorker
+from receiver.session_sync import SessionSyncState
+
+
+LAP_COUNT = 20
+FRAMES_PER_LAP = 1800
+LATENCY_MS = 20
+ERROR_RATE = 0.2
+# Outbox retry rounds before giving up on the remaining entries
+MAX_RETRY_ROUNDS = 20
+
+
+def get_percentile(values, percentile):
+    """ Nearest-rank percentile """
+    ordered = sorted(values)
+    return ordered[max(int(round(percentile / 100 * len(ordered))) - 1, 0)]
+
+
+class SyncLoadTest:
+    """ One scenario: a mock API, an HTTP client and the latency of each sync """
+
+    def __init__(self, name, error_rate=0):
+        self.name = name
+        self.mock_api = MockF1LapsAPI(latency_ms=LATENCY_MS, error_rate=error_rate)
+        self.http_client = F1LapsHTTPClient()
+        self.api = F1LapsAPIBase("key_123", "f12022", http_client=self.http_client, base_url=self.mock_api.start())
+        self.latencies_ms = []
+        self.failed_count = 0
+        self.retried_count = 0
+
+    def timed(self, sync):
+        start_time = time.perf_counter()
+        success = sync()
+        self.latencies_ms.append((time.perf_counter() - start_time) * 1000)
+        if not success:
+            self.failed_count += 1
+
+    def sync_lap(self, session):
+        lap = session.lap_list[max(session.lap_list)]
+        self.timed(lambda: session.sync_lap_to_f1laps(lap, self.api))
+
+    def sync_session(self, session):
+        def sync():
+            success, session.f1_laps_session_id = session.sync_session_to_f1laps(self.api)
+            return success
+        self.timed(sync)
+
+    def drain_outbox(self, outbox):
+        """ Retry failed uploads, without waiting for their backoff """
+        worker = OutboxWorker(outbox, "key_123", api_base_url=self.api.base_url)
+        for _ in range(MAX_RETRY_ROUNDS):
+            if not len(outbox):
+                break
+            outbox.connection.execute("UPDATE outbox SET next_attempt_at = 0")
+            worker.process_due_entries()
+        self.retried_count = outbox.get_stats()["retried"]
+        return len(outbox)
+
+    def get_result(self):
+        sync_seconds = sum(self.latencies_ms) / 1000
+        result = {
+            "syncs": len(self.latencies_ms),
+            "failed": self.failed_count,
+            "retried": self.retried_count,
+            "syncs_per_second": len(self.latencies_ms) / sync_seconds,
+            "p50_ms": get_percentile(self.latencies_ms, 50),
+            "p99_ms": get_percentile(self.latencies_ms, 99),
+            "bytes_sent": self.mock_api.get_stats()["bytes_received"],
+            "requests": sum(self.mock_api.get_stats()["requests"].values()),
+        }
+        self.http_client.close()
+        self.mock_api.stop()
+        return result
+
+
+def run_time_trial():
+    load_test = SyncLoadTest("time trial")
+    drive_race(load_test.sync_lap, lap_count=LAP_COUNT, frames_per_lap=FRAMES_PER_LAP)
+    return load_test
+
+
+def run_race(delta_session_sync=False):
+    load_test = SyncLoadTest("race delta" if delta_session_sync else "race full")
+    drive_race(load_test.sync_session, lap_count=LAP_COUNT, frames_per_lap=FRAMES_PER_LAP,
+               session_sync_state=SessionSyncState() if delta_session_sync else None)
+    return load_test
+
+
+def run_with_errors(name, sync_name):
+    load_test = SyncLoadTest(name, error_rate=ERROR_RATE)
+    with tempfile.TemporaryDirectory() as directory:
+        outbox = F1LapsOutbox(os.path.join(directory, "outbox.sqlite3"))
+        drive_race(getattr(load_test, sync_name), lap_count=LAP_COUNT, frames_per_lap=FRAMES_PER_LAP, outbox=outbox)
+        pending_count = load_test.drain_outbox(outbox)
+        outbox.close()
+    if pending_count:
+        print("%s uploads still pending after %s retry rounds" % (pending_count, MAX_RETRY_ROUNDS))
+    return load_test
+
+
+def run():
+    results = {}
+    print("%s laps of %s frames, %sms server latency" % (LAP_COUNT, FRAMES_PER_LAP, LATENCY_MS))
+    print("%-12s %6s %7s %8s %9s %8s %8s %12s %9s" % (
+        "", "syncs", "failed", "retried", "syncs/s", "p50 ms", "p99 ms", "bytes sent", "requests"))
+    # Failed syncs are expected in the error scenarios
+    logging.disable(logging.ERROR)
+    load_tests = [
+        run_time_trial(),
+        run_race(),
+        run_race(delta_session_sync=True),
+        run_with_errors("tt errors", "sync_lap"),
+        run_with_errors("race errors", "sync_session"),
+    ]
+    logging.disable(logging.NOTSET)
+    for load_test in load_tests:
+        result = results[load_test.name] = load_test.get_result()
+        print("%-12s %6s %7s %8s %9.1f %8.1f %8.1f %12s %9s" % (
+            load_test.name, result["syncs"], result["failed"], result["retried"], result["syncs_per_second"],
+            result["p50_ms"], result["p99_ms"], result["bytes_sent"], result["requests"]))
+    return results
+
+
+if __name__ == "__main__":
+    run()
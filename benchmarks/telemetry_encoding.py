@@ -0,0 +1,59 @@
+"""
+Payload size and encode time of the lap telemetry encodings
+
+Encodes a 90 second lap at 60Hz (5400 frames) with each telemetry
+encoding, checks that it decodes back to the lap's frames and compares
+the payload bytes and the encode time per lap. Also compares encoding the
+whole lap as JSON at the end of the lap with the incremental JSON encoder,
+which only has the last frames left to encode.
+
+Run with: python -m benchmarks.telemetry_encoding
+"""
+import json
+import time
+
+from benchmarks.telemetry_memory import generate_telemetry, fill_lap_telemetry, FRAME_COUNT
+from receiver.telemetry_encoding import encode_frame_store, decode_telemetry_string, TELEMETRY_ENCODINGS
+
+
+REPEAT_COUNT = 20
+
+
+def time_encoding(frame_store, encoding, repeat_count=REPEAT_COUNT):
+    """ Return the payload and the best encode time in ms """
+    best_ms = None
+    for _ in range(repeat_count):
+        start_time = time.perf_counter()
+        telemetry_string = encode_frame_store(frame_store, encoding)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        best_ms = elapsed_ms if best_ms is None else min(best_ms, elapsed_ms)
+    return telemetry_string, best_ms
+
+
+def run():
+    lap_telemetry = fill_lap_telemetry(generate_telemetry())
+    frame_dict = lap_telemetry.frame_dict
+    results = {}
+    print("%s frames" % FRAME_COUNT)
+    print("%-15s %12s %12s" % ("encoding", "bytes", "encode ms"))
+    for encoding in TELEMETRY_ENCODINGS:
+        telemetry_string, encode_ms = time_encoding(lap_telemetry.frames, encoding)
+        assert decode_telemetry_string(telemetry_string, encoding) == frame_dict
+        results[encoding] = (len(telemetry_string), encode_ms)
+        print("%-15s %12s %12.1f" % (encoding, len(telemetry_string), encode_ms))
+
+    # JSON at the end of the lap: everything vs. the frames that weren't encoded while driving
+    start_time = time.perf_counter()
+    full_string = json.dumps(lap_telemetry.frame_dict)
+    full_ms = (time.perf_counter() - start_time) * 1000
+    start_time = time.perf_counter()
+    incremental_string = lap_telemetry.get_telemetry_string()
+    incremental_ms = (time.perf_counter() - start_time) * 1000
+    assert incremental_string == full_string
+    print("lap end json.dumps %.1f ms, incremental %.1f ms" % (full_ms, incremental_ms))
+    results["lap_end_ms"] = (full_ms, incremental_ms)
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,83 @@
+"""
+Memory benchmark for lap telemetry storage
+
+Fills a 90 second lap at 60Hz (5400 frames) with realistic values and
+compares the memory of the old {frame id: [values]} dict with the
+columnar TelemetryFrameStore used by LapTelemetryBase. The lap telemetry
+also holds the JSON it encodes while the lap is driven.
+
+Run with: python -m benchmarks.telemetry_memory
+"""
+import json
+import random
+import tracemalloc
+
+from receiver.lap_telemetry_base import LapTelemetryBase, KEY_INDEX_MAP, KEY_ROUND_MAP
+
+
+FRAME_COUNT = 5400
+
+
+def generate_telemetry(frame_count=FRAME_COUNT, seed=22):
+    """ Lap and telemetry packet values, like the F1 22 processor passes them to the lap """
+    rng = random.Random(seed)
+    lap_distance = 0
+    for frame_number in range(1000, 1000 + frame_count):
+        lap_distance += rng.uniform(0.5, 1.5)
+        yield {
+            "frame_identifier": frame_number,
+            "lap_distance": lap_distance,
+            "lap_time": (frame_number - 1000) * 16 + rng.randint(0, 5),
+        }
+        yield {
+            "frame_identifier": frame_number,
+            "speed": rng.randint(80, 330),
+            "brake": rng.random(),
+            "throttle": rng.random(),
+            "gear": rng.randint(1, 8),
+            "steer": rng.uniform(-1, 1),
+            "drs": rng.randint(0, 1),
+        }
+
+
+def fill_frame_dict(telemetry):
+    """ The previous LapTelemetryBase storage """
+    frame_dict = {}
+    for telemetry_dict in telemetry:
+        frame = frame_dict.setdefault(telemetry_dict["frame_identifier"], [None] * len(KEY_INDEX_MAP))
+        for key, value in telemetry_dict.items():
+            if key in KEY_INDEX_MAP:
+                frame[KEY_INDEX_MAP[key]] = round(value, KEY_ROUND_MAP[key])
+    return frame_dict
+
+
+def fill_lap_telemetry(telemetry):
+    lap_telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+    for telemetry_dict in telemetry:
+        lap_telemetry.update(telemetry_dict)
+    return lap_telemetry
+
+
+def measure(fill):
+    telemetry = list(generate_telemetry())
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = fill(telemetry)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")), result
+
+
+def run():
+    frame_dict_bytes, frame_dict = measure(fill_frame_dict)
+    store_bytes, lap_telemetry = measure(fill_lap_telemetry)
+    # The F1Laps payload must not change
+    assert json.dumps(lap_telemetry.frame_dict) == json.dumps(frame_dict)
+    print("%s frames" % FRAME_COUNT)
+    print("frame dict   %8.0f KB" % (frame_dict_bytes / 1024))
+    print("frame store  %8.0f KB (%.1fx smaller)" % (store_bytes / 1024, frame_dict_bytes / store_bytes))
+    return frame_dict_bytes, store_bytes
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,57 @@
+"""
+Distance resampling of lap telemetry
+
+Fills the same 5000m lap at different UDP send rates and compares frame
+counts and JSON payload sizes with and without resampling to a 2m grid,
+plus the resampling time per lap.
+
+Run with: python -m benchmarks.telemetry_resampling
+"""
+import random
+import time
+
+from benchmarks.telemetry_memory import fill_lap_telemetry
+from receiver.telemetry_encoding import encode_frame_store
+from receiver.telemetry_resampling import DEFAULT_DISTANCE_STEP
+
+
+LAP_DISTANCE = 5000
+LAP_SECONDS = 90
+SEND_RATES = [20, 30, 60]
+
+
+def generate_telemetry(send_rate, seed=22):
+    """ Lap and telemetry packet values of a lap, at a given send rate (Hz) """
+    rng = random.Random(seed)
+    frame_count = LAP_SECONDS * send_rate
+    for index in range(frame_count):
+        lap_distance = LAP_DISTANCE * index / frame_count
+        yield {"frame_identifier": 1000 + index, "lap_distance": lap_distance, "lap_time": index * 1000 // send_rate}
+        yield {
+            "frame_identifier": 1000 + index,
+            "speed": rng.randint(80, 330),
+            "brake": rng.random(),
+            "throttle": rng.random(),
+            "gear": rng.randint(1, 8),
+            "steer": rng.uniform(-1, 1),
+            "drs": rng.randint(0, 1),
+        }
+
+
+def run():
+    results = {}
+    print("%-8s %8s %10s %10s %10s %12s" % ("rate", "frames", "bytes", "resampled", "bytes", "resample ms"))
+    for send_rate in SEND_RATES:
+        lap_telemetry = fill_lap_telemetry(generate_telemetry(send_rate))
+        start_time = time.perf_counter()
+        resampled_frames = lap_telemetry.get_resampled_frames(DEFAULT_DISTANCE_STEP)
+        resample_ms = (time.perf_counter() - start_time) * 1000
+        frame_bytes = len(lap_telemetry.get_telemetry_string())
+        resampled_bytes = len(encode_frame_store(resampled_frames))
+        results[send_rate] = (len(lap_telemetry.frames), frame_bytes, len(resampled_frames), resampled_bytes, resample_ms)
+        print("%-8s %8s %10s %10s %10s %12.1f" % (("%sHz" % send_rate,) + results[send_rate]))
+    return results
+
+
+if __name__ == "__main__":
+    run()
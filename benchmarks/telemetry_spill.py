@@ -0,0 +1,62 @@
+"""
+Memory of a long session's lap telemetry, with and without spilling
+
+Drives 50 laps of 5400 frames each, marking every lap as uploaded once it's
+completed, and compares the telemetry memory of the laps when all telemetry stays
+in memory vs. with a TelemetrySpillPolicy. Also times serializing all laps,
+like a session re-sync does.
+
+Run with: python -m benchmarks.telemetry_spill
+"""
+import time
+
+from benchmarks.telemetry_memory import generate_telemetry
+from receiver.f12022.lap import F12022Lap
+from receiver.telemetry_spill import TelemetrySpillPolicy
+
+
+LAP_COUNT = 50
+MEMORY_BUDGET_BYTES = 16 * 1024 * 1024
+
+
+def drive_session(spill_policy=None, lap_count=LAP_COUNT):
+    lap_telemetry_values = list(generate_telemetry())
+    lap_list = {}
+    for lap_number in range(1, lap_count + 1):
+        lap = F12022Lap(lap_number=lap_number, session_type=10, telemetry_enabled=True)
+        lap.init_telemetry()
+        for telemetry_values in lap_telemetry_values:
+            lap.telemetry.update(telemetry_values)
+        lap_list[lap_number] = lap
+        if lap_number > 1:
+            lap_list[lap_number - 1].has_been_uploaded = True
+        if spill_policy:
+            spill_policy.apply(lap_list)
+    return lap_list
+
+
+def measure(spill_policy=None):
+    lap_list = drive_session(spill_policy)
+    start_time = time.perf_counter()
+    for lap in lap_list.values():
+        lap.json_serialize()
+    serialize_ms = (time.perf_counter() - start_time) * 1000
+    # Includes the serialized laps' telemetry strings
+    memory_bytes = sum(lap.get_memory_size() for lap in lap_list.values())
+    return memory_bytes, serialize_ms
+
+
+def run():
+    in_memory_bytes, in_memory_ms = measure()
+    spill_policy = TelemetrySpillPolicy(MEMORY_BUDGET_BYTES)
+    spilled_bytes, spilled_ms = measure(spill_policy)
+    print("%s laps" % LAP_COUNT)
+    print("in memory  %8.1f MB, serialize all laps %6.0f ms" % (in_memory_bytes / 1024 / 1024, in_memory_ms))
+    print("spilled    %8.1f MB, serialize all laps %6.0f ms (%s laps on disk)" % (
+        spilled_bytes / 1024 / 1024, spilled_ms, spill_policy.spilled_lap_count))
+    spill_policy.close()
+    return (in_memory_bytes, in_memory_ms), (spilled_bytes, spilled_ms)
+
+
+if __name__ == "__main__":
+    run()
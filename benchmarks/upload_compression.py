@@ -0,0 +1,90 @@
+"""
+Upload size and latency of session updates, with and without gzip
+
+Syncs a 10 lap session after every lap (every update holds all laps so
+far, with their telemetry) to a local stand-in server that reads request
+bodies at a home uplink's speed, and compares bytes on the wire and total
+upload latency of uncompressed and gzip compressed request bodies.
+
+Run with: python -m benchmarks.upload_compression
+"""
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.session_resync import drive_race
+from receiver.http_client import F1LapsHTTPClient, GZIP_MIN_BYTES
+
+
+LAP_COUNT = 10
+# Upload speed of the simulated uplink
+UPLINK_MBITS = 10
+READ_CHUNK_BYTES = 16 * 1024
+
+
+class ThrottledUplinkHandler(BaseHTTPRequestHandler):
+    """ Reads the body at the uplink's speed, like a slow network would deliver it """
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        remaining_bytes = int(self.headers["Content-Length"])
+        body = b""
+        while remaining_bytes:
+            chunk = self.rfile.read(min(READ_CHUNK_BYTES, remaining_bytes))
+            remaining_bytes -= len(chunk)
+            body += chunk
+            time.sleep(len(chunk) * 8 / (UPLINK_MBITS * 1000 * 1000))
+        if self.headers.get("Content-Encoding") == "gzip":
+            gzip.decompress(body)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def collect_session_updates():
+    """ Return the lap_times of the session update after each lap """
+    updates = []
+    drive_race(lambda session: updates.append(list(session.get_f1laps_lap_times_list())), lap_count=LAP_COUNT)
+    return updates
+
+
+def upload(updates, url, gzip_min_bytes):
+    """ Send all session updates; returns the client stats and the total latency in ms """
+    client = F1LapsHTTPClient(gzip_min_bytes=gzip_min_bytes)
+    start_time = time.perf_counter()
+    for lap_times in updates:
+        client.request_json("PUT", url, {"lap_times": lap_times}, compress=True)
+    latency_ms = (time.perf_counter() - start_time) * 1000
+    client.close()
+    return client.get_stats(), latency_ms
+
+
+def run():
+    updates = collect_session_updates()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottledUplinkHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:%s/" % server.server_address[1]
+    results = {}
+    try:
+        print("%s session updates over a %s Mbit/s uplink" % (len(updates), UPLINK_MBITS))
+        print("%-6s %12s %12s" % ("", "wire bytes", "latency ms"))
+        for name, gzip_min_bytes in [("plain", None), ("gzip", GZIP_MIN_BYTES)]:
+            stats, latency_ms = upload(updates, url, gzip_min_bytes)
+            results[name] = (stats["body_bytes_sent"], latency_ms)
+            print("%-6s %12s %12.0f" % (name, stats["body_bytes_sent"], latency_ms))
+    finally:
+        server.shutdown()
+        server.server_close()
+    plain_bytes, plain_ms = results["plain"]
+    gzip_bytes, gzip_ms = results["gzip"]
+    print("gzip: %.1fx fewer bytes, %.1fx faster" % (plain_bytes / gzip_bytes, plain_ms / gzip_ms))
+    return results
+
+
+if __name__ == "__main__":
+    run()
@@ -2,7 +2,6 @@ from PyQt5.QtWidgets import QWidget, QLabel, QPushButton, QLineEdit, \
                             QVBoxLayout, QCheckBox
 from PyQt5.QtCore import Qt, QThread
 from PyQt5.QtSvg import QSvgWidget
-import requests
 import datetime
 
 from gui.base_classes import F1QLabel, QHSeperationLine, QVSpacer
@@ -11,6 +10,7 @@ from lib.logger import log
 from lib.file_handler import ConfigFile, get_path_temporary
 from receiver.receiver import RaceReceiver
 from receiver.helpers import get_local_ip
+from receiver.http_client import get_http_client
 import config
 
 F1LAPS_VERSION_ENDPOINT = "https://www.f1laps.com/api/f12020/telemetry/app/version/current/"
@@ -66,8 +66,9 @@ class TelemetrySession:
         self.session = None
         self.is_active = False
 
-    def start(self, api_key, enable_telemetry, use_udp_broadcast, port_value):
-        receiver_thread = RaceReceiver(api_key, enable_telemetry=enable_telemetry, use_udp_broadcast=use_udp_broadcast, host_port=port_value)
+    def start(self, api_key, enable_telemetry, use_udp_broadcast, port_value, capture_directory=None):
+        receiver_thread = RaceReceiver(api_key, enable_telemetry=enable_telemetry, use_udp_broadcast=use_udp_broadcast, host_port=port_value,
+                                       capture_directory=capture_directory)
         receiver_thread.start()
         self.session = receiver_thread
         self.is_active = True
@@ -92,6 +93,7 @@ class MainWindow(QWidget):
         self.broadcast_mode_enabled = self.user_config.get("UDP_BROADCAST_ENABLED") or False
         self.app_version = config.VERSION
         self.port_value = self.user_config.get("PORT_VALUE") or str(DEFAULT_PORT)
+        self.capture_directory = self.user_config.get("CAPTURE_DIRECTORY") or None
 
         # Draw the window UI
         self.init_ui()
@@ -217,7 +219,7 @@ class MainWindow(QWidget):
 
     def check_version(self):
         try:
-            response = requests.get(F1LAPS_VERSION_ENDPOINT)
+            response = get_http_client().get(F1LAPS_VERSION_ENDPOINT)
             version = response.json()['version']
             user_version_int = int(self.app_version.replace(".", ""))
             current_version_int = int(version.replace(".", ""))
@@ -290,7 +292,8 @@ class MainWindow(QWidget):
             # Actually start receiver thread
             self.session.start(self.api_key, enable_telemetry=telemetry_enabled, 
                                              use_udp_broadcast=self.broadcast_mode_enabled, 
-                                             port_value=self.get_port_value()
+                                             port_value=self.get_port_value(),
+                                             capture_directory=self.capture_directory
             )
         else:
             log.info("Not starting Telemetry session (api key %s, subscription %s)" % \
@@ -1,8 +1,9 @@
 from PyQt5.QtCore import QObject, pyqtSignal
 from lib.logger import log
-import requests
 import json
 
+from receiver.http_client import get_http_client
+
 F1LAPS_USER_SETTINGS_ENDPOINT = "https://www.f1laps.com/api/f12020/telemetry/app/user/settings/"
 
 
@@ -26,7 +27,7 @@ class APIUserPreferenceWorker(QObject):
         try:
             log.info("Validating API key...")
             headers = {'Authorization': 'Token %s' % self.api_key,}
-            response = requests.get(F1LAPS_USER_SETTINGS_ENDPOINT, headers=headers)
+            response = get_http_client().get(F1LAPS_USER_SETTINGS_ENDPOINT, headers=headers)
             if response.status_code == 401:
                 log.warning("API key %s is invalid" % self.api_key)
                 self.user_settings.emit(user_settings_dict)
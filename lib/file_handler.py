@@ -40,7 +40,8 @@ def get_path_temporary(file_name):
 
 class ConfigFile:
     """ Read / write config file """
-    supported_config_names = ["API_KEY", "UDP_BROADCAST_ENABLED", "PORT_VALUE"]
+    # CAPTURE_DIRECTORY has no UI, it's set in the file to record packets for support cases
+    supported_config_names = ["API_KEY", "UDP_BROADCAST_ENABLED", "PORT_VALUE", "CAPTURE_DIRECTORY"]
     config_file_name = "f1laps_configuration.txt"
 
     def __init__(self):
@@ -1,12 +1,22 @@
+import argparse
+
 from receiver.receiver import RaceReceiver
 from receiver.helpers import asciiart
+from receiver.capture import DEFAULT_MAX_FILE_BYTES
 
 import config
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Receive F1 game telemetry and sync it to F1Laps")
+    parser.add_argument("--capture", metavar="DIRECTORY", help="record all received packets to capture files in this directory")
+    parser.add_argument("--capture-max-mb", type=int, default=DEFAULT_MAX_FILE_BYTES // (1024 * 1024),
+                        help="size at which capture files get rotated (default: %(default)s)")
+    args = parser.parse_args()
+
     asciiart()
     # Initiative receiver
-    race_receiver = RaceReceiver(f1laps_api_key=config.F1LAPS_API_KEY, run_as_daemon=False)
+    race_receiver = RaceReceiver(f1laps_api_key=config.F1LAPS_API_KEY, run_as_daemon=False,
+                                 capture_directory=args.capture, capture_max_file_bytes=args.capture_max_mb * 1024 * 1024)
     # Listen to packages
     race_receiver.start()
@@ -2,18 +2,29 @@ import platform
 import requests
 import json
 import config
+from receiver.session_sync import FULL_SYNC_REQUIRED_STATUS_CODE, CAPABILITY_PARTIAL_LAP_TIMES
+from receiver.http_client import get_http_client
 import logging
 log = logging.getLogger(__name__)
 
 
+F1LAPS_API_BASE_URL = 'https://www.f1laps.com/api/'
+
+
 class F1LapsAPIBase:
     """ Communicate with F1Laps API """
 
-    def __init__(self, api_key, game_version):
+    def __init__(self, api_key, game_version, http_client=None, base_url=F1LAPS_API_BASE_URL):
         self.api_key  = api_key
-        self.base_url = 'https://www.f1laps.com/api/'
+        self.base_url = base_url
         self.version  = config.VERSION
         self.game_version = game_version
+        # Keep-alive connections are shared by all API instances
+        self.http_client = http_client or get_http_client()
+
+    def has_capability(self, capability):
+        """ True if F1Laps listed the capability in a response (see receiver.http_client.CAPABILITIES_HEADER) """
+        return self.http_client.has_capability(self.base_url, capability)
 
     def call_api(self, method, endpoint, params=None):
         headers = self._get_headers()
@@ -27,24 +38,33 @@ class F1LapsAPIBase:
 
     def call_api_get(self, path, headers):
         try:
-            return requests.get(path , headers=headers)
+            return self.http_client.get(path , headers=headers)
         except requests.ConnectionError as ex:
             log.info("ConnectionError calling %s: %s" % (path, ex))
             return None
+        except requests.Timeout as ex:
+            log.info("Timeout calling %s: %s" % (path, ex))
+            return None
 
     def call_api_post(self, path, headers, json):
         try:
-            return requests.post(path, headers=headers, json=json)
+            return self.http_client.request_json("POST", path, json, headers=headers)
         except requests.ConnectionError as ex:
             log.info("ConnectionError calling %s: %s" % (path, ex))
             return None
+        except requests.Timeout as ex:
+            log.info("Timeout calling %s: %s" % (path, ex))
+            return None
 
     def call_api_put(self, path, headers, json):
         try:
-            return requests.put(path , headers=headers, json=json)
+            return self.http_client.request_json("PUT", path, json, headers=headers)
         except requests.ConnectionError as ex:
             log.info("ConnectionError calling %s: %s" % (path, ex))
             return None
+        except requests.Timeout as ex:
+            log.info("Timeout calling %s: %s" % (path, ex))
+            return None
 
 
     def lap_create(self, track_id, team_id, conditions, game_mode, 
@@ -177,6 +197,21 @@ class F1LapsAPIBase:
         self._log_f1laps_response_status(response, descriptor="Session_update")
         return response.status_code == 200 if response else False
 
+    def update_session_laps_in_f1laps(self, **kwargs):
+        """
+        Update existing Session in F1Laps, with lap_times holding only new or changed laps
+        Only for servers with CAPABILITY_PARTIAL_LAP_TIMES
+        Returns:
+            success (bool)
+            full_sync_required (bool): F1Laps needs all laps to update the session
+        """
+        response = self.session_update(lap_times_partial=True, **kwargs)
+        if response is not None and response.status_code == FULL_SYNC_REQUIRED_STATUS_CODE:
+            log.info("Session_update with changed laps only was rejected, F1Laps requires all laps")
+            return False, True
+        self._log_f1laps_response_status(response, descriptor="Session_update")
+        return (response.status_code == 200 if response else False), False
+
     def retrieve_f1_laps_session_id(self, session_uid):
         """ Try to retrieve previous session id from F1Laps by listing all sessions """
         list_response = self.session_list(session_uid)
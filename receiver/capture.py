@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+import logging
+log = logging.getLogger(__name__)
+
+
+# Capture file layout:
+# - header: magic, format version, number of index entries, timestamp of the first packet
+#   (monotonic ns), wall clock time the file was started and the packet count
+# - index: CAPTURE_INDEX_SLOTS entries of (packet format, packet id, packet count)
+# - records: monotonic receive timestamp in ns, datagram length and the datagram itself
+CAPTURE_MAGIC = b"F1LCAP"
+CAPTURE_FORMAT_VERSION = 1
+CAPTURE_HEADER_STRUCT = struct.Struct("<6sBBQdI")
+CAPTURE_INDEX_ENTRY_STRUCT = struct.Struct("<HBI")
+CAPTURE_INDEX_SLOTS = 64
+CAPTURE_INDEX_OFFSET = CAPTURE_HEADER_STRUCT.size
+CAPTURE_RECORDS_OFFSET = CAPTURE_INDEX_OFFSET + CAPTURE_INDEX_SLOTS * CAPTURE_INDEX_ENTRY_STRUCT.size
+CAPTURE_RECORD_STRUCT = struct.Struct("<QH")
+# Packet format and packet ID of the packet header, the same in all supported games
+CAPTURE_PACKET_KEY_STRUCT = struct.Struct("<H3xB")
+
+CAPTURE_FILE_PREFIX = "f1laps_capture"
+CAPTURE_FILE_EXTENSION = ".f1cap"
+# Capture files get rotated once they're this big
+DEFAULT_MAX_FILE_BYTES = 256 * 1024 * 1024
+# Packets waiting to be written; more get dropped (~30 seconds of the busiest packet mix at 60Hz)
+DEFAULT_MAX_QUEUED_PACKETS = 16384
+# How often the writer thread writes queued packets (in seconds)
+CAPTURE_FLUSH_INTERVAL = 0.1
+# Size of the buffered file writer
+CAPTURE_WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+def get_packet_key(packet):
+    """ Return the (packet format, packet ID) of a datagram, or None if it's too short """
+    if len(packet) < CAPTURE_PACKET_KEY_STRUCT.size:
+        return None
+    return CAPTURE_PACKET_KEY_STRUCT.unpack_from(packet)
+
+
+class PacketCaptureFile:
+    """ A capture file that's being written """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb", buffering=CAPTURE_WRITE_BUFFER_BYTES)
+        self.started_at = time.time()
+        self.first_timestamp_ns = 0
+        self.packet_count = 0
+        self.packet_counts = {}
+        self.size = CAPTURE_RECORDS_OFFSET
+        self.write_header()
+
+    def write_header(self):
+        """ Write the header and index at the start of the file """
+        index_entries = sorted(self.packet_counts.items())[:CAPTURE_INDEX_SLOTS]
+        header = bytearray(CAPTURE_RECORDS_OFFSET)
+        CAPTURE_HEADER_STRUCT.pack_into(header, 0, CAPTURE_MAGIC, CAPTURE_FORMAT_VERSION, len(index_entries),
+                                        self.first_timestamp_ns, self.started_at, self.packet_count)
+        for slot, ((packet_format, packet_id), count) in enumerate(index_entries):
+            CAPTURE_INDEX_ENTRY_STRUCT.pack_into(header, CAPTURE_INDEX_OFFSET + slot * CAPTURE_INDEX_ENTRY_STRUCT.size,
+                                                 packet_format, packet_id, count)
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.seek(self.size)
+
+    def write_packet(self, timestamp_ns, packet):
+        if not self.packet_count:
+            self.first_timestamp_ns = timestamp_ns
+        self.file.write(CAPTURE_RECORD_STRUCT.pack(timestamp_ns, len(packet)))
+        self.file.write(packet)
+        self.size += CAPTURE_RECORD_STRUCT.size + len(packet)
+        self.packet_count += 1
+        packet_key = get_packet_key(packet)
+        if packet_key:
+            self.packet_counts[packet_key] = self.packet_counts.get(packet_key, 0) + 1
+
+    def close(self):
+        if len(self.packet_counts) > CAPTURE_INDEX_SLOTS:
+            log.info("Capture %s has more packet types than index slots, index is incomplete" % self.path)
+        self.write_header()
+        self.file.close()
+
+
+class PacketCaptureWriter(threading.Thread):
+    """
+    Records every received datagram to capture files in a directory
+
+    The receiving thread only copies the datagram into a queue, the
+    writer thread writes the queue through a buffered file writer, so
+    capturing never slows down the socket. When the writer falls behind
+    by more than max_queued_packets, new packets don't get captured.
+    Files get rotated once they reach max_file_bytes.
+    """
+
+    def __init__(self, directory, max_file_bytes=DEFAULT_MAX_FILE_BYTES, max_queued_packets=DEFAULT_MAX_QUEUED_PACKETS):
+        super(PacketCaptureWriter, self).__init__()
+        # Never keep the app alive because of the capture
+        self.daemon = True
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_queued_packets = max_queued_packets
+        self.kill_event = threading.Event()
+        # deque appends and pops are thread-safe, so recording doesn't take a lock
+        self.packets = deque()
+        self.capture_file = None
+        self.file_number = 0
+        self.file_paths = []
+
+        # Counters
+        self.captured_count = 0
+        self.dropped_count = 0
+
+    def record(self, packet, timestamp_ns=None):
+        """ Queue a datagram (copied) with its monotonic receive timestamp """
+        if len(self.packets) >= self.max_queued_packets:
+            self.dropped_count += 1
+            return
+        self.packets.append((timestamp_ns or time.monotonic_ns(), bytes(packet)))
+
+    def kill(self):
+        """ Stop once all queued packets have been written """
+        self.kill_event.set()
+
+    def run(self):
+        log.info("Packet capture started, writing to %s" % self.directory)
+        while not self.kill_event.wait(CAPTURE_FLUSH_INTERVAL):
+            self.write_queued_packets()
+        self.write_queued_packets()
+        self.close_file()
+        log.info("Packet capture stopped (%s)" % self.get_stats())
+
+    def write_queued_packets(self):
+        """ Write all queued packets; returns the number of written packets """
+        written_count = 0
+        while self.packets:
+            timestamp_ns, packet = self.packets.popleft()
+            if self.capture_file is None or self.capture_file.size >= self.max_file_bytes:
+                self.rotate_file()
+            self.capture_file.write_packet(timestamp_ns, packet)
+            written_count += 1
+        self.captured_count += written_count
+        if self.capture_file is not None:
+            self.capture_file.file.flush()
+        return written_count
+
+    def rotate_file(self):
+        """ Close the current capture file and start a new one """
+        self.close_file()
+        self.file_number += 1
+        path = os.path.join(self.directory, "%s_%s_%s%s" % (
+            CAPTURE_FILE_PREFIX, time.strftime("%Y%m%d-%H%M%S"), self.file_number, CAPTURE_FILE_EXTENSION))
+        self.capture_file = PacketCaptureFile(path)
+        self.file_paths.append(path)
+        log.debug("Capturing packets to %s" % path)
+
+    def close_file(self):
+        if self.capture_file is not None:
+            self.capture_file.close()
+            self.capture_file = None
+
+    def get_stats(self):
+        return {
+            "captured": self.captured_count,
+            "dropped": self.dropped_count,
+            "queued": len(self.packets),
+            "files": len(self.file_paths),
+        }
+
+
+class PacketCaptureReader:
+    """
+    Reads a capture file
+    The header's counts are only written when a file gets closed, the
+    records can be read from files of crashed captures too.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as capture_file:
+            header = capture_file.read(CAPTURE_RECORDS_OFFSET)
+        if len(header) < CAPTURE_RECORDS_OFFSET or header[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+            raise ValueError("%s is not a packet capture file" % path)
+        _, self.format_version, index_entry_count, self.first_timestamp_ns, self.started_at, self.packet_count = \
+            CAPTURE_HEADER_STRUCT.unpack_from(header)
+        if self.format_version != CAPTURE_FORMAT_VERSION:
+            raise ValueError("Unknown packet capture format version %s" % self.format_version)
+        self.packet_counts = {}
+        for slot in range(index_entry_count):
+            packet_format, packet_id, count = CAPTURE_INDEX_ENTRY_STRUCT.unpack_from(
+                header, CAPTURE_INDEX_OFFSET + slot * CAPTURE_INDEX_ENTRY_STRUCT.size)
+            self.packet_counts[(packet_format, packet_id)] = count
+
+    def __iter__(self):
+        """ Iterate over (monotonic receive timestamp in ns, datagram), reading through a memory map """
+        with open(self.path, "rb") as capture_file, \
+             mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            offset = CAPTURE_RECORDS_OFFSET
+            file_size = len(mapped_file)
+            while offset + CAPTURE_RECORD_STRUCT.size <= file_size:
+                timestamp_ns, length = CAPTURE_RECORD_STRUCT.unpack_from(mapped_file, offset)
+                offset += CAPTURE_RECORD_STRUCT.size
+                if offset + length > file_size:
+                    # Cut off by a crash
+                    return
+                yield timestamp_ns, mapped_file[offset:offset + length]
+                offset += length
@@ -1,5 +1,7 @@
+import ctypes
 import f1_2020_telemetry.packets
 from lib.logger import log
+from receiver.processor_stats import ProcessorStats, get_packet_id, DEFAULT_SAMPLE_INTERVAL, STAGE_DECODE, STAGE_HANDLER
 
 from receiver.f12020.packets import SessionPacket, ParticipantsPacket, CarSetupPacket, \
                                     FinalClassificationPacket, LapPacket, CarStatusPacket, \
@@ -9,32 +11,70 @@ class F12020Processor:
     session = None
     f1laps_api_key = None
     telemetry_enabled = True
+    processor_stats = None
 
-    def __init__(self, f1laps_api_key, enable_telemetry):
+    def __init__(self, f1laps_api_key, enable_telemetry, stats_sample_interval=DEFAULT_SAMPLE_INTERVAL):
         self.f1laps_api_key = f1laps_api_key
         self.telemetry_enabled = enable_telemetry
+        # Packet counts and stage latencies per packet type, every stats_sample_interval-th packet gets timed
+        self.processor_stats = ProcessorStats("F1 2020", {packet_key[2]: packet_class.__name__ for packet_key, packet_class in
+                                                          f1_2020_telemetry.packets.HeaderFieldsToPacketType.items()},
+                                              stats_sample_interval)
         log.info("Started F1 2020 game processor")
         super(F12020Processor, self).__init__()
 
-    def process(self, unpacked_packet):
+    def unpack_udp_packet(self, packet, packet_type=None):
+        """
+        Decode a UDP packet with the f1_2020_telemetry packet classes
+        If the receiver already looked up the packet type, skip the library's header parsing
+        """
+        if packet_type is None:
+            return f1_2020_telemetry.packets.unpack_udp_packet(packet)
+        if len(packet) != ctypes.sizeof(packet_type):
+            raise f1_2020_telemetry.packets.UnpackError(
+                "Bad telemetry packet: bad size for %s packet; expected %s bytes but received %s bytes." % (
+                    packet_type.__name__, ctypes.sizeof(packet_type), len(packet)))
+        return packet_type.from_buffer_copy(packet)
+
+    def process(self, unpacked_packet, header=None, packet_type=None):
+        """ 
+        Decode and process a UDP packet
+        header and packet_type come from the receiver's dispatch table, if given
+        """
+        packet_id = get_packet_id(unpacked_packet, header)
+        timer = self.processor_stats.start_packet(packet_id)
         try:
-            packet = f1_2020_telemetry.packets.unpack_udp_packet(unpacked_packet)
+            packet = self.unpack_udp_packet(unpacked_packet, packet_type)
         except Exception as ex:
             log.info("Couldn't unpack packet due to %s" % ex)
+            self.processor_stats.count_error(packet_id)
             packet = None
+        timer.stage_done(STAGE_DECODE)
+        if packet:
+            try:
+                self.process_unpacked_packet(packet)
+            except Exception:
+                self.processor_stats.count_error(packet_id)
+                raise
+            timer.stage_done(STAGE_HANDLER)
 
+    def process_unpacked_packet(self, packet):
+        """ 
+        Hand a decoded packet to its packet class
+        Serializing is part of the packet classes' process(), so it's timed with the handler
+        """
         # process session packets first
         # the session packet class returns a session object 
         # it doesn't change the session for existing sessions
         # it returns a new session object for new sessions
-        if packet and isinstance(packet, f1_2020_telemetry.packets.PacketSessionData_V1):
+        if isinstance(packet, f1_2020_telemetry.packets.PacketSessionData_V1):
             self.session = SessionPacket().process(packet, self.session)
             if self.session:
                 self.session.f1laps_api_key = self.f1laps_api_key
                 self.session.telemetry_enabled = self.telemetry_enabled
 
         # dont do anything else if there isnt a session set
-        if packet and self.session:
+        if self.session:
 
             # Now we listen to the actual race information
             # Each package gets processed in real-time as it comes in
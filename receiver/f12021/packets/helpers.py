@@ -1,4 +1,6 @@
 from lib.logger import log
+from receiver.helpers import unpack_struct
+from receiver.struct_decoder import get_struct_decoder
 from .base import PacketHeader
 from .session import PacketSessionData
 from .lap import PacketLapData
@@ -29,17 +31,25 @@ HeaderFieldsToPacketType = {
 }
 
 
-def unpack_udp_packet(packet):
+def unpack_udp_packet(packet, header=None, packet_type=None, use_struct_decoder=False):
     """
     Important function - processes each packet
     First reads the header, which maps to the right body packet
     Returns the mapped body packet
+    Packets in writable buffers are decoded without copying them (see unpack_struct)
+    The receiver passes the header and packet type from its dispatch table,
+    in which case the header doesn't get parsed again
+    With use_struct_decoder, the generated StructDecoder is used instead of ctypes
     """
-    header = PacketHeader.from_buffer_copy(packet)
-    packet_type = HeaderFieldsToPacketType.get(header.packetId)
-    log.debug("Found packet type %s ID %s" % (packet_type, header.packetId))
+    if packet_type is None:
+        if header is None:
+            header = unpack_struct(PacketHeader, packet)
+        packet_type = HeaderFieldsToPacketType.get(header.packetId)
+        log.debug("Found packet type %s ID %s" % (packet_type, header.packetId))
+    if packet_type and use_struct_decoder:
+        return get_struct_decoder(packet_type).decode(packet)
     if packet_type:
-        return packet_type.from_buffer_copy(packet)
+        return unpack_struct(packet_type, packet)
     else:
         log.debug("Received unknown packet_type %s" % packet_type)
         return None
@@ -1,30 +1,52 @@
 import logging
 log = logging.getLogger(__name__)
 
-from .packets.helpers import unpack_udp_packet
+from .packets.helpers import unpack_udp_packet, HeaderFieldsToPacketType
+from receiver.processor_stats import ProcessorStats, get_packet_id, DEFAULT_SAMPLE_INTERVAL, STAGE_DECODE, STAGE_HANDLER
 
 class F12021Processor:
     session = None
     f1laps_api_key = None
     telemetry_enabled = True
+    use_struct_decoder = False
+    processor_stats = None
 
-    def __init__(self, f1laps_api_key, enable_telemetry):
+    def __init__(self, f1laps_api_key, enable_telemetry, stats_sample_interval=DEFAULT_SAMPLE_INTERVAL, use_struct_decoder=False):
         self.f1laps_api_key = f1laps_api_key
         self.telemetry_enabled = enable_telemetry
+        # Decode packets with the generated struct decoders instead of ctypes
+        self.use_struct_decoder = use_struct_decoder
+        # Packet counts and stage latencies per packet type, every stats_sample_interval-th packet gets timed
+        self.processor_stats = ProcessorStats("F1 2021", {packet_id: packet_class.__name__ for packet_id, packet_class in
+                                                          HeaderFieldsToPacketType.items()}, stats_sample_interval)
         log.info("Started F1 2021 game processor")
         super(F12021Processor, self).__init__()
 
-    def process(self, unpacked_packet):
+    def process(self, unpacked_packet, header=None, packet_type=None):
+        """ 
+        Decode and process a UDP packet
+        header and packet_type come from the receiver's dispatch table, if given
+        """
+        packet_id = get_packet_id(unpacked_packet, header)
+        timer = self.processor_stats.start_packet(packet_id)
         try:
-            packet = unpack_udp_packet(unpacked_packet)
+            packet = unpack_udp_packet(unpacked_packet, header, packet_type, self.use_struct_decoder)
         except Exception as ex:
             log.info("Couldn't unpack packet due to %s" % ex)
+            self.processor_stats.count_error(packet_id)
             packet = None
+        timer.stage_done(STAGE_DECODE)
         if packet:
             # Process packet if we already have a session
             # or if packet sets a new session (i.e. the session packet)
+            # Serializing is part of the packet's process(), so it's timed with the handler
             if self.session or packet.creates_session_object:
-                self.session = packet.process(self.session)
+                try:
+                    self.session = packet.process(self.session)
+                except Exception:
+                    self.processor_stats.count_error(packet_id)
+                    raise
+                timer.stage_done(STAGE_HANDLER)
             if self.session:
                 # Make sure session has user info
                 self.session.f1laps_api_key = self.f1laps_api_key
@@ -40,12 +40,19 @@ class PacketCarDamageData(PacketBase):
         ("header", PacketHeader), 
         ("carDamageData", CarDamageData * 22),
     ]
+    # Used for decoding only the player's car, see PlayerCarDecoder
+    player_car_array_field = "carDamageData"
+    player_car_fields = ["tyresWear"]
 
     def serialize(self):
         try:
             car_damage = self.carDamageData[self.header.playerCarIndex]
         except:
             return None
+        return self.serialize_player_car_data(self.header, car_damage)
+
+    @classmethod
+    def serialize_player_car_data(cls, header, car_damage):
         return {
             "packet_type": "car_damage",
             "tyre_wear_front_left": car_damage.tyresWear[2],
@@ -54,14 +54,22 @@ class PacketCarStatusData(PacketBase):
         ("header", PacketHeader),
         ("carStatusData", CarStatusData * 22),
     ]
+    # Used for decoding only the player's car, see PlayerCarDecoder
+    player_car_array_field = "carStatusData"
+    player_car_fields = ["visualTyreCompound", "ersStoreEnergy", "fuelInTank"]
 
     def serialize(self):
         try:
             car_status = self.carStatusData[self.header.playerCarIndex]
         except:
             return None
+        return self.serialize_player_car_data(self.header, car_status)
+
+    @classmethod
+    def serialize_player_car_data(cls, header, car_status):
         return {
             "packet_type": "car_status",
+            "frame_identifier": header.frameIdentifier,
             "tyre_compound_visual": car_status.visualTyreCompound,
             "ers_store_energy": car_status.ersStoreEnergy,
             "fuel_remaining": car_status.fuelInTank,
@@ -1,6 +1,10 @@
 import logging
 log = logging.getLogger(__name__)
 
+from receiver.helpers import unpack_struct
+from receiver.struct_decoder import get_struct_decoder
+from receiver.game_version import unpack_packet_header
+from receiver.player_car_decoder import PlayerCarDecoder, PlayerCarPacket
 from receiver.f12022.packets.base import PacketHeader
 from receiver.f12022.packets.session import PacketSessionData
 from receiver.f12022.packets.lap import PacketLapData
@@ -14,11 +18,14 @@ from receiver.f12022.packets.final_classification import PacketFinalClassificati
 from receiver.f12022.packets.motion import PacketMotionData
 
 
+PACKET_ID_MOTION = 0
+
 HeaderFieldsToPacketType = {
     # The Motion packet sometimes returns:
     # 'Buffer size too small (36 instead of at least 1464 bytes)'
-    # We don't need the packet in prod, only for maps, so we're skipping it by default.
-    # 0: PacketMotionData,
+    # It's only needed for motion telemetry channels (and maps), so the processor
+    # skips it before decoding unless a motion channel is enabled
+    PACKET_ID_MOTION: PacketMotionData,
     1: PacketSessionData,
     2: PacketLapData,
     3: PacketEventData,
@@ -30,18 +37,45 @@ HeaderFieldsToPacketType = {
     10: PacketCarDamageData
 }
 
+# Packets that only serialize the player's car can be decoded via PlayerCarDecoder
+PacketTypeToPlayerCarDecoder = {
+    packet_type: PlayerCarDecoder(packet_type)
+    for packet_type in HeaderFieldsToPacketType.values()
+    if getattr(packet_type, "player_car_array_field", None)
+}
+
 
-def unpack_udp_packet(packet):
+def unpack_udp_packet(packet, header=None, packet_type=None, player_car_only=False, use_struct_decoder=False):
     """
     Important function - processes each packet
     First reads the header, which maps to the right body packet
     Returns the mapped body packet
+    Packets in writable buffers are decoded without copying them (see unpack_struct)
+    The receiver passes the header and packet type from its dispatch table,
+    in which case the header doesn't get parsed again
+    With player_car_only, per-car array packets only decode the player's car
+    (see PlayerCarDecoder); otherwise the full packet gets decoded
+    With use_struct_decoder, the generated StructDecoder is used instead of ctypes
     """
-    header = PacketHeader.from_buffer_copy(packet)
-    packet_type = HeaderFieldsToPacketType.get(header.packetId)
-    log.debug("Found packet type %s ID %s" % (packet_type, header.packetId))
+    if packet_type is None:
+        if header is None:
+            header = unpack_struct(PacketHeader, packet)
+        packet_type = HeaderFieldsToPacketType.get(header.packetId)
+        log.debug("Found packet type %s ID %s" % (packet_type, header.packetId))
+    if packet_type and player_car_only and packet_type in PacketTypeToPlayerCarDecoder:
+        return unpack_player_car_packet(packet, header, packet_type)
+    if packet_type and use_struct_decoder:
+        return get_struct_decoder(packet_type).decode(packet)
     if packet_type:
-        return packet_type.from_buffer_copy(packet)
+        return unpack_struct(packet_type, packet)
     else:
         log.debug("Received unknown packet_type %s" % packet_type)
         return None
+
+
+def unpack_player_car_packet(packet, header, packet_type):
+    """ Decode only the player's car of a per-car array packet """
+    if header is None:
+        header = unpack_packet_header(packet)
+    car_data = PacketTypeToPlayerCarDecoder[packet_type].decode(packet, header.playerCarIndex)
+    return PlayerCarPacket(packet_type, header, car_data)
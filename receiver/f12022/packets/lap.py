@@ -53,12 +53,20 @@ class PacketLapData(PacketBase):
         ("timeTrialPBCarIdx", ctypes.c_uint8), # Index of Personal Best car in time trial (255 if invalid)
         ("timeTrialRivalCarIdx", ctypes.c_uint8), # Index of Rival car in time trial (255 if invalid)
     ]
+    # Used for decoding only the player's car, see PlayerCarDecoder
+    player_car_array_field = "lapData"
+    player_car_fields = ["currentLapNum", "carPosition", "pitStatus", "currentLapInvalid", "currentLapTimeInMS",
+                         "lastLapTimeInMS", "sector1TimeInMS", "sector2TimeInMS", "lapDistance"]
 
     def serialize(self):
         try:
             lap_data = self.lapData[self.header.playerCarIndex]
         except:
             return None
+        return self.serialize_player_car_data(self.header, lap_data)
+
+    @classmethod
+    def serialize_player_car_data(cls, header, lap_data):
         return {
             "packet_type": "lap",
             "lap_number": lap_data.currentLapNum,
@@ -69,12 +77,13 @@ class PacketLapData(PacketBase):
             "last_laptime_ms": lap_data.lastLapTimeInMS,
             "sector_1_ms": lap_data.sector1TimeInMS,
             "sector_2_ms": lap_data.sector2TimeInMS,
-            "sector_3_ms": self.get_sector_3_ms(lap_data),
+            "sector_3_ms": cls.get_sector_3_ms(lap_data),
             "lap_distance": lap_data.lapDistance,
-            "frame_identifier": self.header.frameIdentifier
+            "frame_identifier": header.frameIdentifier
         }
     
-    def get_sector_3_ms(self, lap_data):
+    @staticmethod
+    def get_sector_3_ms(lap_data):
         if not (lap_data.sector1TimeInMS and lap_data.sector2TimeInMS):
             return None
         sector_3_time = lap_data.currentLapTimeInMS - lap_data.sector1TimeInMS - lap_data.sector2TimeInMS
@@ -61,6 +61,10 @@ class PacketMotionData(PacketBase):
             return None
         return {
             "packet_type": "motion",
+            "frame_identifier": self.header.frameIdentifier,
             "xpos": car_motion.worldPositionX,
-            "zpos": car_motion.worldPositionZ
+            "zpos": car_motion.worldPositionZ,
+            "g_force_lateral": car_motion.gForceLateral,
+            "g_force_longitudinal": car_motion.gForceLongitudinal,
+            "g_force_vertical": car_motion.gForceVertical,
         }
\ No newline at end of file
@@ -40,21 +40,34 @@ class PacketCarTelemetryData(PacketBase):
         ("mfdPanelIndexSecondaryPlayer", ctypes.c_uint8),
         ("suggestedGear", ctypes.c_int8),
     ]
+    # Used for decoding only the player's car, see PlayerCarDecoder
+    player_car_array_field = "carTelemetryData"
+    player_car_fields = ["speed", "brake", "throttle", "gear", "steer", "drs", 
+                         "engineRPM", "brakesTemperature", "tyresSurfaceTemperature", "tyresInnerTemperature"]
 
     def serialize(self):
         try:
             telemetry_data = self.carTelemetryData[self.header.playerCarIndex]
         except:
             return None
+        return self.serialize_player_car_data(self.header, telemetry_data)
+
+    @classmethod
+    def serialize_player_car_data(cls, header, telemetry_data):
         return {
             "packet_type": "telemetry",
-            "frame_identifier": self.header.frameIdentifier,
+            "frame_identifier": header.frameIdentifier,
             "speed": telemetry_data.speed,
             "brake": telemetry_data.brake,
             "throttle": telemetry_data.throttle,
             "gear": telemetry_data.gear,
             "steer": telemetry_data.steer,
             "drs": telemetry_data.drs,
+            "engine_rpm": telemetry_data.engineRPM,
+            "brake_rear_left_temp": telemetry_data.brakesTemperature[0],
+            "brake_rear_right_temp": telemetry_data.brakesTemperature[1],
+            "brake_front_left_temp": telemetry_data.brakesTemperature[2],
+            "brake_front_right_temp": telemetry_data.brakesTemperature[3],
             "tyre_rear_left_temp_max_surface": telemetry_data.tyresSurfaceTemperature[0],
             "tyre_rear_right_temp_max_surface": telemetry_data.tyresSurfaceTemperature[1],
             "tyre_front_left_temp_max_surface": telemetry_data.tyresSurfaceTemperature[2],
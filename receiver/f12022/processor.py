@@ -1,29 +1,105 @@
 import logging
 log = logging.getLogger(__name__)
 
-from receiver.f12022.packets.helpers import unpack_udp_packet
+from receiver.game_version import unpack_packet_header
+from receiver.f12022.packets.helpers import unpack_udp_packet, HeaderFieldsToPacketType, PACKET_ID_MOTION
 from receiver.f12022.session import F12022Session
 from receiver.f12022.penalty import F12022Penalty
 from receiver.f12022.types import SESSION_TYPE_OSQ
+from receiver.telemetry_encoding import TELEMETRY_ENCODING_JSON
+from receiver.telemetry_channels import SOURCE_LAP, SOURCE_TELEMETRY, SOURCE_CAR_STATUS, SOURCE_MOTION, \
+                                        DEFAULT_TELEMETRY_SCHEMA
+from receiver.telemetry_spill import TelemetrySpillPolicy, DEFAULT_MEMORY_BUDGET_BYTES
+from receiver.session_sync import SessionSyncState
+from receiver.processor_stats import ProcessorStats, get_packet_id, DEFAULT_SAMPLE_INTERVAL, \
+                                     STAGE_DECODE, STAGE_SERIALIZE, STAGE_HANDLER
+
+
+# Reasons for skipping packets before decoding their body
+SKIP_REASON_NO_SESSION = "no_session"
+SKIP_REASON_SPECTATING = "spectating"
+SKIP_REASON_UNUSED = "unused"
 
 
 class F12022Processor:
     session = None
     f1laps_api_key = None
     telemetry_enabled = True
+    uploader = None
+    player_car_only = True
+    use_struct_decoder = False
+    telemetry_encoding = TELEMETRY_ENCODING_JSON
+    telemetry_distance_step = None
+    telemetry_schema = None
+    telemetry_memory_budget_bytes = DEFAULT_MEMORY_BUDGET_BYTES
+    delta_session_sync = False
+    outbox = None
+    processor_stats = None
 
-    def __init__(self, f1laps_api_key, enable_telemetry):
+    def __init__(self, f1laps_api_key, enable_telemetry, uploader=None, player_car_only=True,
+                 telemetry_encoding=TELEMETRY_ENCODING_JSON, telemetry_distance_step=None, telemetry_schema=None,
+                 telemetry_memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, delta_session_sync=False, outbox=None,
+                 stats_sample_interval=DEFAULT_SAMPLE_INTERVAL, use_struct_decoder=False):
         self.f1laps_api_key = f1laps_api_key
         self.telemetry_enabled = enable_telemetry
+        self.uploader = uploader
+        # Only decode the player's car of per-car array packets
+        # Set to False for features that need all cars
+        self.player_car_only = player_car_only
+        # Decode packets with the generated struct decoders instead of ctypes
+        self.use_struct_decoder = use_struct_decoder
+        # Encoding of the lap telemetry payloads uploaded to F1Laps
+        self.telemetry_encoding = telemetry_encoding
+        # Resample lap telemetry to a fixed distance grid, in meters (None = off)
+        self.telemetry_distance_step = telemetry_distance_step
+        # Telemetry channels stored per frame, a TelemetryChannelSchema (None = default channels)
+        self.telemetry_schema = telemetry_schema
+        # Telemetry memory of a session's laps before completed laps get spilled to disk (None = never spill)
+        self.telemetry_memory_budget_bytes = telemetry_memory_budget_bytes
+        # Session updates only send laps F1Laps doesn't have yet (requires F1Laps support for partial lap_times)
+        self.delta_session_sync = delta_session_sync
+        # On-disk outbox that keeps uploads until F1Laps accepted them (None = failed uploads are lost)
+        self.outbox = outbox
+        # Set by session packets while the user is spectating, so no session gets created
+        self.is_spectating = False
+        self.skipped_packet_counts = {SKIP_REASON_NO_SESSION: 0, SKIP_REASON_SPECTATING: 0, SKIP_REASON_UNUSED: 0}
+        # Packets that nothing uses, skipped before decoding
+        # Motion packets only get decoded for motion telemetry channels
+        self.unused_packet_ids = set()
+        if not (self.telemetry_enabled and (telemetry_schema or DEFAULT_TELEMETRY_SCHEMA).has_source(SOURCE_MOTION)):
+            self.unused_packet_ids.add(PACKET_ID_MOTION)
+        # Packet counts and stage latencies per packet type, every stats_sample_interval-th packet gets timed
+        self.processor_stats = ProcessorStats("F1 2022", {packet_id: packet_class.__name__ for packet_id, packet_class in
+                                                          HeaderFieldsToPacketType.items()}, stats_sample_interval)
         log.info("Started F1 2022 game processor")
         super(F12022Processor, self).__init__()
 
-    def process(self, unpacked_packet):
+    def process(self, unpacked_packet, header=None, packet_type=None):
+        """ 
+        Decode and process a UDP packet
+        header and packet_type come from the receiver's dispatch table, if given
+        """
+        packet_id = get_packet_id(unpacked_packet, header)
+        timer = self.processor_stats.start_packet(packet_id)
         try:
-            packet = unpack_udp_packet(unpacked_packet)
+            # Without a session, only session packets matter - skip everything else before decoding it
+            if not self.session:
+                if header is None:
+                    header = unpack_packet_header(unpacked_packet)
+                if packet_type is None:
+                    packet_type = HeaderFieldsToPacketType.get(header.packetId)
+                if not (packet_type and packet_type.creates_session_object):
+                    self.skip_packet(packet_id, SKIP_REASON_SPECTATING if self.is_spectating else SKIP_REASON_NO_SESSION)
+                    return
+            elif packet_id in self.unused_packet_ids:
+                self.skip_packet(packet_id, SKIP_REASON_UNUSED)
+                return
+            packet = unpack_udp_packet(unpacked_packet, header, packet_type, self.player_car_only, self.use_struct_decoder)
         except Exception as ex:
             log.info("Couldn't unpack packet due to %s" % ex)
+            self.processor_stats.count_error(packet_id)
             packet = None
+        timer.stage_done(STAGE_DECODE)
 
         if packet:
             # If we don't have a session yet, we only process the 
@@ -32,14 +108,37 @@ class F12022Processor:
                 if packet.creates_session_object:
                     session_data = packet.serialize()
                     # Create a new session if the user is not spectating
-                    if not session_data['is_spectating']:
+                    self.set_is_spectating(bool(session_data['is_spectating']))
+                    if not self.is_spectating:
                         self.session = self.create_session(session_data)
             # If we already have a session, process packet data
             if self.session:
                 packet_data = packet.serialize()
+                timer.stage_done(STAGE_SERIALIZE)
                 if packet_data:
-                    self.process_serialized_packet(packet_data)
+                    try:
+                        # The uploader builds payloads of the session's laps on its own thread
+                        with self.session.lock:
+                            self.process_serialized_packet(packet_data)
+                    except Exception:
+                        self.processor_stats.count_error(packet_id)
+                        raise
+                    timer.stage_done(STAGE_HANDLER)
             
+    def skip_packet(self, packet_id, reason):
+        """ Count a packet that was skipped without decoding its body """
+        self.skipped_packet_counts[reason] += 1
+        self.processor_stats.count_skipped(packet_id)
+
+    def set_is_spectating(self, is_spectating):
+        if is_spectating != self.is_spectating:
+            log.info("User %s spectating" % ("started" if is_spectating else "stopped"))
+        self.is_spectating = is_spectating
+
+    def get_skipped_packet_counts(self):
+        """ Number of packets skipped before body decode, per reason """
+        return dict(self.skipped_packet_counts)
+
     def process_serialized_packet(self, packet_data):
         """ Given a serialized packet, process it """
         if not packet_data.get("packet_type"):
@@ -75,6 +174,7 @@ class F12022Processor:
             # Update session if UDP changed
             log.info("Session UDP has changed from %s to %s. Creating new session." \
                 % (self.session.session_udp_uid, packet_data["session_uid"]))
+            self.close_session()
             self.session = self.create_session(packet_data)
         else:
             # Update session weather 
@@ -100,9 +200,38 @@ class F12022Processor:
                              packet_data["ai_difficulty"],
                              packet_data["weather_id"],
                              packet_data["game_mode"],
-                             packet_data["season_link_identifier"]
+                             packet_data["season_link_identifier"],
+                             uploader=self.uploader,
+                             telemetry_encoding=self.telemetry_encoding,
+                             telemetry_distance_step=self.telemetry_distance_step,
+                             telemetry_schema=self.telemetry_schema,
+                             telemetry_spill_policy=self.create_telemetry_spill_policy(),
+                             session_sync_state=SessionSyncState() if self.delta_session_sync else None,
+                             outbox=self.outbox
                             )
     
+    def create_telemetry_spill_policy(self):
+        """ Each session gets its own spill file, closed by close_session() """
+        if self.telemetry_memory_budget_bytes is None:
+            return None
+        return TelemetrySpillPolicy(self.telemetry_memory_budget_bytes)
+
+    def close_session(self):
+        """ 
+        Release the spill file of the current session, before it gets replaced
+        Queued uploads may still read spilled telemetry while they build their payload,
+        so with an uploader, the file gets closed once they're prepared
+        """
+        if self.session and self.session.telemetry_spill_policy:
+            if self.uploader:
+                self.uploader.after_prepared(self.session.telemetry_spill_policy.close)
+            else:
+                self.session.telemetry_spill_policy.close()
+
+    def kill(self):
+        """ Release the session's resources when the receiver stops or the game changes """
+        self.close_session()
+
     def process_lap_packet(self, packet_data):
         lap_number = packet_data.get("lap_number")
         if not lap_number:
@@ -125,7 +254,8 @@ class F12022Processor:
                 "lap_distance": packet_data.get("lap_distance"),
                 "frame_identifier": packet_data.get("frame_identifier"),
                 "lap_time": packet_data.get("current_laptime_ms"),
-            }
+            },
+            telemetry_source = SOURCE_LAP
         )
     
     def process_telemetry_packet(self, packet_data):
@@ -134,7 +264,8 @@ class F12022Processor:
             return
         lap.update(
             lap_values = {},
-            telemetry_values = packet_data
+            telemetry_values = packet_data,
+            telemetry_source = SOURCE_TELEMETRY
         )
     
     def process_participant_data(self, packet_data):
@@ -244,9 +375,10 @@ class F12022Processor:
         """ Update tyres used and ers store energy for the current lap """
         current_lap = self.session.get_current_lap()
         if current_lap:
-            current_lap.tyre_compound_visual = packet_data.get("tyre_compound_visual")
+            current_lap.set_tyre_compound_visual(packet_data.get("tyre_compound_visual"))
             current_lap.ers_store_energy_temp_store = packet_data.get("ers_store_energy")
             current_lap.fuel_remaining_temp_store = packet_data.get("fuel_remaining")
+            current_lap.update_telemetry_channels(SOURCE_CAR_STATUS, packet_data)
         
     def process_car_damage_packet(self, packet_data):
         current_lap = self.session.get_current_lap()
@@ -259,7 +391,11 @@ class F12022Processor:
             ]
     
     def process_motion_packet(self, packet_data):
-        """ Logs motion data for the creation of the minimap svg """
+        """ Add motion telemetry channels and log motion data for the creation of the minimap svg """
+        current_lap = self.session.get_current_lap()
+        if current_lap:
+            current_lap.update_telemetry_channels(SOURCE_MOTION, packet_data)
+
         # Settings
         MOTION_LOG_ENABLED = False
         if not MOTION_LOG_ENABLED:
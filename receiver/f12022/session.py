@@ -1,3 +1,4 @@
+import threading
 import logging
 log = logging.getLogger(__name__)
 
@@ -5,6 +6,10 @@ from receiver.session_base import SessionBase, ParticipantBase
 from receiver.f12022.lap import F12022Lap
 from receiver.f12022.types import SessionType, Track, map_game_mode_to_f1laps
 from receiver.f12022.api import F1LapsAPI2022
+from receiver.uploader import UploadJob
+from receiver.telemetry_encoding import TELEMETRY_ENCODING_JSON
+from receiver.outbox import OUTBOX_KIND_LAP, OUTBOX_KIND_SESSION
+from receiver.session_sync import CAPABILITY_PARTIAL_LAP_TIMES
 
 
 class F12022Session(SessionBase):
@@ -23,10 +28,33 @@ class F12022Session(SessionBase):
                  game_mode,
                  season_identifier=None,
                  team_id=None,
+                 uploader=None,
+                 telemetry_encoding=TELEMETRY_ENCODING_JSON,
+                 telemetry_distance_step=None,
+                 telemetry_schema=None,
+                 telemetry_spill_policy=None,
+                 session_sync_state=None,
+                 outbox=None,
                 ):
         # Meta
         self.f1laps_api_key = f1laps_api_key
         self.telemetry_enabled = telemetry_enabled
+        # Background F1Laps uploader; without it, syncs block until the API responded
+        self.uploader = uploader
+        # Encoding of the lap telemetry payloads (see receiver.telemetry_encoding)
+        self.telemetry_encoding = telemetry_encoding
+        # Resample lap telemetry to a frame every x meters (None = one frame per game frame)
+        self.telemetry_distance_step = telemetry_distance_step
+        # Telemetry channels stored per frame (None = default channels)
+        self.telemetry_schema = telemetry_schema
+        # Moves telemetry of completed laps to disk (TelemetrySpillPolicy; None = keep all in memory)
+        self.telemetry_spill_policy = telemetry_spill_policy
+        # Acknowledged laps, so session updates only send new or changed laps (SessionSyncState; None = send all laps)
+        self.session_sync_state = session_sync_state
+        # Payloads are stored here before they're uploaded, and retried if uploads fail (F1LapsOutbox)
+        self.outbox = outbox
+        # Held by the processor while it changes the session, and by the uploader while it builds payloads
+        self.lock = threading.RLock()
         # Game version also defines API base URL
         self.game_version = "f12022"
         
@@ -80,10 +108,7 @@ class F12022Session(SessionBase):
         # Update values in current lap
         current_lap = self.get_current_lap()
         if current_lap:
-            current_lap.track_temperature = track_temperature
-            current_lap.air_temperature = air_temperature
-            current_lap.rain_percentage_forecast = rain_percentage_forecast
-            current_lap.weather_id = weather_id
+            current_lap.update_weather(weather_id, track_temperature, air_temperature, rain_percentage_forecast)
 
     
     def map_game_mode(self, game_mode):
@@ -133,7 +158,8 @@ class F12022Session(SessionBase):
     
     def add_lap(self, lap_number):
         """ Start a new lap by creating the Lap object and adding it to the lap_list """
-        new_lap = F12022Lap(lap_number=lap_number, session_type=self.session_type, telemetry_enabled=self.telemetry_enabled)
+        new_lap = F12022Lap(lap_number=lap_number, session_type=self.session_type, telemetry_enabled=self.telemetry_enabled, 
+                            telemetry_schema=self.telemetry_schema)
         self.lap_list[lap_number] = new_lap
         return new_lap
     
@@ -147,7 +173,11 @@ class F12022Session(SessionBase):
         # Update sector 3 time
         self.recompute_sector_3_lap_time(lap_number, last_lap_time)
         # Send to F1Laps
-        return self.sync_to_f1laps(lap_number)
+        success = self.sync_to_f1laps(lap_number)
+        # Release telemetry memory of laps that don't need it anymore
+        if self.telemetry_spill_policy:
+            self.telemetry_spill_policy.apply(self.lap_list)
+        return success
     
     def recompute_sector_3_lap_time(self, lap_number, final_lap_time):
         """ 
@@ -201,6 +231,8 @@ class F12022Session(SessionBase):
         api = F1LapsAPI2022(self.f1laps_api_key, self.game_version)
         if self.is_multi_lap_session():
             # Sync entire session
+            if self.uploader:
+                return self.enqueue_session_sync(api)
             success, f1l_session_id = self.sync_session_to_f1laps(api)
             self.f1_laps_session_id = f1l_session_id
         else:
@@ -219,8 +251,39 @@ class F12022Session(SessionBase):
         # Technically it depends on the API call, and we should mark it on success only
         # Unclear what the side effects are though 
         lap.has_been_synced_to_f1l = True
-        # Send to API
-        success = api.lap_create(
+        if self.uploader:
+            # The uploader builds and stores the payload
+            self.uploader.enqueue(UploadJob(
+                description = "%s of %s" % (lap, self),
+                prepare = lambda: self.prepare_lap_upload(lap),
+                upload = lambda prepared_upload: self.upload_lap_to_f1laps(lap, api, *prepared_upload)
+            ))
+            return True
+        return self.upload_lap_to_f1laps(lap, api, *self.prepare_lap_upload(lap))
+
+    def prepare_lap_upload(self, lap):
+        """ Build the lap payload and store it in the outbox; returns the params and the OutboxEntry """
+        with self.lock:
+            lap_params = self.get_f1laps_lap_params(lap)
+        return lap_params, self.add_to_outbox(OUTBOX_KIND_LAP, lap_params)
+
+    def upload_lap_to_f1laps(self, lap, api, lap_params, outbox_entry):
+        """ Send the lap payload to the API """
+        success = False
+        try:
+            success = api.lap_create(**lap_params)
+        finally:
+            self.finish_outbox_entry(outbox_entry, success)
+        if success:
+            lap.has_been_uploaded = True
+            log.info("%s successfully synced to F1Laps" % lap)
+        else:
+            log.info("%s failed sync to F1Laps" % lap)
+        return success
+
+    def get_f1laps_lap_params(self, lap):
+        """ Return the lap_create API params of an individual lap """
+        lap_params = dict(
             track_id = self.track_id,
             team_id = self.team_id,
             conditions = self.map_weather_ids_to_f1laps_token(),
@@ -232,7 +295,7 @@ class F12022Session(SessionBase):
             sector_3_time = lap.sector_3_ms,
             setup_data = self.setup,
             is_valid = lap.is_valid,
-            telemetry_data_string = lap.get_telemetry_string(),
+            telemetry_data_string = lap.get_telemetry_string(self.telemetry_encoding, self.telemetry_distance_step),
             air_temperature = lap.air_temperature,
             track_temperature = lap.track_temperature,
             rain_percentage_forecast = lap.rain_percentage_forecast,
@@ -272,11 +335,11 @@ class F12022Session(SessionBase):
             tyre_rear_left_temp_max_inner = lap.tyre_rear_left_temp_max_inner,
             tyre_rear_right_temp_max_inner = lap.tyre_rear_right_temp_max_inner,
         )
-        if success:
-            log.info("%s successfully synced to F1Laps" % lap)
-        else:
-            log.info("%s failed sync to F1Laps" % lap)
-        return success
+        if self.telemetry_encoding != TELEMETRY_ENCODING_JSON:
+            lap_params["telemetry_data_encoding"] = self.telemetry_encoding
+        if self.telemetry_distance_step:
+            lap_params["telemetry_distance_step"] = self.telemetry_distance_step
+        return lap_params
     
     def send_session_to_f1laps(self):
         """ Legacy method called by PenaltyBase """
@@ -284,11 +347,104 @@ class F12022Session(SessionBase):
         success, f1l_session_id = self.sync_session_to_f1laps(api)
         self.f1_laps_session_id = f1l_session_id
         return success
+
+    def enqueue_session_sync(self, api):
+        """ 
+        Hand the session sync to the background uploader, which builds and stores the payload
+        The F1Laps session ID is only read at upload time, so that an update queued
+        while the session create call is still running uses the created session
+        """
+        def upload(prepared_sync):
+            success, f1l_session_id = self.sync_session_to_f1laps(api, *prepared_sync)
+            self.f1_laps_session_id = f1l_session_id
+            return success
+        self.uploader.enqueue(UploadJob(
+            description = str(self),
+            prepare = self.prepare_session_sync,
+            upload = upload,
+            coalesce_key = ("session", self.game_version, self.session_udp_uid)
+        ))
+        return True
+
+    def prepare_session_sync(self):
+        """ Build the session payload and store it in the outbox; returns the params and the OutboxEntry """
+        with self.lock:
+            session_params = self.get_f1laps_session_params()
+        return session_params, self.add_session_to_outbox(session_params)
     
-    def sync_session_to_f1laps(self, api):
+    def sync_session_to_f1laps(self, api, session_params=None, outbox_entry=None):
         """ Send full sessiom to F1Laps """
+        if session_params is None:
+            session_params, outbox_entry = self.prepare_session_sync()
+        success, f1l_session_id = False, self.f1_laps_session_id
+        try:
+            if self.session_sync_state and self.f1_laps_session_id and api.has_capability(CAPABILITY_PARTIAL_LAP_TIMES):
+                success, f1l_session_id = self.sync_changed_laps_to_f1laps(api, session_params)
+            else:
+                success, f1l_session_id = self.sync_all_laps_to_f1laps(api, session_params)
+        finally:
+            self.finish_outbox_entry(outbox_entry, success)
+        if success:
+            for lap_time in session_params["lap_times"]:
+                lap = self.lap_list.get(lap_time["lap_number"])
+                if lap:
+                    lap.has_been_uploaded = True
+            log.info("%s successfully synced to F1Laps" % self)
+        else:
+            log.info("%s failed sync to F1Laps" % self)
+        return success, f1l_session_id
+
+    def sync_all_laps_to_f1laps(self, api, session_params):
+        """ Create or update the session in F1Laps with all laps """
+        lap_hashes = None
+        if self.session_sync_state:
+            _, lap_hashes = self.session_sync_state.prepare_sync(session_params["lap_times"], full_sync=True)
         success, f1l_session_id = api.session_create_or_update(
             f1laps_session_id = self.f1_laps_session_id,
+            **session_params
+        )
+        if success and self.session_sync_state:
+            self.session_sync_state.acknowledge(lap_hashes, full_sync=True)
+        return success, f1l_session_id
+
+    def sync_changed_laps_to_f1laps(self, api, session_params):
+        """ 
+        Update the session in F1Laps with only the laps it doesn't have yet
+        Only for servers with CAPABILITY_PARTIAL_LAP_TIMES; falls back to sending all laps if F1Laps requires it
+        """
+        lap_times, lap_hashes = self.session_sync_state.prepare_sync(session_params["lap_times"])
+        success, full_sync_required = api.update_session_laps_in_f1laps(
+            f1laps_session_id = self.f1_laps_session_id,
+            **dict(session_params, lap_times=lap_times)
+        )
+        if full_sync_required:
+            self.session_sync_state.reset()
+            return self.sync_all_laps_to_f1laps(api, session_params)
+        if success:
+            self.session_sync_state.acknowledge(lap_hashes)
+        return success, self.f1_laps_session_id
+
+    def add_to_outbox(self, kind, params, coalesce_key=None):
+        """ Store an upload payload in the outbox before it's uploaded; returns the OutboxEntry """
+        if self.outbox is None:
+            return None
+        return self.outbox.add(kind, self.game_version, params, coalesce_key)
+
+    def add_session_to_outbox(self, session_params):
+        """ A session has one outbox entry, holding its newest payload """
+        return self.add_to_outbox(
+            OUTBOX_KIND_SESSION,
+            dict(session_params, f1laps_session_id=self.f1_laps_session_id),
+            coalesce_key = "%s-%s" % (self.game_version, self.session_udp_uid)
+        )
+
+    def finish_outbox_entry(self, outbox_entry, success):
+        if self.outbox is not None and outbox_entry:
+            self.outbox.finish(outbox_entry, success)
+
+    def get_f1laps_session_params(self):
+        """ Return the session_create_or_update API params, except the F1Laps session ID """
+        return dict(
             track_id          = self.track_id,
             team_id           = self.team_id,
             session_uid       = self.session_udp_uid,
@@ -305,17 +461,12 @@ class F12022Session(SessionBase):
             classifications   = self.get_classification_list(),
             season_identifier = self.season_identifier
         )
-        if success:
-            log.info("%s successfully synced to F1Laps" % self)
-        else:
-            log.info("%s failed sync to F1Laps" % self)
-        return success, f1l_session_id
     
     def get_f1laps_lap_times_list(self):
         lap_times = []
         for lap_number, lap_object in self.lap_list.items():
             if lap_object.sector_1_ms and lap_object.sector_2_ms and lap_object.sector_3_ms:
-                lap_times.append(lap_object.json_serialize())
+                lap_times.append(lap_object.json_serialize(self.telemetry_encoding, self.telemetry_distance_step))
         return lap_times
 
     def get_classification_list(self):
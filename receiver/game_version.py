@@ -1,4 +1,8 @@
 import ctypes
+import struct
+from collections import namedtuple
+
+from receiver.helpers import unpack_struct
 
 
 class CrossGamePacketHeader(ctypes.LittleEndianStructure):
@@ -17,6 +21,11 @@ class CrossGamePacketHeader(ctypes.LittleEndianStructure):
         ]
 
 
+# struct.Struct equivalent of CrossGamePacketHeader, used by the receiver's hot path
+PACKET_HEADER_STRUCT = struct.Struct("<HBBBBQfIBB")
+PacketHeaderFields = namedtuple("PacketHeaderFields", [name for name, _ in CrossGamePacketHeader._fields_])
+
+
 UDP_PACKET_FORMAT_TO_GAME_VERSION_MAP = {
     2020: "f12020",
     2021: "f12021",
@@ -26,9 +35,18 @@ UDP_PACKET_FORMAT_TO_GAME_VERSION_MAP = {
 
 def parse_game_version_from_udp_packet(packet):
     """ 
-    Input : UDP packet in bytes
+    Input : UDP packet in bytes or a memoryview of the receiver buffer
     Output: Game Version as string
     """
-    header = CrossGamePacketHeader.from_buffer_copy(packet)
+    header = unpack_struct(CrossGamePacketHeader, packet)
     return UDP_PACKET_FORMAT_TO_GAME_VERSION_MAP.get(header.packetFormat)
-    
\ No newline at end of file
+
+
+def unpack_packet_header(packet):
+    """
+    Decode the packet header once per datagram
+    Input : UDP packet in bytes or a memoryview of the receiver buffer
+    Output: PacketHeaderFields with the CrossGamePacketHeader field names
+    Raises struct.error if the packet is too short
+    """
+    return PacketHeaderFields._make(PACKET_HEADER_STRUCT.unpack_from(packet))
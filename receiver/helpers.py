@@ -15,6 +15,18 @@ def get_local_ip():
         raise Exception("Local host IP couldn't be found")
 
 
+def unpack_struct(struct_class, packet):
+    """
+    Decode a ctypes struct from a UDP packet
+    Writable buffers (the receiver's ring buffer slots) are decoded in place without copying,
+    the returned struct is only valid until the buffer gets reused.
+    Everything else (e.g. bytes) gets copied.
+    """
+    if isinstance(packet, bytearray) or (isinstance(packet, memoryview) and not packet.readonly):
+        return struct_class.from_buffer(packet)
+    return struct_class.from_buffer_copy(packet)
+
+
 def asciiart():
     log.critical("")
     log.critical("Welcome to F1 Telemetry!")
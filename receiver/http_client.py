@@ -0,0 +1,202 @@
+import gzip
+import io
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+log = logging.getLogger(__name__)
+
+
+# Seconds to wait for a connection to F1Laps, and for its response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# Connections kept alive per host (the uploader and the GUI may call F1Laps at the same time)
+POOL_MAXSIZE = 4
+# Number of recent requests used for the latency stats
+LATENCY_SAMPLE_COUNT = 100
+# JSON request bodies of at least this size get gzip compressed, if the server accepts them
+GZIP_MIN_BYTES = 16 * 1024
+GZIP_LEVEL = 6
+# Servers that don't accept compressed request bodies respond with one of these
+# (415 if they check Content-Encoding, 400 if they try to parse the compressed body as JSON)
+GZIP_REJECTED_STATUS_CODES = (400, 415)
+# Response header in which the server lists the optional features it supports, comma separated
+CAPABILITIES_HEADER = "X-F1Laps-Capabilities"
+# Server accepts gzip compressed request bodies
+CAPABILITY_GZIP_REQUESTS = "gzip-requests"
+
+
+class F1LapsHTTPClient:
+    """
+    HTTP client shared by all F1Laps API calls
+
+    Requests go through one requests.Session, whose connection pool keeps
+    connections to F1Laps alive, so only the first call pays for DNS, TCP
+    and TLS setup. The Session's connection pool is thread-safe; the stats
+    are guarded by a lock. Every request has a connect and a read timeout,
+    so a stalled server can't block the calling thread forever.
+
+    Servers list optional features in the CAPABILITIES_HEADER of their
+    responses, which the client remembers per host. JSON bodies are
+    serialized once and gzip compressed from gzip_min_bytes on (None = never),
+    but only for hosts that advertised CAPABILITY_GZIP_REQUESTS, or for
+    calls that ask for it. Once a host rejected a compressed body, it gets
+    uncompressed bodies only.
+    """
+
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, pool_maxsize=POOL_MAXSIZE,
+                 gzip_min_bytes=GZIP_MIN_BYTES):
+        self.timeout = (connect_timeout, read_timeout)
+        self.gzip_min_bytes = gzip_min_bytes
+        self.adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.lock = threading.Lock()
+
+        # {host: set of capabilities} from the CAPABILITIES_HEADER of the host's last response
+        self.host_capabilities = {}
+        # Hosts that rejected a compressed body
+        self.gzip_rejected_hosts = set()
+
+        # Counters
+        self.request_count = 0
+        self.failed_count = 0
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLE_COUNT)
+        self.body_bytes_sent = 0
+        self.body_bytes_uncompressed = 0
+
+    def request(self, method, url, **kwargs):
+        """ Send a request; raises requests exceptions like requests.request() """
+        kwargs.setdefault("timeout", self.timeout)
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+            self.store_capabilities(url, response)
+            return response
+        except requests.RequestException:
+            with self.lock:
+                self.failed_count += 1
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            with self.lock:
+                self.request_count += 1
+                self.latencies_ms.append(latency_ms)
+
+    def store_capabilities(self, url, response):
+        """ Remember the capabilities a host lists in its responses """
+        capabilities = response.headers.get(CAPABILITIES_HEADER)
+        if capabilities is None:
+            return
+        with self.lock:
+            self.host_capabilities[get_host(url)] = {capability.strip() for capability in capabilities.split(",") if capability.strip()}
+
+    def has_capability(self, url, capability):
+        """ True if the host of url listed the capability in its last response """
+        with self.lock:
+            return capability in self.host_capabilities.get(get_host(url), ())
+
+    def should_compress(self, url, body_size, compress=None):
+        if self.gzip_min_bytes is None or body_size < self.gzip_min_bytes:
+            return False
+        with self.lock:
+            if get_host(url) in self.gzip_rejected_hosts:
+                return False
+        return compress if compress is not None else self.has_capability(url, CAPABILITY_GZIP_REQUESTS)
+
+    def request_json(self, method, url, payload, headers=None, compress=None, **kwargs):
+        """ 
+        Send a payload as JSON body, gzip compressed if it's big enough and the host accepts it
+        compress=True compresses for any host, e.g. for endpoints known to accept it; None follows the host's capabilities
+        If the server rejects the compressed body, it's sent again uncompressed
+        """
+        body = json.dumps(payload, allow_nan=False).encode("utf-8")
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        if not self.should_compress(url, len(body), compress):
+            return self.send_body(method, url, body, len(body), headers, **kwargs)
+        compressed_headers = dict(headers, **{"Content-Encoding": "gzip"})
+        response = self.send_body(method, url, gzip.compress(body, GZIP_LEVEL), len(body), compressed_headers, **kwargs)
+        if response.status_code not in GZIP_REJECTED_STATUS_CODES:
+            return response
+        uncompressed_response = self.send_body(method, url, body, len(body), headers, **kwargs)
+        # A 400 is only about the compression if the uncompressed body gets accepted
+        if response.status_code != 400 or uncompressed_response.status_code < 400:
+            log.info("%s doesn't accept compressed requests, switching compression off for it" % get_host(url))
+            with self.lock:
+                self.gzip_rejected_hosts.add(get_host(url))
+        return uncompressed_response
+
+    def send_body(self, method, url, body, uncompressed_size, headers, **kwargs):
+        with self.lock:
+            self.body_bytes_sent += len(body)
+            self.body_bytes_uncompressed += uncompressed_size
+        # Streamed from the buffer, with a Content-Length header
+        return self.request(method, url, data=io.BytesIO(body), headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def get_opened_connection_count(self):
+        """ Number of connections the pool opened (each host has its own pool) """
+        pools = self.adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def get_stats(self):
+        """ Return request counters, connection reuse and latency of recent requests """
+        opened_connection_count = self.get_opened_connection_count()
+        with self.lock:
+            latencies_ms = list(self.latencies_ms)
+            return {
+                "requests": self.request_count,
+                "failed": self.failed_count,
+                "connections_opened": opened_connection_count,
+                "connections_reused": max(self.request_count - self.failed_count - opened_connection_count, 0),
+                "body_bytes_sent": self.body_bytes_sent,
+                "body_bytes_uncompressed": self.body_bytes_uncompressed,
+                "latency_ms_last": round(latencies_ms[-1]) if latencies_ms else None,
+                "latency_ms_avg": round(sum(latencies_ms) / len(latencies_ms)) if latencies_ms else None,
+                "latency_ms_max": round(max(latencies_ms)) if latencies_ms else None,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def get_host(url):
+    return urlsplit(url).netloc
+
+
+shared_http_client = None
+shared_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """ Return the F1LapsHTTPClient that's shared across sessions and game versions """
+    global shared_http_client
+    with shared_http_client_lock:
+        if shared_http_client is None:
+            shared_http_client = F1LapsHTTPClient()
+        return shared_http_client
+
+
+def set_http_client(http_client):
+    """ 
+    Replace the shared client, e.g. with an upload sink of a capture replay
+    Returns the previous client, so that it can be put back
+    """
+    global shared_http_client
+    with shared_http_client_lock:
+        previous_http_client = shared_http_client
+        shared_http_client = http_client
+        return previous_http_client
@@ -1,8 +1,8 @@
-import json
 import logging
 log = logging.getLogger(__name__)
 
 from receiver.lap_telemetry_base import LapTelemetryBase
+from receiver.telemetry_encoding import decode_telemetry_string, TELEMETRY_ENCODING_JSON
 from receiver.f12022.types import SESSION_TYPES_WITH_INLAP, \
                                   SESSION_TYPES_WITH_IN_AND_OUT_LAP, \
                                   SESSION_TYPES_TIME_TRIAL
@@ -13,7 +13,12 @@ class LapBase:
     # Settings
     MAX_DISTANCE_COUNT_AS_NEW_LAP = 200
 
-    def __init__(self, lap_number, session_type, telemetry_enabled):
+    def __init__(self, lap_number, session_type, telemetry_enabled, telemetry_schema=None):
+        # Cached json_serialize() results by (telemetry encoding, distance step, telemetry enabled)
+        # Each holds the telemetry object and version it was serialized with
+        # Methods that change serialized fields clear it (see invalidate_serialized_lap)
+        self.serialized_lap_cache = {}
+
         # Session info
         self.session_type = session_type
 
@@ -82,12 +87,18 @@ class LapBase:
         # Telemetry
         self.telemetry = None
         self.telemetry_model = LapTelemetryBase
+        # Telemetry channels to store (None = default channels)
+        self.telemetry_schema = telemetry_schema
+        # Once spilled, the telemetry JSON lives on disk and self.telemetry is None (see TelemetrySpillPolicy)
+        self.spilled_telemetry = None
 
         # Penalties
-        self.penalties = []
+        self._penalties = []
 
         # F1Laps sync
         self.has_been_synced_to_f1l = False
+        # Set once F1Laps accepted the lap (or the session containing it)
+        self.has_been_uploaded = False
         self.telemetry_enabled = telemetry_enabled
 
         # Log lap init
@@ -95,9 +106,29 @@ class LapBase:
 
     def __str__(self):
         return "Lap #%s" % self.lap_number
+
+    @property
+    def penalties(self):
+        return self._penalties
+
+    @penalties.setter
+    def penalties(self, penalties):
+        self._penalties = penalties
+        self.invalidate_serialized_lap()
+
+    def invalidate_serialized_lap(self):
+        """ 
+        Clear the cached serialization 
+        Called by every method that changes a serialized field; telemetry frames are tracked by their version
+        """
+        if self.serialized_lap_cache:
+            self.serialized_lap_cache = {}
     
-    def update(self, lap_values=None, telemetry_values=None):
-        """Update the lap with new data"""
+    def update(self, lap_values=None, telemetry_values=None, telemetry_source=None):
+        """
+        Update the lap with new data
+        telemetry_source is the packet the telemetry values come from (see receiver.telemetry_channels)
+        """
         # Get certain values that are needed later on 
         current_distance = telemetry_values.get("lap_distance")
         new_sector_1_time = lap_values.get("sector_1_ms")
@@ -131,9 +162,10 @@ class LapBase:
             # Update this lap object
             for key, value in lap_values.items():
                 setattr(self, key, value)
+            self.invalidate_serialized_lap()
             # Update linked LapTelemetry object
             # as well as lap telemetry data
-            self.telemetry.update(telemetry_values)
+            self.telemetry.update(telemetry_values, telemetry_source)
             if telemetry_values:
                 self.update_max_speed_max_temp_gear_changes(telemetry_values)
             # Update tyre wear if we have it and if total_lap_time are set
@@ -148,8 +180,44 @@ class LapBase:
                     self.store_fuel_remaining(self.fuel_remaining_temp_store)
         
     def init_telemetry(self):
-        """ Init telemetry object """
-        self.telemetry = self.telemetry_model(self.lap_number, self.session_type)
+        """ Init telemetry object, or bring back spilled telemetry """
+        if self.spilled_telemetry:
+            self.telemetry = self.read_spilled_telemetry()
+            self.spilled_telemetry = None
+            log.debug("Reloaded spilled telemetry of %s" % self)
+            return
+        self.telemetry = self.telemetry_model(self.lap_number, self.session_type, self.telemetry_schema)
+
+    def spill_telemetry(self, spill_file):
+        """ Move the telemetry of this lap to a TelemetrySpillFile and release its frames """
+        if not self.telemetry:
+            return
+        # The lap doesn't change, so keep what was serialized with the current telemetry - 
+        # without its telemetry string, which gets read back from the spill file (see json_serialize)
+        telemetry = self.telemetry
+        serialized_lap_cache = self.serialized_lap_cache
+        self.spilled_telemetry = spill_file.append(telemetry.get_telemetry_string())
+        self.telemetry = None
+        self.serialized_lap_cache = {key: (None, None, self.without_telemetry_string(serialized_lap)) 
+                                     for key, (cached_telemetry, version, serialized_lap) in serialized_lap_cache.items() 
+                                     if cached_telemetry is telemetry and version == telemetry.version}
+        log.debug("Spilled telemetry of %s to disk" % self)
+
+    def read_spilled_telemetry(self):
+        """ Return a new telemetry object with the spilled frames """
+        telemetry = self.telemetry_model(self.lap_number, self.session_type, self.telemetry_schema)
+        telemetry.frame_dict = decode_telemetry_string(self.spilled_telemetry.read())
+        telemetry.last_lap_distance = telemetry.frames.get_value(len(telemetry.frames) - 1, telemetry.lap_distance_index) \
+            if len(telemetry.frames) else None
+        return telemetry
+
+    def update_telemetry_channels(self, telemetry_source, telemetry_values):
+        """ 
+        Add telemetry values of packets that don't update the lap itself (e.g. motion)
+        Only if the lap is storing telemetry and channels of that packet are enabled
+        """
+        if self.telemetry and self.telemetry.schema.has_source(telemetry_source):
+            self.telemetry.update(telemetry_values, telemetry_source)
     
     def reset_lap_telemetry(self):
         """ 
@@ -160,6 +228,7 @@ class LapBase:
         if self.session_type in SESSION_TYPES_TIME_TRIAL:
             # Reset telemetry
             self.telemetry = None
+            self.invalidate_serialized_lap()
             log.debug("Reset telemetry for %s" % self)
 
     def new_lap_data_should_be_written(self, new_sector_1_time, total_lap_time):
@@ -225,6 +294,7 @@ class LapBase:
         So that we store the "slowest" pit value
         """
         self.pit_status = max((self.pit_status or 0), (pit_status or 0))
+        self.invalidate_serialized_lap()
         return self.pit_status
     
     def process_flashback_event(self, frame_id_flashed_back_to):
@@ -237,6 +307,11 @@ class LapBase:
         for penalty in self.penalties[:]:
             if penalty.frame_id > frame_id_flashed_back_to:
                 self.penalties.remove(penalty)
+        self.invalidate_serialized_lap()
+
+    def add_penalty(self, penalty):
+        self.penalties.append(penalty)
+        self.invalidate_serialized_lap()
     
     def can_be_synced_to_f1laps(self):
         """ Check if lap has all sectors and has not been synced to F1Laps before"""
@@ -247,9 +322,57 @@ class LapBase:
         if not last_lap_time or not self.sector_1_ms or not self.sector_2_ms:
             return None
         self.sector_3_ms = last_lap_time - self.sector_1_ms - self.sector_2_ms
+        self.invalidate_serialized_lap()
+
+    def update_weather(self, weather_id, track_temperature, air_temperature, rain_percentage_forecast):
+        self.track_temperature = track_temperature
+        self.air_temperature = air_temperature
+        self.rain_percentage_forecast = rain_percentage_forecast
+        self.weather_id = weather_id
+        self.invalidate_serialized_lap()
+
+    def set_tyre_compound_visual(self, tyre_compound_visual):
+        if tyre_compound_visual != self.tyre_compound_visual:
+            self.tyre_compound_visual = tyre_compound_visual
+            self.invalidate_serialized_lap()
     
-    def json_serialize(self):
-        """ Convert self to JSON """
+    def json_serialize(self, telemetry_encoding=TELEMETRY_ENCODING_JSON, telemetry_distance_step=None):
+        """ 
+        Convert self to JSON 
+        The result is cached until the lap or its telemetry changes - don't modify it
+        """
+        cache_key = (telemetry_encoding, telemetry_distance_step, self.telemetry_enabled)
+        telemetry = self.telemetry
+        telemetry_version = telemetry.version if telemetry else None
+        cached_lap = self.serialized_lap_cache.get(cache_key)
+        if cached_lap and cached_lap[0] is telemetry and cached_lap[1] == telemetry_version:
+            serialized_lap = cached_lap[2]
+        else:
+            serialized_lap = self.build_serialized_lap(telemetry_encoding, telemetry_distance_step)
+            self.serialized_lap_cache[cache_key] = (telemetry, telemetry_version, 
+                self.without_telemetry_string(serialized_lap) if self.spilled_telemetry else serialized_lap)
+        if self.spilled_telemetry and "telemetry_data_string" not in serialized_lap:
+            # Spilled telemetry stays on disk, the cache only holds the other fields
+            return dict(serialized_lap, telemetry_data_string=self.get_telemetry_string(telemetry_encoding, telemetry_distance_step))
+        return serialized_lap
+
+    def without_telemetry_string(self, serialized_lap):
+        return {key: value for key, value in serialized_lap.items() if key != "telemetry_data_string"}
+
+    def get_memory_size(self):
+        """ 
+        Bytes of telemetry this lap holds in memory: the telemetry frames, their encoded JSON 
+        and the telemetry strings of serialized laps (which may share the encoded JSON)
+        """
+        memory_size = self.telemetry.get_memory_size() if self.telemetry else 0
+        encoded_string = self.telemetry.json_encoder.string if self.telemetry else None
+        for _, _, serialized_lap in self.serialized_lap_cache.values():
+            telemetry_string = serialized_lap.get("telemetry_data_string")
+            if telemetry_string and telemetry_string is not encoded_string:
+                memory_size += len(telemetry_string)
+        return memory_size
+
+    def build_serialized_lap(self, telemetry_encoding, telemetry_distance_step):
         serialized_lap = {
             "lap_number": self.lap_number,
             "sector_1_time_ms": self.sector_1_ms,
@@ -258,7 +381,7 @@ class LapBase:
             "pit_status": self.pit_status,
             "car_race_position": self.car_race_position,
             "tyre_compound_visual" : self.tyre_compound_visual,
-            "telemetry_data_string": self.get_telemetry_string(),
+            "telemetry_data_string": self.get_telemetry_string(telemetry_encoding, telemetry_distance_step),
             "penalties": [],
             "air_temperature": self.air_temperature,
             "track_temperature": self.track_temperature,
@@ -299,13 +422,30 @@ class LapBase:
             "tyre_rear_left_temp_max_inner": self.tyre_rear_left_temp_max_inner,
             "tyre_rear_right_temp_max_inner": self.tyre_rear_right_temp_max_inner,
         }
+        if telemetry_encoding != TELEMETRY_ENCODING_JSON:
+            serialized_lap["telemetry_data_encoding"] = telemetry_encoding
+        if telemetry_distance_step:
+            serialized_lap["telemetry_distance_step"] = telemetry_distance_step
         for penalty in self.penalties:
             serialized_lap["penalties"].append(penalty.json_serialize())
         return serialized_lap
 
-    def get_telemetry_string(self):
-        """ Get telemetry string of this lap for F1Laps sync """
-        return json.dumps(self.telemetry.frame_dict) if self.telemetry and self.telemetry_enabled else None
+    def get_telemetry_string(self, encoding=TELEMETRY_ENCODING_JSON, distance_step=None):
+        """ 
+        Get telemetry string of this lap for F1Laps sync 
+        encoding is one of receiver.telemetry_encoding.TELEMETRY_ENCODINGS
+        distance_step resamples the telemetry to a frame every distance_step meters
+        """
+        if not self.telemetry_enabled:
+            return None
+        if self.spilled_telemetry:
+            # Spilled laps are stored as JSON of the game frames
+            if encoding == TELEMETRY_ENCODING_JSON and not distance_step:
+                return self.spilled_telemetry.read()
+            return self.read_spilled_telemetry().get_telemetry_string(encoding, distance_step)
+        if not self.telemetry:
+            return None
+        return self.telemetry.get_telemetry_string(encoding, distance_step)
     
     def get_current_sector_number(self):
         """ Return the current sector number as an integer """
@@ -337,6 +477,7 @@ class LapBase:
             self.lap_start_tyre_wear_front_right = tyre_wear_front_right
             self.lap_start_tyre_wear_rear_left = tyre_wear_rear_left
             self.lap_start_tyre_wear_rear_right = tyre_wear_rear_right
+        self.invalidate_serialized_lap()
         # Clear temp store
         self.tyre_wear_current_values_temp_store = []
     
@@ -352,6 +493,7 @@ class LapBase:
         # Store at the beginning of the lap - we just store it once and never overwrite it
         if not self.lap_start_ers_store_energy:
             self.lap_start_ers_store_energy = ers_store_energy
+        self.invalidate_serialized_lap()
         # Clear temp store
         self.ers_store_energy_temp_store = None
     
@@ -366,6 +508,7 @@ class LapBase:
         # Store at the beginning of the lap - we just store it once and never overwrite it
         if not self.lap_start_fuel_remaining:
             self.lap_start_fuel_remaining = fuel_remaining
+        self.invalidate_serialized_lap()
         # Clear temp store
         self.fuel_remaining_temp_store = None
     
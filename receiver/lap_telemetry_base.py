@@ -1,28 +1,15 @@
 import logging
 log = logging.getLogger(__name__)
 
+from receiver.telemetry_channels import DEFAULT_TELEMETRY_SCHEMA
+from receiver.telemetry_encoding import IncrementalJSONEncoder, encode_frame_store, TELEMETRY_ENCODING_JSON
+from receiver.telemetry_resampling import resample_by_distance
 
-KEY_INDEX_MAP = {
-    "lap_distance": 0,
-    "lap_time"    : 1,
-    "speed"       : 2,
-    "brake"       : 3,
-    "throttle"    : 4,
-    "gear"        : 5,
-    "steer"       : 6,
-    "drs"         : 7,
-}
-
-KEY_ROUND_MAP = {
-    "lap_distance": 2,
-    "lap_time"    : 0,
-    "speed"       : 0,
-    "brake"       : 3,
-    "throttle"    : 3,
-    "gear"        : 0,
-    "steer"       : 3,
-    "drs"         : 0,
-}
+
+# Frame values of the default telemetry channels (see receiver.telemetry_channels)
+KEY_INDEX_MAP = DEFAULT_TELEMETRY_SCHEMA.key_index_map
+KEY_ROUND_MAP = DEFAULT_TELEMETRY_SCHEMA.key_round_map
+KEY_TYPECODE_MAP = DEFAULT_TELEMETRY_SCHEMA.key_typecode_map
 
 
 class LapTelemetryBase:
@@ -30,11 +17,18 @@ class LapTelemetryBase:
     MAX_FLASHBACK_DISTANCE_METERS = 1500
     MAX_DISTANCE_COUNT_AS_NEW_LAP = 200
     SESSION_TYPES_WITHOUT_OUTLAP = [1, 2, 3, 4, 5, 6, 7, 8, 13]
+    # Frames this many frames behind the newest frame get JSON encoded while the lap is driven
+    # Lap and telemetry packets of a frame arrive within a few frames of each other
+    ENCODE_FRAME_WINDOW = 60
 
-    def __init__(self, lap_number, session_type=None):
+    def __init__(self, lap_number, session_type=None, schema=None):
         # Lap number
         self.lap_number = lap_number
 
+        # Telemetry channels that get stored (TelemetryChannelSchema)
+        self.schema = schema or DEFAULT_TELEMETRY_SCHEMA
+        self.lap_distance_index = self.schema.key_index_map["lap_distance"]
+
         # Session types matter:
         # Time trial lets you restart a lap
         # Other game modes have outlaps (TT doesnt)
@@ -42,57 +36,95 @@ class LapTelemetryBase:
         # But for restart, we want the new lap frames
         self.session_type = session_type
 
-        # Main frame dict
-        # Each frame is a key in this dict
-        # Each holds a list of the telemetry values
-        self.frame_dict = {}
+        # Main frame store
+        # One typed column per telemetry channel, sorted by frame id
+        # The frame_dict property returns it in the {frame id: [values]} format
+        self.frames = self.schema.create_frame_store()
+        # JSON of the frames that are unlikely to change anymore
+        # Must be invalidated whenever frames change (see IncrementalJSONEncoder)
+        self.json_encoder = IncrementalJSONEncoder(self.frames, self.ENCODE_FRAME_WINDOW)
 
         # Last lap distance
         # Ensure we're incrementing lap distance
         # If we don't, we need to remove the dict
         self.last_lap_distance = None
 
-        # Popped frames list
-        # Store which frames got popped 
-        self.frames_popped_list = []
+        # Popped frames
+        # Store which frames got popped, so they don't get populated again
+        self.frames_popped = set()
+
+        # Incremented whenever frames change, so that laps know when to re-serialize
+        self.version = 0
+    
+    def get_memory_size(self):
+        """ Bytes used by the frames and their encoded JSON """
+        return self.frames.get_memory_size() + self.json_encoder.get_memory_size()
+
+    @property
+    def frames_popped_list(self):
+        """ Popped frame ids, sorted """
+        return sorted(self.frames_popped)
+
+    @property
+    def frame_dict(self):
+        """ 
+        Frames in the {frame id: [telemetry values]} format
+        This is a copy - use update() to change frames
+        """
+        return self.frames.to_dict()
+
+    @frame_dict.setter
+    def frame_dict(self, frame_dict):
+        self.version += 1
+        self.frames.clear()
+        self.json_encoder.reset()
+        for frame_number, values in frame_dict.items():
+            self.frames.add_frame(frame_number, values)
     
-    def update(self, telemetry_dict):
-        """ Update this LapTelemetry object's frame dict"""
+    def update(self, telemetry_dict, source=None):
+        """ 
+        Update this LapTelemetry object's frames
+        source is the packet the values come from (see receiver.telemetry_channels), 
+        so that only its channels get checked
+        """
+        self.version += 1
         frame_number = telemetry_dict["frame_identifier"]
-        frame = self.get_frame(frame_number)
-        for key, value in telemetry_dict.items():
-            # Only update keys that are in the key index map
-            if key in KEY_INDEX_MAP:
-                frame_index    = KEY_INDEX_MAP[key]
-                decimal_points = KEY_ROUND_MAP[key]
-                frame[frame_index] = round(value, decimal_points)
-        self.clean_frame(frame_number)
+        row = self.frames.get_or_create_row(frame_number)
+        self.json_encoder.invalidate_from(row)
+        set_value = self.frames.set_value
+        for source_field, frame_index, decimal_points in self.schema.get_extractor(source):
+            value = telemetry_dict.get(source_field)
+            if value is not None:
+                set_value(row, frame_index, round(value, decimal_points))
+        self.clean_frame(frame_number, row)
+        self.json_encoder.encode_stable_frames()
     
     def get_frame(self, frame_number):
         """ 
-        Helper function that returns a given frame from frame_dict or creates it
-        If frame doesn't exist in frame dict yet, create it with empty values 
+        Helper function that returns the values of a given frame, creating it if needed
+        New frames have empty values
         """
-        if frame_number not in self.frame_dict:
-            self.frame_dict[frame_number] = []
-            for _ in range(0, len(KEY_INDEX_MAP)):
-                self.frame_dict[frame_number].append(None)
-        return self.frame_dict[frame_number]
+        self.version += 1
+        row = self.frames.get_or_create_row(frame_number)
+        self.json_encoder.invalidate_from(row)
+        return self.frames.get_frame_values(row)
 
-    def clean_frame(self, frame_number):
+    def clean_frame(self, frame_number, row=None):
         """ 
         Clean up frame dict with various annoyances that the F1 game telemetry has
+        row is the frame's row in the frame store, if the caller knows it
         """
-        frame = self.frame_dict.get(frame_number)
         current_distance = None
 
         # Check if we popped this frame before - if so, don't populate it again
-        if frame_number in self.frames_popped_list:
-            self.frame_dict.pop(frame_number)
+        if frame_number in self.frames_popped:
+            self.remove_frame(frame_number, missing_ok=True)
             return 
 
         # Get lap distance of current frame
-        current_distance = frame[KEY_INDEX_MAP["lap_distance"]]
+        if row is None:
+            row = self.frames.find_row(frame_number)
+        current_distance = self.frames.get_value(row, self.lap_distance_index)
 
         # The telemetry packet doesn't set lap distance, so we may not have distance yet - return if so
         if not current_distance:
@@ -105,7 +137,8 @@ class LapTelemetryBase:
         # Reset telemetry when we are pre session FIRST LINE CROSS start
         if current_distance < 0:
             log.debug("Resetting telemetry because we are pre session first line cross")
-            self.frame_dict = {}
+            self.frames.clear()
+            self.json_encoder.reset()
             # In F1 2021, in an outlap in TT, the first frame sends a positive value (e.g. distance of 126)
             # Then switches to negative values as expected in an outlap
             # So we need to manually reset the last lap distance to None here
@@ -126,9 +159,8 @@ class LapTelemetryBase:
                 # In that case, the following code would remove the entire last lap. We dont want that. 
                 # So we add the condition that we only clean the pre-line frames if that pre-line frame_dict didn't contain
                 # frames that are early in the lap (meaning it wasnt a full lap)
-                frame_dict_sorted_by_distance = sorted(self.frame_dict.copy().items(), key=lambda kv: kv[KEY_INDEX_MAP["lap_distance"]])
-                first_frame_distance_frame, first_frame_distance_values = frame_dict_sorted_by_distance[0]
-                first_frame_distance_value = first_frame_distance_values[KEY_INDEX_MAP["lap_distance"]] or 0
+                # The first frame is the one with the lowest frame id (frames are sorted by frame id)
+                first_frame_distance_value = self.frames.get_value(0, self.lap_distance_index) or 0
                 if self.session_type not in self.SESSION_TYPES_WITHOUT_OUTLAP and first_frame_distance_value < self.MAX_DISTANCE_COUNT_AS_NEW_LAP:
                     log.info("Assuming an outlap started based on distance delta - killing all new frames (current distance %s, last distance %s, first frame distance %s)" % \
                         (current_distance, self.last_lap_distance, first_frame_distance_value))
@@ -138,24 +170,29 @@ class LapTelemetryBase:
                 else:
                     log.info("Assuming a new lap started based on distance delta - killing all old frames (current distance %s, last distance %s, first frame distance %s)" % \
                         (current_distance, self.last_lap_distance, first_frame_distance_value))
-                    self.frame_dict = {frame_number: frame}
+                    self.frames.keep_only(frame_number)
+                    self.json_encoder.reset()
         
         # Set the last distance value for future frames
         self.last_lap_distance = current_distance
 
-    def remove_frame(self, frame_number):
-        self.frame_dict.pop(frame_number)
-        self.frames_popped_list.append(frame_number)
+    def remove_frame(self, frame_number, missing_ok=False):
+        row = self.frames.find_row(frame_number)
+        if row is None:
+            if missing_ok:
+                return
+            raise KeyError(frame_number)
+        self.frames.remove_row(row)
+        self.json_encoder.invalidate_from(row)
+        self.frames_popped.add(frame_number)
 
     def process_flashback_event(self, frame_id_flashed_back_to):
-        current_frame_max = max(self.frame_dict) if self.frame_dict else None
-        deleted_frame_count = 0
+        self.version += 1
+        current_frame_max = self.frames.get_last_frame_id()
 
         # Delete frames until we get to the frame we flashed back to
-        for frame_id, _ in self.frame_dict.copy().items():
-            if frame_id >= frame_id_flashed_back_to:
-                deleted_frame_count += 1
-                self.frame_dict.pop(frame_id)
+        deleted_frame_count = self.frames.truncate_from(frame_id_flashed_back_to)
+        self.json_encoder.invalidate_from(len(self.frames))
         
         # Reset last lap distance
         self.last_lap_distance = None
@@ -163,4 +200,19 @@ class LapTelemetryBase:
             frame_id_flashed_back_to,
             current_frame_max,
             deleted_frame_count
-            ))
\ No newline at end of file
+            ))
+
+    def get_resampled_frames(self, distance_step):
+        """ Return a frame store with a frame every distance_step meters (frame id = distance / distance_step) """
+        return resample_by_distance(self.frames, self.lap_distance_index, self.schema.step_hold_columns, distance_step)
+
+    def get_telemetry_string(self, encoding=TELEMETRY_ENCODING_JSON, distance_step=None):
+        """ 
+        Encode the frames for F1Laps sync, resampled to a distance grid if distance_step is set
+        JSON only encodes the frames that weren't encoded while the lap was driven
+        """
+        if distance_step:
+            return encode_frame_store(self.get_resampled_frames(distance_step), encoding)
+        if encoding == TELEMETRY_ENCODING_JSON:
+            return self.json_encoder.get_string()
+        return encode_frame_store(self.frames, encoding)
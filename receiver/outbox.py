@@ -0,0 +1,242 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+log = logging.getLogger(__name__)
+
+from receiver.api_base import F1LapsAPIBase, F1LAPS_API_BASE_URL
+
+
+# File name of the outbox database, next to the config file
+OUTBOX_FILE_NAME = "f1laps_outbox.sqlite3"
+
+# Kinds of uploads
+OUTBOX_KIND_LAP = "lap"
+OUTBOX_KIND_SESSION = "session"
+
+# Retries wait 30s, 60s, 120s, ... up to an hour
+RETRY_BACKOFF_BASE_SECONDS = 30
+RETRY_BACKOFF_MAX_SECONDS = 60 * 60
+# Entries that couldn't be uploaded within a week are dropped
+MAX_ENTRY_AGE_SECONDS = 7 * 24 * 60 * 60
+# Oldest entries are dropped once all payloads together exceed this
+DEFAULT_MAX_PAYLOAD_BYTES = 256 * 1024 * 1024
+# The database file gets vacuumed once this much of it is free pages
+COMPACTION_THRESHOLD_BYTES = 16 * 1024 * 1024
+# How often the worker checks for due entries (in seconds)
+OUTBOX_POLL_TIMEOUT = 5
+
+
+class OutboxEntry:
+    """ A pending upload """
+    def __init__(self, entry_id, revision, kind, game_version, payload, attempts):
+        self.entry_id = entry_id
+        self.revision = revision
+        self.kind = kind
+        self.game_version = game_version
+        self.payload = payload
+        self.attempts = attempts
+
+    def __str__(self):
+        return "outbox %s %s (attempt %s)" % (self.kind, self.entry_id, self.attempts + 1)
+
+
+class F1LapsOutbox:
+    """
+    On-disk queue of lap and session uploads, so that no upload gets lost
+
+    Payloads are written to an SQLite database before they get uploaded
+    and deleted once F1Laps accepted them. Failed uploads are retried with
+    exponential backoff by the OutboxWorker, also after a restart of the app.
+    Session payloads have a coalesce key, so a session only has one entry
+    with its newest payload.
+
+    Entries are in flight while they're uploaded, by the live upload or a retry,
+    and only retried once that upload finished. The outbox file belongs to one
+    running app, so entries in flight for another process were left by an
+    earlier run that stopped mid-upload, and are retried.
+
+    The API key isn't stored; uploads use the key of the running app.
+    Entries are guarded by a lock, so the packet processing, uploader and
+    outbox worker threads can share the outbox.
+    """
+
+    def __init__(self, path, max_payload_bytes=DEFAULT_MAX_PAYLOAD_BYTES):
+        self.path = path
+        self.max_payload_bytes = max_payload_bytes
+        self.lock = threading.Lock()
+        # Owner of the entries this app has in flight
+        self.pid = os.getpid()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                game_version TEXT NOT NULL,
+                coalesce_key TEXT UNIQUE,
+                payload TEXT NOT NULL,
+                revision INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                in_flight_pid INTEGER,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL
+            )
+        """)
+
+        # Counters
+        self.uploaded_count = 0
+        self.retried_count = 0
+        self.dropped_count = 0
+
+    def add(self, kind, game_version, params, coalesce_key=None):
+        """
+        Store an upload before it's sent; returns its OutboxEntry
+        The entry is in flight until the caller finishes it
+        """
+        payload = json.dumps(params)
+        now = time.time()
+        with self.lock:
+            if coalesce_key is None:
+                cursor = self.connection.execute(
+                    "INSERT INTO outbox (kind, game_version, payload, in_flight_pid, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (kind, game_version, payload, self.pid, now, now))
+                entry_id, revision = cursor.lastrowid, 0
+            else:
+                # Replace the queued payload of the same session
+                self.connection.execute("""
+                    INSERT INTO outbox (kind, game_version, coalesce_key, payload, in_flight_pid, created_at, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(coalesce_key) DO UPDATE SET
+                        payload = excluded.payload, revision = revision + 1, attempts = 0,
+                        in_flight_pid = excluded.in_flight_pid, next_attempt_at = excluded.next_attempt_at
+                    """, (kind, game_version, coalesce_key, payload, self.pid, now, now))
+                entry_id, revision = self.connection.execute(
+                    "SELECT id, revision FROM outbox WHERE coalesce_key = ?", (coalesce_key,)).fetchone()
+            self.enforce_size_limit()
+        return OutboxEntry(entry_id, revision, kind, game_version, payload, 0)
+
+    def finish(self, entry, success, is_retry=False):
+        """ Delete an uploaded entry, or schedule the retry of a failed one; either way it's no longer in flight """
+        with self.lock:
+            if is_retry:
+                self.retried_count += 1
+            if success:
+                # A newer payload of the same session may have replaced the uploaded one
+                self.connection.execute("DELETE FROM outbox WHERE id = ? AND revision = ?", (entry.entry_id, entry.revision))
+                self.uploaded_count += 1
+                return
+            attempts = entry.attempts + 1
+            backoff_seconds = min(RETRY_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), RETRY_BACKOFF_MAX_SECONDS)
+            self.connection.execute(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, in_flight_pid = NULL WHERE id = ? AND revision = ?",
+                (attempts, time.time() + backoff_seconds, entry.entry_id, entry.revision))
+        log.info("Upload of %s failed, retrying in %ss" % (entry, backoff_seconds))
+
+    def claim_due_entries(self, limit=10):
+        """ Return entries whose retry is due and that this app doesn't have in flight, and put them in flight """
+        now = time.time()
+        with self.lock:
+            self.connection.execute("DELETE FROM outbox WHERE created_at < ?", (now - MAX_ENTRY_AGE_SECONDS,))
+            rows = self.connection.execute("""
+                SELECT id, revision, kind, game_version, payload, attempts FROM outbox
+                WHERE next_attempt_at <= ? AND (in_flight_pid IS NULL OR in_flight_pid != ?) ORDER BY id LIMIT ?
+                """, (now, self.pid, limit)).fetchall()
+            self.connection.executemany(
+                "UPDATE outbox SET in_flight_pid = ? WHERE id = ?",
+                [(self.pid, row[0]) for row in rows])
+        return [OutboxEntry(*row) for row in rows]
+
+    def enforce_size_limit(self):
+        """ Drop the oldest entries while all payloads together exceed the limit (call with lock) """
+        payload_bytes = self.connection.execute("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM outbox").fetchone()[0]
+        while payload_bytes > self.max_payload_bytes:
+            entry_id, entry_bytes = self.connection.execute(
+                "SELECT id, LENGTH(payload) FROM outbox ORDER BY id LIMIT 1").fetchone()
+            self.connection.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+            payload_bytes -= entry_bytes
+            self.dropped_count += 1
+            log.info("Outbox is full, dropped upload %s" % entry_id)
+
+    def compact(self):
+        """ Give the space of deleted entries back to the file system """
+        with self.lock:
+            free_pages = self.connection.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+            if free_pages * page_size < COMPACTION_THRESHOLD_BYTES:
+                return False
+            self.connection.execute("VACUUM")
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        log.debug("Compacted outbox (%s free bytes)" % (free_pages * page_size))
+        return True
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def get_stats(self):
+        return {
+            "pending": len(self),
+            "uploaded": self.uploaded_count,
+            "retried": self.retried_count,
+            "dropped": self.dropped_count,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class OutboxWorker(threading.Thread):
+    """
+    Background worker that uploads due outbox entries
+    Started with the receiver, so uploads left over from the last run go out first
+    """
+
+    def __init__(self, outbox, f1laps_api_key, poll_timeout=OUTBOX_POLL_TIMEOUT, api_base_url=F1LAPS_API_BASE_URL):
+        super(OutboxWorker, self).__init__()
+        # Never keep the app alive because of pending retries
+        self.daemon = True
+        self.outbox = outbox
+        self.f1laps_api_key = f1laps_api_key
+        self.poll_timeout = poll_timeout
+        self.api_base_url = api_base_url
+        self.kill_event = threading.Event()
+
+    def kill(self):
+        self.kill_event.set()
+
+    def run(self):
+        log.info("F1Laps outbox worker started running (%s pending uploads)" % len(self.outbox))
+        while not self.kill_event.is_set():
+            if not self.process_due_entries():
+                self.outbox.compact()
+                self.kill_event.wait(self.poll_timeout)
+        log.info("F1Laps outbox worker stopped (%s)" % self.outbox.get_stats())
+
+    def process_due_entries(self):
+        """ Upload all due entries; returns the number of processed entries """
+        entries = self.outbox.claim_due_entries()
+        for entry in entries:
+            if self.kill_event.is_set():
+                break
+            try:
+                success = self.upload(entry)
+            except Exception as ex:
+                log.info("Upload %s failed with exception: %s" % (entry, ex))
+                success = False
+            self.outbox.finish(entry, success, is_retry=True)
+        return len(entries)
+
+    def upload(self, entry):
+        api = F1LapsAPIBase(self.f1laps_api_key, entry.game_version, base_url=self.api_base_url)
+        params = json.loads(entry.payload)
+        if entry.kind == OUTBOX_KIND_LAP:
+            return api.lap_create(**params)
+        if entry.kind == OUTBOX_KIND_SESSION:
+            # Without F1Laps session ID, creating an existing session falls back to updating it
+            success, _ = api.session_create_or_update(**params)
+            return success
+        log.info("Dropping %s of unknown kind" % entry)
+        return True
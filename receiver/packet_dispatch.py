@@ -0,0 +1,122 @@
+import struct
+from collections import namedtuple
+import sentry_sdk
+import logging
+log = logging.getLogger(__name__)
+
+import f1_2020_telemetry.packets
+
+from receiver.f12020.processor import F12020Processor
+from receiver.f12021.processor import F12021Processor
+from receiver.f12022.processor import F12022Processor
+from receiver.f12021.packets.helpers import HeaderFieldsToPacketType as F12021HeaderFieldsToPacketType
+from receiver.f12022.packets.helpers import HeaderFieldsToPacketType as F12022HeaderFieldsToPacketType
+from receiver.game_version import unpack_packet_header, UDP_PACKET_FORMAT_TO_GAME_VERSION_MAP
+
+
+# Processor of each game version
+GAME_VERSION_TO_PROCESSOR_CLASS = {
+    "f12020": F12020Processor,
+    "f12021": F12021Processor,
+    "f12022": F12022Processor,
+}
+
+# Everything the receiver needs to know to hand a packet to a processor
+PacketHandler = namedtuple("PacketHandler", ["game_version", "processor_class", "packet_type"])
+
+
+def build_packet_dispatch_table():
+    """
+    Map (packetFormat, packetId) of every supported packet to its handler
+    Packets that aren't in here (unknown games, skipped packet types) don't reach the processor
+    """
+    dispatch_table = {}
+    for (packet_format, _, packet_id), packet_type in f1_2020_telemetry.packets.HeaderFieldsToPacketType.items():
+        dispatch_table[(packet_format, packet_id)] = PacketHandler("f12020", F12020Processor, packet_type)
+    for packet_id, packet_type in F12021HeaderFieldsToPacketType.items():
+        dispatch_table[(2021, packet_id)] = PacketHandler("f12021", F12021Processor, packet_type)
+    for packet_id, packet_type in F12022HeaderFieldsToPacketType.items():
+        dispatch_table[(2022, packet_id)] = PacketHandler("f12022", F12022Processor, packet_type)
+    return dispatch_table
+
+
+PACKET_DISPATCH_TABLE = build_packet_dispatch_table()
+
+
+def get_packet_handler(header):
+    """ Return the PacketHandler for a decoded packet header, or None if it's not supported """
+    return PACKET_DISPATCH_TABLE.get((header.packetFormat, header.packetId))
+
+
+class PacketRouter:
+    """
+    Hands each datagram to the processor of its game version
+    Used by the RaceReceiver for live packets, and by the capture replay
+    on_processor_started(game_version) gets called whenever a game's processor is started
+    """
+
+    def __init__(self, f1laps_api_key, telemetry_enabled=True, uploader=None, outbox=None, on_processor_started=None):
+        self.f1laps_api_key = f1laps_api_key
+        self.telemetry_enabled = telemetry_enabled
+        # F1Laps uploader and outbox of F1 22 sessions
+        self.uploader = uploader
+        self.outbox = outbox
+        self.on_processor_started = on_processor_started
+        self.processor = None
+
+    def process_packet(self, incoming_udp_packet):
+        """ 
+        Decode the packet header once, look up the packet's handler and 
+        hand the packet and its header to the matching processor
+        """
+        try:
+            routed_packet = self.route_packet(incoming_udp_packet)
+            if routed_packet:
+                self.processor.process(incoming_udp_packet, *routed_packet)
+        except Exception as ex:
+            log.info("Unknown main receiver exception: %s" % ex)
+            sentry_sdk.capture_exception(ex)
+
+    def route_packet(self, incoming_udp_packet):
+        """ 
+        Make sure the processor of the packet's game version is running
+        Returns the decoded header and the packet type, or None for packets that get dropped
+        Any packet of a supported game starts its processor, also the ones that get dropped
+        """
+        try:
+            header = unpack_packet_header(incoming_udp_packet)
+        except struct.error:
+            log.debug("Received packet that is too short for a header")
+            return None
+        # Do this for every packet so that we can handle game switches in flight
+        game_version = UDP_PACKET_FORMAT_TO_GAME_VERSION_MAP.get(header.packetFormat)
+        if not game_version:
+            log.debug("Unknown game version (format %s)" % header.packetFormat)
+            return None
+        if type(self.processor) is not GAME_VERSION_TO_PROCESSOR_CLASS[game_version]:
+            self.start_processor(game_version)
+        handler = get_packet_handler(header)
+        if not handler:
+            log.debug("Skipping packet without handler (format %s, ID %s)" % (header.packetFormat, header.packetId))
+            return None
+        return header, handler.packet_type
+
+    def start_processor(self, game_version):
+        """ Start the processor of a newly detected game version """
+        self.kill_processor()
+        if game_version == "f12020":
+            log.info("Detected F1 2020 game version, starting F1 2020 processor.")
+            self.processor = F12020Processor(self.f1laps_api_key, self.telemetry_enabled)
+        elif game_version == "f12021":
+            log.info("Detected F1 2021 game version, starting F1 2021 processor.")
+            self.processor = F12021Processor(self.f1laps_api_key, self.telemetry_enabled)
+        elif game_version == "f12022":
+            log.info("Detected F1 2022 game version, starting F1 2022 processor.")
+            self.processor = F12022Processor(self.f1laps_api_key, self.telemetry_enabled, uploader=self.uploader, outbox=self.outbox)
+        if self.on_processor_started:
+            self.on_processor_started(game_version)
+
+    def kill_processor(self):
+        """ Let the running processor release its resources (only the F1 22 one holds any) """
+        if hasattr(self.processor, "kill"):
+            self.processor.kill()
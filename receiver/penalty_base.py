@@ -41,7 +41,7 @@ class PenaltyBase:
         else:
             lap = self.session.lap_list.get(self.lap_number)
             if lap:
-                lap.penalties.append(self)
+                lap.add_penalty(self)
             else:
                 # Penalty couldn't be added because lap doesn't exist
                 # Can happen e.g. when pausing mid-session and restarting
@@ -0,0 +1,83 @@
+import ctypes
+import struct
+from collections import namedtuple
+
+
+class PlayerCarDecoder:
+    """
+    Decodes only the player's element of a per-car array packet
+
+    The packet class declares which array holds the per-car structs 
+    (player_car_array_field) and which of their fields serialize() uses
+    (player_car_fields). The byte offset of the player's element is computed
+    from the ctypes field offsets and the element size, and a single 
+    struct.unpack_from reads the used fields, skipping everything else.
+    
+    Array fields (e.g. tyre temperatures) are returned as tuples.
+    """
+
+    def __init__(self, packet_class):
+        self.packet_class = packet_class
+        array_field_name = packet_class.player_car_array_field
+        array_type = dict(packet_class._fields_)[array_field_name]
+        self.element_type = array_type._type_
+        self.element_count = array_type._length_
+        self.element_size = ctypes.sizeof(self.element_type)
+        self.array_offset = getattr(packet_class, array_field_name).offset
+
+        element_field_types = dict(self.element_type._fields_)
+        fields = sorted(
+            (getattr(self.element_type, field_name).offset, field_name, element_field_types[field_name])
+            for field_name in packet_class.player_car_fields
+        )
+        struct_format = "<"
+        position = 0
+        # (start, length) of each field in the unpacked values; length is None for scalars
+        self.value_slices = []
+        value_index = 0
+        for offset, field_name, field_type in fields:
+            if offset > position:
+                struct_format += "%dx" % (offset - position)
+            if issubclass(field_type, ctypes.Array):
+                struct_format += "%d%s" % (field_type._length_, field_type._type_._type_)
+                self.value_slices.append((value_index, field_type._length_))
+                value_index += field_type._length_
+            else:
+                struct_format += field_type._type_
+                self.value_slices.append((value_index, None))
+                value_index += 1
+            position = offset + ctypes.sizeof(field_type)
+        self.struct = struct.Struct(struct_format)
+        self.has_array_fields = any(length for _, length in self.value_slices)
+        self.car_data_class = namedtuple("Player%s" % self.element_type.__name__, [field_name for _, field_name, _ in fields])
+
+    def decode(self, packet, player_car_index):
+        """ Return the used fields of the player's element, or None for an invalid car index """
+        if not 0 <= player_car_index < self.element_count:
+            return None
+        values = self.struct.unpack_from(packet, self.array_offset + player_car_index * self.element_size)
+        if not self.has_array_fields:
+            return self.car_data_class._make(values)
+        return self.car_data_class._make([
+            values[start] if length is None else values[start:start + length]
+            for start, length in self.value_slices
+        ])
+
+
+class PlayerCarPacket:
+    """ 
+    Lightweight stand-in for a full per-car array packet 
+    Holds the decoded header and the player's car data, and serializes 
+    with the packet class' serialize_player_car_data()
+    """
+    creates_session_object = False
+
+    def __init__(self, packet_class, header, car_data):
+        self.packet_class = packet_class
+        self.header = header
+        self.car_data = car_data
+
+    def serialize(self):
+        if self.car_data is None:
+            return None
+        return self.packet_class.serialize_player_car_data(self.header, self.car_data)
@@ -0,0 +1,232 @@
+import time
+import logging
+log = logging.getLogger(__name__)
+
+
+# Stages of processing a packet
+STAGE_DECODE = "decode"
+STAGE_SERIALIZE = "serialize"
+STAGE_HANDLER = "handler"
+STAGES = [STAGE_DECODE, STAGE_SERIALIZE, STAGE_HANDLER]
+
+# Every Nth packet gets timed; all packets and errors are counted
+DEFAULT_SAMPLE_INTERVAL = 8
+# Seconds between stats in the log (None = only on demand)
+DEFAULT_LOG_INTERVAL = 10 * 60
+
+# Histogram buckets: exact below 2 ** (HISTOGRAM_SUB_BUCKET_BITS + 1) ns,
+# then 2 ** HISTOGRAM_SUB_BUCKET_BITS buckets per power of two (12.5% precision)
+HISTOGRAM_SUB_BUCKET_BITS = 3
+HISTOGRAM_SUB_BUCKET_COUNT = 1 << HISTOGRAM_SUB_BUCKET_BITS
+HISTOGRAM_LINEAR_LIMIT = HISTOGRAM_SUB_BUCKET_COUNT << 1
+# Longer durations (~69 seconds) go to the last bucket
+HISTOGRAM_MAX_BITS = 36
+HISTOGRAM_BUCKET_COUNT = HISTOGRAM_LINEAR_LIMIT + (HISTOGRAM_MAX_BITS - HISTOGRAM_SUB_BUCKET_BITS - 1) * HISTOGRAM_SUB_BUCKET_COUNT
+
+
+def get_packet_id(packet, header=None):
+    """ Return the packet ID from the decoded header, or from the datagram; same offset in all supported games """
+    if header is not None:
+        return header.packetId
+    return packet[5] if len(packet) > 5 else None
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations in nanoseconds
+
+    Buckets grow exponentially with linear sub-buckets, so recording is a
+    bit_length() and an index increment, memory is fixed and every
+    percentile is within 12.5% of the recorded value.
+    """
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKET_COUNT
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns):
+        self.counts[get_bucket_index(duration_ns)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    def get_percentile_ns(self, percentile):
+        """ Return the highest duration of the bucket that holds the percentile (0-100) """
+        if not self.count:
+            return None
+        threshold = self.count * percentile / 100
+        cumulative_count = 0
+        for bucket_index, bucket_count in enumerate(self.counts):
+            cumulative_count += bucket_count
+            if bucket_count and cumulative_count >= threshold:
+                return min(get_bucket_upper_bound(bucket_index), self.max_ns)
+        return self.max_ns
+
+    def get_summary(self):
+        """ Count and mean, p50, p90, p99 and max in µs """
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_ns / self.count / 1000, 2),
+            "p50_us": round(self.get_percentile_ns(50) / 1000, 2),
+            "p90_us": round(self.get_percentile_ns(90) / 1000, 2),
+            "p99_us": round(self.get_percentile_ns(99) / 1000, 2),
+            "max_us": round(self.max_ns / 1000, 2),
+        }
+
+
+def get_bucket_index(duration_ns):
+    if duration_ns < HISTOGRAM_LINEAR_LIMIT:
+        return max(duration_ns, 0)
+    exponent = duration_ns.bit_length() - HISTOGRAM_SUB_BUCKET_BITS - 1
+    bucket_index = HISTOGRAM_LINEAR_LIMIT + (exponent - 1) * HISTOGRAM_SUB_BUCKET_COUNT + \
+        (duration_ns >> exponent) - HISTOGRAM_SUB_BUCKET_COUNT
+    return min(bucket_index, HISTOGRAM_BUCKET_COUNT - 1)
+
+
+def get_bucket_upper_bound(bucket_index):
+    if bucket_index < HISTOGRAM_LINEAR_LIMIT:
+        return bucket_index
+    exponent, sub_bucket = divmod(bucket_index - HISTOGRAM_LINEAR_LIMIT, HISTOGRAM_SUB_BUCKET_COUNT)
+    exponent += 1
+    return ((sub_bucket + HISTOGRAM_SUB_BUCKET_COUNT + 1) << exponent) - 1
+
+
+class PacketTimer:
+    """ Times the stages of a sampled packet, each from the end of the previous one """
+    __slots__ = ("stats", "packet_id", "start_ns")
+
+    def __init__(self, stats, packet_id):
+        self.stats = stats
+        self.packet_id = packet_id
+        self.start_ns = time.perf_counter_ns()
+
+    def stage_done(self, stage):
+        end_ns = time.perf_counter_ns()
+        self.stats.record(self.packet_id, stage, end_ns - self.start_ns)
+        self.start_ns = end_ns
+
+
+class NullPacketTimer:
+    """ Timer of packets that aren't sampled """
+    __slots__ = ()
+
+    def stage_done(self, stage):
+        pass
+
+
+NULL_PACKET_TIMER = NullPacketTimer()
+
+
+class ProcessorStats:
+    """
+    Packet counts, error counts and per-stage latency histograms per packet type of a processor
+
+    Every packet is counted; every sample_interval-th packet gets its
+    decode, serialize and handler stages timed, so the stats are cheap
+    enough to stay on. Packets skipped before decoding are counted, but
+    not timed. Stats are logged every log_interval seconds and with
+    log_stats(). Updated by the processor's thread only; get_stats() works
+    on copies of the counters, so other threads can call it meanwhile.
+    """
+
+    def __init__(self, game_version, packet_names=None, sample_interval=DEFAULT_SAMPLE_INTERVAL,
+                 log_interval=DEFAULT_LOG_INTERVAL):
+        self.game_version = game_version
+        # Packet ID to packet type name, for the stats output
+        self.packet_names = packet_names or {}
+        self.sample_interval = max(sample_interval, 1)
+        self.log_interval = log_interval
+        self.started_at = time.monotonic()
+        self.next_log_time = self.started_at + log_interval if log_interval else None
+        self.last_log_time = self.started_at
+        self.last_log_packet_count = 0
+
+        # Counters
+        self.packet_count = 0
+        self.packet_counts = {}
+        self.error_counts = {}
+        self.skipped_counts = {}
+        self.histograms = {}
+
+    def start_packet(self, packet_id):
+        """ Count a packet; returns the timer of its stages (a no-op timer if it isn't sampled) """
+        self.packet_counts[packet_id] = self.packet_counts.get(packet_id, 0) + 1
+        self.packet_count += 1
+        if self.packet_count % self.sample_interval:
+            return NULL_PACKET_TIMER
+        if self.next_log_time is not None and time.monotonic() >= self.next_log_time:
+            self.log_stats()
+        return PacketTimer(self, packet_id)
+
+    def count_error(self, packet_id):
+        self.error_counts[packet_id] = self.error_counts.get(packet_id, 0) + 1
+
+    def count_skipped(self, packet_id):
+        """ Count a packet that was skipped before decoding, so it has no stage timings """
+        self.skipped_counts[packet_id] = self.skipped_counts.get(packet_id, 0) + 1
+
+    def record(self, packet_id, stage, duration_ns):
+        histogram = self.histograms.get((packet_id, stage))
+        if histogram is None:
+            histogram = self.histograms[(packet_id, stage)] = LatencyHistogram()
+        histogram.record(duration_ns)
+
+    def get_packet_name(self, packet_id):
+        return self.packet_names.get(packet_id, "packet %s" % packet_id)
+
+    def get_stats(self):
+        """ Counts, packets per second since the start and stage latencies per packet type """
+        elapsed_seconds = time.monotonic() - self.started_at
+        # The processor's thread may add packet types while we iterate
+        packet_count = self.packet_count
+        packet_counts = dict(self.packet_counts)
+        error_counts = dict(self.error_counts)
+        skipped_counts = dict(self.skipped_counts)
+        histograms = dict(self.histograms)
+        packet_types = {}
+        for packet_id, packet_type_count in sorted(packet_counts.items(), key=lambda item: -1 if item[0] is None else item[0]):
+            packet_type_stats = {
+                "packets": packet_type_count,
+                "errors": error_counts.get(packet_id, 0),
+                "skipped": skipped_counts.get(packet_id, 0),
+            }
+            for stage in STAGES:
+                histogram = histograms.get((packet_id, stage))
+                if histogram:
+                    packet_type_stats[stage] = histogram.get_summary()
+            packet_types[self.get_packet_name(packet_id)] = packet_type_stats
+        return {
+            "packets": packet_count,
+            "errors": sum(error_counts.values()),
+            "skipped": sum(skipped_counts.values()),
+            "packets_per_second": round(packet_count / elapsed_seconds, 1) if elapsed_seconds else None,
+            "sample_interval": self.sample_interval,
+            "packet_types": packet_types,
+        }
+
+    def log_stats(self):
+        """ Log the stats, with the packets per second since the last time they were logged """
+        now = time.monotonic()
+        stats = self.get_stats()
+        recent_packets_per_second = (stats["packets"] - self.last_log_packet_count) / (now - self.last_log_time) \
+            if now > self.last_log_time else 0
+        log.info("%s processor: %s packets (%.1f/s, %.1f/s recently), %s errors, %s skipped, 1 in %s packets timed" % (
+            self.game_version, stats["packets"], stats["packets_per_second"] or 0, recent_packets_per_second,
+            stats["errors"], stats["skipped"], self.sample_interval))
+        for name, packet_type_stats in stats["packet_types"].items():
+            stage_strings = ["%s p50 %s p99 %s max %s µs" % (
+                stage, packet_type_stats[stage]["p50_us"], packet_type_stats[stage]["p99_us"], packet_type_stats[stage]["max_us"])
+                for stage in STAGES if stage in packet_type_stats]
+            log.info("  %s: %s packets, %s errors, %s skipped%s" % (
+                name, packet_type_stats["packets"], packet_type_stats["errors"], packet_type_stats["skipped"],
+                "".join(", %s" % stage_string for stage_string in stage_strings)))
+        self.last_log_time = now
+        self.last_log_packet_count = stats["packets"]
+        if self.log_interval:
+            self.next_log_time = now + self.log_interval
+        return stats
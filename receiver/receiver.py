@@ -1,25 +1,40 @@
 import threading
 import socket
+import time
 import sentry_sdk
 import platform
 import logging
 log = logging.getLogger(__name__)
 
-from receiver.f12020.processor import F12020Processor
-from receiver.f12021.processor import F12021Processor
-from receiver.f12022.processor import F12022Processor
 from receiver.helpers import get_local_ip
-from receiver.game_version import parse_game_version_from_udp_packet
+from receiver.packet_dispatch import PacketRouter
+from receiver.ring_buffer import PacketRingBuffer, DEFAULT_DEPTH, OVERFLOW_DROP_OLDEST
+from receiver.uploader import F1LapsUploader
+from receiver.http_client import get_http_client
+from receiver.outbox import F1LapsOutbox, OutboxWorker, OUTBOX_FILE_NAME
+from receiver.capture import PacketCaptureWriter, DEFAULT_MAX_FILE_BYTES
+from lib.file_handler import get_path_executable_parent
 import config
 
 
 DEFAULT_PORT = 20777
+# How often the processing thread checks if the receiver got killed (in seconds)
+PROCESSING_POLL_TIMEOUT = 0.5
+# How long the receiver waits for running uploads before it closes the outbox (in seconds)
+OUTBOX_CLOSE_TIMEOUT = 5
+# Max number of packets received or processed per ring buffer lock acquisition
+PACKET_BATCH_SIZE = 32
+# Non-blocking recv flag used to drain packets that are already waiting in the socket
+# Windows doesn't support it, so we receive one packet per batch there
+RECEIVE_NONBLOCKING_FLAG = getattr(socket, "MSG_DONTWAIT", 0)
 SENTRY_DSN = "https://d00edba104864bee975f5f4a71025639@o615967.ingest.sentry.io/5854730"
 
 
 class RaceReceiver(threading.Thread):
 
-    def __init__(self, f1laps_api_key, enable_telemetry=True, host_ip=None, host_port=None, run_as_daemon=True, use_udp_broadcast=False):
+    def __init__(self, f1laps_api_key, enable_telemetry=True, host_ip=None, host_port=None, run_as_daemon=True, use_udp_broadcast=False,
+                 ring_buffer_depth=DEFAULT_DEPTH, ring_buffer_overflow_policy=OVERFLOW_DROP_OLDEST,
+                 capture_directory=None, capture_max_file_bytes=DEFAULT_MAX_FILE_BYTES):
         """
         Init the receiver with all attributes needed to 
         push data to F1Laps
@@ -56,8 +71,28 @@ class RaceReceiver(threading.Thread):
         self.f1laps_api_key = f1laps_api_key
         self.telemetry_enabled = enable_telemetry
 
-        # game data processor
-        self.processor = None
+
+        # Packets are received on this thread and processed on a separate one
+        # The ring buffer sits between the two so that slow processing 
+        # (e.g. F1Laps API calls at the end of a lap) never stalls the socket
+        self.ring_buffer = PacketRingBuffer(depth=ring_buffer_depth, overflow_policy=ring_buffer_overflow_policy)
+        self.processing_thread = threading.Thread(target=self.run_processing, daemon=True)
+
+        # F1Laps API calls run on their own thread too, fed by the processors
+        self.uploader = F1LapsUploader()
+
+        # Starts the processor of each game version and hands it its packets
+        self.packet_router = PacketRouter(self.f1laps_api_key, self.telemetry_enabled, uploader=self.uploader,
+                                          on_processor_started=self.on_processor_started)
+        # Uploads are stored on disk until F1Laps accepted them, and retried in the background
+        # Opened when the receiver starts, next to the config file
+        self.outbox = None
+        self.outbox_worker = None
+
+        # Opt-in recording of every received datagram, to reproduce issues from the field
+        self.capture_writer = None
+        if capture_directory:
+            self.capture_writer = PacketCaptureWriter(capture_directory, max_file_bytes=capture_max_file_bytes)
 
         # Sentry manager
         # We only run Sentry on select game versions, 
@@ -129,7 +164,29 @@ class RaceReceiver(threading.Thread):
 
     def kill(self):
         self.kill_event.set()
-        log.info("Telemetry receiver stopped")
+        self.ring_buffer.notify_all()
+        if self.capture_writer:
+            self.capture_writer.kill()
+        # The processing thread stops within one poll; let it finish its packet before the processor is killed
+        if self.processing_thread.is_alive() and threading.current_thread() is not self.processing_thread:
+            self.processing_thread.join(PROCESSING_POLL_TIMEOUT * 2)
+        self.packet_router.kill_processor()
+        # The uploader sends what's queued, everything else stays in the outbox for the next run
+        self.uploader.kill()
+        if self.outbox_worker:
+            self.outbox_worker.kill()
+        self.close_outbox()
+        log.info("Telemetry receiver stopped (%s)" % self.get_ring_buffer_stats_string())
+        if hasattr(self.processor, "get_skipped_packet_counts"):
+            log.info("Packets skipped before decoding: %s" % self.processor.get_skipped_packet_counts())
+        if getattr(self.processor, "processor_stats", None):
+            self.processor.processor_stats.log_stats()
+        log.info("F1Laps API requests: %s" % get_http_client().get_stats())
+
+    def get_ring_buffer_stats_string(self):
+        stats = self.ring_buffer.get_stats()
+        return "packets enqueued %s, dropped %s, high-water mark %s of %s" % (
+            stats["enqueued"], stats["dropped"], stats["high_water_mark"], stats["depth"])
 
     
     def run(self):
@@ -137,42 +194,104 @@ class RaceReceiver(threading.Thread):
         This method is called automatically when calling .start() on the receiver class (in race.py). 
         The caller should call .start() to not get stuck in the while True loop
 
-        It's the main packet listening method.
+        It's the main packet listening method. It only receives packets into the ring buffer,
+        the processing thread picks them up from there.
         """
         # Starting an endless loop to continuously listen for UDP packets
         # until user aborts or process is terminated
         log.info("Receiver started running")
+        self.start_outbox()
+        self.processing_thread.start()
+        self.uploader.start()
+        if self.capture_writer:
+            self.capture_writer.start()
         
         while not self.kill_event.is_set():
+            self.receive_packets()
+
+    def start_outbox(self):
+        """ Open the outbox and retry the uploads that are left from previous runs """
+        try:
+            self.outbox = F1LapsOutbox(get_path_executable_parent(OUTBOX_FILE_NAME))
+        except Exception as ex:
+            log.info("Could not open outbox, failed uploads won't be retried: %s" % ex)
+            return
+        self.packet_router.outbox = self.outbox
+        self.outbox_worker = OutboxWorker(self.outbox, self.f1laps_api_key)
+        self.outbox_worker.start()
+
+    def close_outbox(self):
+        """ Close the outbox once the uploader and outbox worker are done with it, or after a timeout """
+        if self.outbox is None:
+            return
+        for thread in (self.uploader, self.outbox_worker):
+            if thread and thread.is_alive() and threading.current_thread() is not thread:
+                thread.join(OUTBOX_CLOSE_TIMEOUT)
+        self.outbox.close()
+
+    def receive_packets(self):
+        """ 
+        Receive UDP packets straight into ring buffer slots, without allocating
+        Blocks until the first packet arrives, then drains whatever else is
+        already waiting in the socket (while there are free slots) and
+        commits the whole batch at once
+        """
+        received_slots = []
+        receive_flags = 0
+        while len(received_slots) < PACKET_BATCH_SIZE:
+            slot_index = self.ring_buffer.acquire_write_slot()
             try:
-                incoming_udp_packet = self.udp_socket.recv(2048)
-                # Get game version -- raises if unknown or not found
-                # Do this for every packet so that we can handle game switches in flight
-                try:
-                    game_version = parse_game_version_from_udp_packet(incoming_udp_packet)
-                except:
-                    game_version = None
-                if game_version == "f12020":
-                    # Only start processor if it's not set yet or has switched
-                    if not self.processor or not isinstance(self.processor, F12020Processor):
-                        log.info("Detected F1 2020 game version, starting F1 2020 processor.")
-                        self.processor = F12020Processor(self.f1laps_api_key, self.telemetry_enabled)
-                elif game_version == "f12021":
-                    if not self.processor or not isinstance(self.processor, F12021Processor):
-                        log.info("Detected F1 2021 game version, starting F1 2021 processor.")
-                        self.processor = F12021Processor(self.f1laps_api_key, self.telemetry_enabled)
-                        # Start Sentry (temporarily for F1 2021)
-                        self.start_sentry()
-                elif game_version == "f12022":
-                    if not self.processor or not isinstance(self.processor, F12022Processor):
-                        log.info("Detected F1 2022 game version, starting F1 2022 processor.")
-                        self.processor = F12022Processor(self.f1laps_api_key, self.telemetry_enabled)
-                        # Start Sentry (only for F1 22)
-                        self.start_sentry()
-                else:
-                    log.info("Unknown packet or game version.")
-                if self.processor:
-                    self.processor.process(incoming_udp_packet)
+                packet_length = self.udp_socket.recv_into(self.ring_buffer.get_slot(slot_index), 0, receive_flags)
+            except BlockingIOError:
+                # No more packets waiting in the socket
+                self.ring_buffer.abort(slot_index)
+                break
             except Exception as ex:
-                log.info("Unknown main receiver exception: %s" % ex)
+                self.ring_buffer.abort(slot_index)
+                log.info("Unknown receiver socket exception: %s" % ex)
                 sentry_sdk.capture_exception(ex)
+                break
+            received_slots.append((slot_index, packet_length))
+            if self.capture_writer:
+                # Copied before the slot is committed, the processing thread may reuse it right after
+                self.capture_writer.record(memoryview(self.ring_buffer.get_slot(slot_index))[:packet_length], time.monotonic_ns())
+            if not RECEIVE_NONBLOCKING_FLAG:
+                break
+            # Commit before the ring is full, so the overflow policy applies to committed packets
+            # instead of the batch's own datagrams all going into the scratch slot
+            if not self.ring_buffer.has_free_slot():
+                break
+            receive_flags = RECEIVE_NONBLOCKING_FLAG
+        if received_slots:
+            self.ring_buffer.commit_batch(received_slots)
+
+    def run_processing(self):
+        """ 
+        Processing thread - drains the ring buffer and processes each packet 
+        Packets are processed straight from their ring buffer slot, which 
+        only gets released after processing is done
+        """
+        log.info("Receiver processing started running")
+        while not self.kill_event.is_set():
+            for slot_index in self.ring_buffer.pop_batch(PACKET_BATCH_SIZE, timeout=PROCESSING_POLL_TIMEOUT):
+                try:
+                    self.process_packet(self.ring_buffer.view(slot_index))
+                finally:
+                    self.ring_buffer.release(slot_index)
+
+    def process_packet(self, incoming_udp_packet):
+        """ Hand a packet to the processor of its game version """
+        self.packet_router.process_packet(incoming_udp_packet)
+
+    @property
+    def processor(self):
+        return self.packet_router.processor
+
+    @processor.setter
+    def processor(self, processor):
+        self.packet_router.processor = processor
+
+    def on_processor_started(self, game_version):
+        # Sentry only runs for F1 22 (and temporarily for F1 2021)
+        if game_version in ("f12021", "f12022"):
+            self.start_sentry()
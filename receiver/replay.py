@@ -0,0 +1,203 @@
+import json
+import time
+import requests
+import logging
+log = logging.getLogger(__name__)
+
+from receiver.api_base import F1LAPS_API_BASE_URL
+from receiver.capture import PacketCaptureReader
+from receiver.http_client import F1LapsHTTPClient, set_http_client
+from receiver.packet_dispatch import PacketRouter
+
+
+# Replay speed that doesn't wait between packets
+REPLAY_SPEED_MAX = None
+
+
+def make_response(status_code, content):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(content).encode("utf-8")
+    return response
+
+
+class UploadSink:
+    """
+    Takes the place of the F1Laps HTTP client during a replay
+    Answers API calls like F1Laps would, without sending anything
+    """
+
+    def __init__(self):
+        self.session_count = 0
+        self.request_counts = {}
+        self.bytes_uploaded = 0
+        self.upload_seconds = 0
+
+    def request_json(self, method, url, payload, headers=None, **kwargs):
+        start_time = time.perf_counter()
+        endpoint = url[len(F1LAPS_API_BASE_URL):] if url.startswith(F1LAPS_API_BASE_URL) else url
+        body = json.dumps(payload)
+        self.store(method, endpoint, body)
+        key = "%s %s" % (method, self.get_endpoint_name(method, endpoint))
+        self.request_counts[key] = self.request_counts.get(key, 0) + 1
+        self.bytes_uploaded += len(body)
+        response = self.get_response(method, endpoint)
+        self.upload_seconds += time.perf_counter() - start_time
+        return response
+
+    def get(self, url, **kwargs):
+        # Session list: replays never find existing sessions
+        return make_response(200, {"results": []})
+
+    def has_capability(self, url, capability):
+        # Answers like F1Laps without optional features
+        return False
+
+    def get_endpoint_name(self, method, endpoint):
+        """ Endpoint without game version and session ID, e.g. grandprixs/sessions/<id>/ """
+        endpoint_name = endpoint.split("/", 1)[-1]
+        if method == "PUT":
+            endpoint_name = endpoint_name.rstrip("/").rsplit("/", 1)[0] + "/<id>/"
+        return endpoint_name
+
+    def store(self, method, endpoint, body):
+        pass
+
+    def get_response(self, method, endpoint):
+        if method == "POST" and "sessions" in endpoint:
+            self.session_count += 1
+            return make_response(201, {"id": "replay-%s" % self.session_count})
+        if method == "POST":
+            return make_response(201, {})
+        return make_response(200, {})
+
+    def get_stats(self):
+        return {
+            "requests": dict(self.request_counts),
+            "bytes_uploaded": self.bytes_uploaded,
+        }
+
+
+class NoopUploadSink(UploadSink):
+    """ Drops all uploads """
+
+
+class FileUploadSink(UploadSink):
+    """ Appends all uploads to a file, one JSON line per request """
+
+    def __init__(self, path):
+        super(FileUploadSink, self).__init__()
+        self.path = path
+        self.file = open(path, "a")
+
+    def store(self, method, endpoint, body):
+        self.file.write('{"method": "%s", "endpoint": %s, "params": %s}\n' % (method, json.dumps(endpoint), body))
+
+    def close(self):
+        self.file.close()
+
+
+class ServerUploadSink(UploadSink):
+    """ Sends all uploads to another server, e.g. a local stand-in of the F1Laps API """
+
+    def __init__(self, base_url):
+        super(ServerUploadSink, self).__init__()
+        self.base_url = base_url
+        self.http_client = F1LapsHTTPClient()
+
+    def request_json(self, method, url, payload, headers=None, **kwargs):
+        start_time = time.perf_counter()
+        response = self.http_client.request_json(method, url.replace(F1LAPS_API_BASE_URL, self.base_url), payload, headers, **kwargs)
+        self.upload_seconds += time.perf_counter() - start_time
+        return response
+
+    def get(self, url, **kwargs):
+        return self.http_client.get(url.replace(F1LAPS_API_BASE_URL, self.base_url), **kwargs)
+
+    def has_capability(self, url, capability):
+        return self.http_client.has_capability(url.replace(F1LAPS_API_BASE_URL, self.base_url), capability)
+
+    def get_stats(self):
+        return self.http_client.get_stats()
+
+    def close(self):
+        self.http_client.close()
+
+
+class CaptureReplay:
+    """
+    Feeds the datagrams of capture files to the processors, like the RaceReceiver does
+
+    speed 1 replays in real time, following the packets' receive timestamps,
+    speed N replays N times as fast and REPLAY_SPEED_MAX doesn't wait at all.
+    F1Laps uploads go to the upload sink instead of F1Laps. They're sent
+    synchronously, so that replays are deterministic.
+    """
+
+    def __init__(self, capture_paths, upload_sink=None, speed=REPLAY_SPEED_MAX, f1laps_api_key="replay", telemetry_enabled=True):
+        self.capture_paths = capture_paths
+        self.upload_sink = upload_sink or NoopUploadSink()
+        self.speed = speed
+        self.packet_router = PacketRouter(f1laps_api_key, telemetry_enabled)
+
+        # Counters
+        self.packet_count = 0
+        self.failed_count = 0
+        self.stage_seconds = {"read": 0, "route": 0, "process": 0}
+        self.total_seconds = 0
+
+    def run(self):
+        """ Replay all capture files; returns the replay stats """
+        previous_http_client = set_http_client(self.upload_sink)
+        start_time = time.perf_counter()
+        try:
+            first_timestamp_ns = None
+            for capture_path in self.capture_paths:
+                first_timestamp_ns = self.replay_file(capture_path, start_time, first_timestamp_ns)
+        finally:
+            self.total_seconds = time.perf_counter() - start_time
+            set_http_client(previous_http_client)
+            self.packet_router.kill_processor()
+        return self.get_stats()
+
+    def replay_file(self, capture_path, start_time, first_timestamp_ns=None):
+        """ Returns the timestamp that the replay's timing is relative to """
+        log.info("Replaying %s" % capture_path)
+        packet_router = self.packet_router
+        stage_seconds = self.stage_seconds
+        read_start_time = time.perf_counter()
+        for timestamp_ns, packet in PacketCaptureReader(capture_path):
+            stage_start_time = time.perf_counter()
+            stage_seconds["read"] += stage_start_time - read_start_time
+            if first_timestamp_ns is None:
+                first_timestamp_ns = timestamp_ns
+            if self.speed:
+                wait_seconds = (timestamp_ns - first_timestamp_ns) / 1e9 / self.speed - (stage_start_time - start_time)
+                if wait_seconds > 0:
+                    time.sleep(wait_seconds)
+                    stage_start_time = time.perf_counter()
+            try:
+                routed_packet = packet_router.route_packet(packet)
+                route_end_time = time.perf_counter()
+                stage_seconds["route"] += route_end_time - stage_start_time
+                if routed_packet:
+                    packet_router.processor.process(packet, *routed_packet)
+                    stage_seconds["process"] += time.perf_counter() - route_end_time
+            except Exception as ex:
+                log.info("Replayed packet %s failed: %s" % (self.packet_count, ex))
+                self.failed_count += 1
+            self.packet_count += 1
+            read_start_time = time.perf_counter()
+        return first_timestamp_ns
+
+    def get_stats(self):
+        """ Packets per second and seconds per stage; processing includes the upload sink's time """
+        upload_seconds = self.upload_sink.upload_seconds
+        return {
+            "packets": self.packet_count,
+            "failed": self.failed_count,
+            "seconds": self.total_seconds,
+            "packets_per_second": self.packet_count / self.total_seconds if self.total_seconds else None,
+            "stage_seconds": dict(self.stage_seconds, process=self.stage_seconds["process"] - upload_seconds, upload=upload_seconds),
+            "uploads": self.upload_sink.get_stats(),
+        }
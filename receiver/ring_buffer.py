@@ -0,0 +1,169 @@
+import threading
+from collections import deque
+import logging
+log = logging.getLogger(__name__)
+
+
+# What to do when a datagram arrives and every slot is taken
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = [OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST]
+
+# F1 games never send datagrams bigger than 2048 bytes
+DEFAULT_SLOT_SIZE = 2048
+# ~4 seconds of the busiest packet mix at 60Hz
+DEFAULT_DEPTH = 2048
+
+
+class PacketRingBuffer:
+    """
+    Preallocated ring of packet buffers shared by the UDP ingest thread
+    and the packet processing thread.
+
+    The ingest side receives straight into a free slot and commits it,
+    the processing side pops committed slots in FIFO order and releases
+    them once it's done. A slow processing stage never blocks the socket:
+    when all slots are taken, the overflow policy decides which packet
+    gets dropped.
+    """
+
+    def __init__(self, depth=DEFAULT_DEPTH, slot_size=DEFAULT_SLOT_SIZE, overflow_policy=OVERFLOW_DROP_OLDEST):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown ring buffer overflow policy %s" % overflow_policy)
+        if depth < 1:
+            raise ValueError("Ring buffer depth needs to be at least 1")
+        self.depth = depth
+        self.slot_size = slot_size
+        self.overflow_policy = overflow_policy
+
+        # Preallocated slots and the number of bytes written into each
+        self.slots = [bytearray(slot_size) for _ in range(depth)]
+        self.slot_lengths = [0] * depth
+        # Views over the slots, so reading a packet only allocates the slice
+        self.slot_views = [memoryview(slot) for slot in self.slots]
+        # Scratch slot used to drain the socket when a packet gets dropped
+        self.scratch_slot = bytearray(slot_size)
+        self.scratch_slot_index = depth
+
+        # Slot bookkeeping
+        # free: slots the ingest thread can write into
+        # pending: committed slots waiting for processing, oldest first
+        # Slots that are in neither list are owned by the reader or writer
+        self.free_slots = list(range(depth - 1, -1, -1))
+        self.pending_slots = deque()
+
+        # Counters
+        self.enqueued_count = 0
+        self.dropped_count = 0
+        self.high_water_mark = 0
+
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        """ Number of packets waiting to be processed """
+        return len(self.pending_slots)
+
+    def acquire_write_slot(self):
+        """
+        Return the index of a slot the ingest thread can receive into
+        Applies the overflow policy if all slots are taken
+        """
+        with self.condition:
+            if self.free_slots:
+                return self.free_slots.pop()
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST and len(self):
+                # Recycle the oldest packet that hasn't been processed yet
+                self.dropped_count += 1
+                return self.pending_slots.popleft()
+            # Drop newest: receive into the scratch slot and throw it away
+            return self.scratch_slot_index
+
+    def has_free_slot(self):
+        """ True if a slot can be acquired without applying the overflow policy """
+        with self.condition:
+            return bool(self.free_slots)
+
+    def get_slot(self, slot_index):
+        """ Return the writable bytearray of a slot """
+        if slot_index == self.scratch_slot_index:
+            return self.scratch_slot
+        return self.slots[slot_index]
+
+    def commit(self, slot_index, length):
+        """ Mark a slot as containing a received packet of the given length """
+        return self.commit_batch([(slot_index, length)]) == 1
+
+    def commit_batch(self, received_slots):
+        """ 
+        Commit a batch of (slot_index, length) tuples in one go
+        Returns the number of packets that got enqueued (i.e. weren't dropped)
+        """
+        committed_count = 0
+        with self.condition:
+            for slot_index, length in received_slots:
+                if slot_index == self.scratch_slot_index:
+                    self.dropped_count += 1
+                    continue
+                self.slot_lengths[slot_index] = length
+                self.pending_slots.append(slot_index)
+                committed_count += 1
+            if committed_count:
+                self.enqueued_count += committed_count
+                pending_count = len(self)
+                if pending_count > self.high_water_mark:
+                    self.high_water_mark = pending_count
+                self.condition.notify()
+        return committed_count
+
+    def abort(self, slot_index):
+        """ Give back a write slot that didn't receive anything (e.g. socket error) """
+        if slot_index == self.scratch_slot_index:
+            return
+        with self.condition:
+            self.free_slots.append(slot_index)
+
+    def pop(self, timeout=None):
+        """
+        Wait for the next packet and return its slot index, or None on timeout
+        The caller owns the slot until it calls release()
+        """
+        slot_indexes = self.pop_batch(1, timeout)
+        return slot_indexes[0] if slot_indexes else None
+
+    def pop_batch(self, max_count, timeout=None):
+        """
+        Wait for packets and return up to max_count slot indexes, oldest first
+        Returns an empty list on timeout
+        """
+        with self.condition:
+            if not len(self):
+                self.condition.wait(timeout)
+            slot_indexes = []
+            while self.pending_slots and len(slot_indexes) < max_count:
+                slot_indexes.append(self.pending_slots.popleft())
+            return slot_indexes
+
+    def view(self, slot_index):
+        """ Return a memoryview of the packet stored in a popped slot """
+        return self.slot_views[slot_index][:self.slot_lengths[slot_index]]
+
+    def release(self, slot_index):
+        """ Give a popped slot back to the ingest thread """
+        with self.condition:
+            self.free_slots.append(slot_index)
+
+    def notify_all(self):
+        """ Wake up any waiting reader, e.g. when shutting down """
+        with self.condition:
+            self.condition.notify_all()
+
+    def get_stats(self):
+        """ Return the ring buffer counters """
+        with self.condition:
+            return {
+                "depth": self.depth,
+                "pending": len(self),
+                "enqueued": self.enqueued_count,
+                "dropped": self.dropped_count,
+                "high_water_mark": self.high_water_mark,
+            }
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+log = logging.getLogger(__name__)
+
+
+# Capability (see receiver.http_client.CAPABILITIES_HEADER) of servers that accept session
+# updates with lap_times_partial, whose lap_times only hold new or changed laps
+# Without it, session updates always send all laps
+CAPABILITY_PARTIAL_LAP_TIMES = "partial-lap-times"
+# Status code such a server responds with to a partial session update
+# when it doesn't have the other laps, e.g. because the session got reset
+FULL_SYNC_REQUIRED_STATUS_CODE = 409
+
+
+class SessionSyncState:
+    """
+    Keeps track of which laps of a session F1Laps acknowledged
+
+    Each lap is identified by a hash of its serialized lap_times dict.
+    Once F1Laps acknowledged a session update, session updates only need
+    to send the laps that are new or whose hash changed since.
+
+    Laps cache their serialized dict until they change (see LapBase.json_serialize),
+    so the hash and payload size of an unchanged lap get computed only once.
+    The counters only count acknowledged syncs, i.e. requests that succeeded.
+    """
+
+    def __init__(self):
+        # {lap number: hash} of the laps F1Laps has
+        self.acknowledged_lap_hashes = {}
+        # {lap number: (lap_times dict, hash, payload bytes)} of the last hashed dict per lap
+        self.lap_fingerprints = {}
+
+        # Counters
+        self.full_sync_count = 0
+        self.delta_sync_count = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+
+    def get_lap_fingerprint(self, lap_time):
+        """ Return the hash and JSON payload size of a lap_times dict """
+        lap_number = lap_time["lap_number"]
+        fingerprint = self.lap_fingerprints.get(lap_number)
+        if fingerprint and fingerprint[0] is lap_time:
+            return fingerprint[1], fingerprint[2]
+        payload = json.dumps(lap_time, sort_keys=True).encode("utf-8")
+        lap_hash = hashlib.sha1(payload).hexdigest()
+        self.lap_fingerprints[lap_number] = (lap_time, lap_hash, len(payload))
+        return lap_hash, len(payload)
+
+    def prepare_sync(self, lap_times, full_sync=False):
+        """
+        Return the lap_times to send and the {lap number: hash} of all laps,
+        which get acknowledged once the update succeeded
+        Unless it's a full sync, laps that F1Laps already has are left out
+        """
+        lap_times_to_send = []
+        lap_hashes = {}
+        for lap_time in lap_times:
+            lap_number = lap_time["lap_number"]
+            lap_hash, _ = self.get_lap_fingerprint(lap_time)
+            lap_hashes[lap_number] = lap_hash
+            if full_sync or self.acknowledged_lap_hashes.get(lap_number) != lap_hash:
+                lap_times_to_send.append(lap_time)
+        return lap_times_to_send, lap_hashes
+
+    def acknowledge(self, lap_hashes, full_sync=False):
+        """ Mark laps as stored in F1Laps, and count the sync that stored them """
+        for lap_number, lap_hash in lap_hashes.items():
+            payload_size = self.lap_fingerprints[lap_number][2]
+            if full_sync or self.acknowledged_lap_hashes.get(lap_number) != lap_hash:
+                self.bytes_sent += payload_size
+            else:
+                self.bytes_saved += payload_size
+        if full_sync:
+            self.full_sync_count += 1
+        else:
+            self.delta_sync_count += 1
+        self.acknowledged_lap_hashes.update(lap_hashes)
+
+    def reset(self):
+        """ Forget what F1Laps has, so that the next sync sends all laps """
+        log.info("Session sync state reset, next sync sends all laps")
+        self.acknowledged_lap_hashes = {}
+
+    def get_stats(self):
+        return {
+            "full_syncs": self.full_sync_count,
+            "delta_syncs": self.delta_sync_count,
+            "acknowledged_laps": len(self.acknowledged_lap_hashes),
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_saved,
+        }
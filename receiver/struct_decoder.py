@@ -0,0 +1,253 @@
+import ctypes
+import struct
+
+
+# struct format characters for the ctypes simple types, by size for integers
+# (ctypes' own type codes like "l" don't have a fixed size)
+SIGNED_INTEGER_CODES = {1: "b", 2: "h", 4: "i", 8: "q"}
+UNSIGNED_INTEGER_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+OTHER_TYPE_CODES = {"f": "f", "d": "d", "?": "?", "c": "c"}
+
+
+class DecodedStruct:
+    """
+    Base class of the generated packet classes
+    Never references the receiver's (reused) packet buffers
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (field_name, getattr(self, field_name)) for field_name in self.__slots__))
+
+
+def get_type_code(simple_type):
+    """ Return the struct format character of a ctypes simple type """
+    ctypes_code = simple_type._type_
+    if ctypes_code in OTHER_TYPE_CODES:
+        return OTHER_TYPE_CODES[ctypes_code]
+    type_codes = UNSIGNED_INTEGER_CODES if ctypes_code.isupper() else SIGNED_INTEGER_CODES
+    type_code = type_codes.get(ctypes.sizeof(simple_type))
+    if not type_code:
+        raise TypeError("Can't generate a decoder for ctypes type %s" % simple_type.__name__)
+    return type_code
+
+
+def is_simple_type(ctypes_type):
+    return isinstance(getattr(ctypes_type, "_type_", None), str)
+
+
+def create_decoded_class(struct_class):
+    """
+    Create a slots class with the field names of a ctypes struct,
+    which borrows the struct's methods and class attributes (e.g. serialize())
+    """
+    field_names = [field[0] for field in struct_class._fields_]
+    attributes = {"__slots__": tuple(field_names), "struct_class": struct_class}
+    for klass in reversed(struct_class.__mro__):
+        if klass is object or klass.__module__ in ("ctypes", "_ctypes"):
+            continue
+        class_field_names = [field[0] for field in klass.__dict__.get("_fields_", [])]
+        for name, value in vars(klass).items():
+            if name.startswith("_") and name.endswith("_"):
+                continue
+            if name in class_field_names or name in field_names:
+                continue
+            attributes[name] = value
+    return type(struct_class.__name__, (DecodedStruct,), attributes)
+
+
+class StructDecoder:
+    """
+    Decoder generated from a ctypes struct's _fields_ definition
+
+    All fields - including nested structs and arrays of simple types - are
+    read with a single precompiled struct.Struct. The generated builder 
+    functions then fill slots objects from the flat tuple of values, so 
+    reading fields later is plain attribute access instead of a ctypes 
+    descriptor call.
+
+    Arrays of structs (the 22-car arrays) become DecodedStructArrays, which
+    decode an element when it's accessed. Unions get decoded per member from
+    the raw bytes, c_char arrays become bytes cut off at the first NUL 
+    (same as ctypes).
+    """
+
+    def __init__(self, struct_class):
+        self.struct_class = struct_class
+        # Generated code for all nested struct classes, keyed by class
+        self.builder_names = {}
+        self.namespace = {"new": object.__new__, "DecodedStructArray": DecodedStructArray}
+        self.source_lines = []
+        self.union_count = 0
+        self.array_count = 0
+        self.has_struct_arrays = False
+
+        struct_format, _, builder_name = self.compile_struct(struct_class)
+        self.struct = struct.Struct("<" + struct_format)
+        if self.struct.size != ctypes.sizeof(struct_class):
+            raise TypeError("Generated decoder for %s has size %s instead of %s" % (
+                struct_class.__name__, self.struct.size, ctypes.sizeof(struct_class)))
+        self.source = "\n".join(self.source_lines)
+        exec(compile(self.source, "<struct decoder %s>" % struct_class.__name__, "exec"), self.namespace)
+        self.build = self.namespace[builder_name]
+        self.size = self.struct.size
+
+    def decode(self, packet, offset=0):
+        """ Decode the struct from a packet buffer, starting at offset """
+        values = self.struct.unpack_from(packet, offset)
+        if self.has_struct_arrays and not isinstance(packet, bytes):
+            # Arrays of structs decode lazily, so they need their own copy of
+            # the packet - the receiver reuses its buffers
+            packet = bytes(packet[offset:offset + self.size])
+            offset = 0
+        return self.build(values, 0, packet, offset)
+
+    def compile_struct(self, struct_class):
+        """
+        Generate the builder function of a struct class (once per class)
+        Returns the struct format, the number of values it unpacks and the builder's name
+        """
+        if struct_class in self.builder_names:
+            return self.builder_names[struct_class]
+        struct_format = ""
+        value_count = 0
+        position = 0
+        lines = []
+        for field in struct_class._fields_:
+            if len(field) != 2:
+                raise TypeError("Can't generate a decoder for bit field %s.%s" % (struct_class.__name__, field[0]))
+            field_name, field_type = field
+            field_offset = getattr(struct_class, field_name).offset
+            if field_offset > position:
+                struct_format += "%dx" % (field_offset - position)
+            field_format, field_value_count, expression = self.compile_field(field_type, value_count, field_offset)
+            struct_format += field_format
+            value_count += field_value_count
+            lines.append("    o.%s = %s" % (field_name, expression))
+            position = field_offset + ctypes.sizeof(field_type)
+        if ctypes.sizeof(struct_class) > position:
+            struct_format += "%dx" % (ctypes.sizeof(struct_class) - position)
+
+        decoded_class_name = "%s_%s" % (struct_class.__name__, len(self.builder_names))
+        builder_name = "build_%s" % decoded_class_name
+        self.namespace[decoded_class_name] = create_decoded_class(struct_class)
+        self.source_lines.append("def %s(v, i, packet, offset):" % builder_name)
+        self.source_lines.append("    o = new(%s)" % decoded_class_name)
+        self.source_lines.extend(lines)
+        self.source_lines.append("    return o")
+        self.source_lines.append("")
+        self.builder_names[struct_class] = (struct_format, value_count, builder_name)
+        return self.builder_names[struct_class]
+
+    def compile_field(self, field_type, value_index, field_offset):
+        """ Return the struct format, value count and builder expression of a field """
+        if is_simple_type(field_type):
+            return get_type_code(field_type), 1, "v[i + %d]" % value_index
+        if issubclass(field_type, ctypes.Union):
+            return "%dx" % ctypes.sizeof(field_type), 0, self.compile_union(field_type, field_offset)
+        if issubclass(field_type, ctypes.Structure):
+            struct_format, value_count, builder_name = self.compile_struct(field_type)
+            return struct_format, value_count, "%s(v, i + %d, packet, offset + %d)" % (builder_name, value_index, field_offset)
+        if issubclass(field_type, ctypes.Array):
+            return self.compile_array(field_type, value_index, field_offset)
+        raise TypeError("Can't generate a decoder for ctypes type %s" % field_type.__name__)
+
+    def compile_array(self, array_type, value_index, field_offset):
+        element_type = array_type._type_
+        length = array_type._length_
+        if element_type is ctypes.c_char:
+            # Same as ctypes: c_char arrays are bytes up to the first NUL
+            return "%ds" % length, 1, "v[i + %d].split(b'\\x00', 1)[0]" % value_index
+        if is_simple_type(element_type):
+            return "%d%s" % (length, get_type_code(element_type)), length, \
+                "v[i + %d:i + %d]" % (value_index, value_index + length)
+        if issubclass(element_type, ctypes.Structure):
+            # Per-car arrays are usually only read for one car, so their elements get decoded on access
+            self.has_struct_arrays = True
+            decoder_name = "array_%s" % self.array_count
+            self.array_count += 1
+            self.namespace[decoder_name] = StructDecoder(element_type)
+            return "%dx" % ctypes.sizeof(array_type), 0, \
+                "DecodedStructArray(packet, offset + %d, %s, %d)" % (field_offset, decoder_name, length)
+        raise TypeError("Can't generate a decoder for array type %s" % array_type.__name__)
+
+    def compile_union(self, union_type, field_offset):
+        """ Unions can't be read from the flat tuple; each member gets its own decoder """
+        member_decoders = {}
+        for field_name, field_type in union_type._fields_:
+            if is_simple_type(field_type):
+                member_decoders[field_name] = SimpleValueDecoder(field_type)
+            else:
+                member_decoders[field_name] = StructDecoder(field_type)
+        decoder_name = "union_%s" % self.union_count
+        self.union_count += 1
+        self.namespace[decoder_name] = UnionDecoder(union_type, member_decoders)
+        return "%s.decode(packet, offset + %d)" % (decoder_name, field_offset)
+
+
+class DecodedStructArray:
+    """ Sequence of structs that get decoded on access """
+    __slots__ = ("packet", "offset", "element_decoder", "length")
+
+    def __init__(self, packet, offset, element_decoder, length):
+        self.packet = packet
+        self.offset = offset
+        self.element_decoder = element_decoder
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[element_index] for element_index in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("invalid index")
+        return self.element_decoder.decode(self.packet, self.offset + index * self.element_decoder.size)
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def __repr__(self):
+        return "[%s]" % ", ".join(repr(element) for element in self)
+
+
+class SimpleValueDecoder:
+    """ Decodes a single ctypes simple value, used for union members """
+    def __init__(self, simple_type):
+        self.struct = struct.Struct("<" + get_type_code(simple_type))
+
+    def decode(self, packet, offset=0):
+        return self.struct.unpack_from(packet, offset)[0]
+
+
+class UnionDecoder:
+    """ Decodes every member of a union from the same bytes """
+    def __init__(self, union_type, member_decoders):
+        self.decoded_class = create_decoded_class(union_type)
+        self.member_decoders = list(member_decoders.items())
+
+    def decode(self, packet, offset=0):
+        decoded_union = object.__new__(self.decoded_class)
+        for field_name, member_decoder in self.member_decoders:
+            setattr(decoded_union, field_name, member_decoder.decode(packet, offset))
+        return decoded_union
+
+
+# Generated decoders by packet class, see get_struct_decoder()
+struct_decoders = {}
+
+
+def get_struct_decoder(packet_type):
+    """ 
+    Return the StructDecoder of a packet class
+    Decoders get generated on first use, so nothing is generated unless a processor uses them
+    """
+    decoder = struct_decoders.get(packet_type)
+    if decoder is None:
+        decoder = struct_decoders[packet_type] = StructDecoder(packet_type)
+    return decoder
@@ -5,28 +5,12 @@ THIS IS AN OLD FILE THAT IS ONLY USED BY F12021 and F12022
 import logging
 log = logging.getLogger(__name__)
 
+from receiver.telemetry_channels import DEFAULT_TELEMETRY_SCHEMA
 
-KEY_INDEX_MAP = {
-    "lap_distance": 0,
-    "lap_time"    : 1,
-    "speed"       : 2,
-    "brake"       : 3,
-    "throttle"    : 4,
-    "gear"        : 5,
-    "steer"       : 6,
-    "drs"         : 7,
-}
-
-KEY_ROUND_MAP = {
-    "lap_distance": 2,
-    "lap_time"    : 0,
-    "speed"       : 0,
-    "brake"       : 3,
-    "throttle"    : 3,
-    "gear"        : 0,
-    "steer"       : 3,
-    "drs"         : 0,
-}
+
+# Frame values of the default telemetry channels
+KEY_INDEX_MAP = DEFAULT_TELEMETRY_SCHEMA.key_index_map
+KEY_ROUND_MAP = DEFAULT_TELEMETRY_SCHEMA.key_round_map
 
 
 class TelemetryLapBase:
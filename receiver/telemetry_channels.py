@@ -0,0 +1,123 @@
+from receiver.telemetry_frame_store import TelemetryFrameStore
+
+
+# Packets that telemetry channel values come from
+# (the packet_type of the serialized packet, except for the lap packet values,
+# which the processor passes to the lap with its own keys)
+SOURCE_LAP = "lap"
+SOURCE_TELEMETRY = "telemetry"
+SOURCE_CAR_STATUS = "car_status"
+SOURCE_MOTION = "motion"
+
+# Channels the lap telemetry logic relies on
+REQUIRED_CHANNEL_KEYS = ["lap_distance"]
+
+
+class TelemetryChannel:
+    """
+    A value that's stored per telemetry frame
+    key: name of the channel
+    source: packet the value comes from (one of the SOURCE_ constants)
+    source_field: key of the value in the serialized packet
+    typecode: array typecode of the channel's frame store column
+    decimal_points: values get rounded to this
+    enabled: disabled channels aren't stored (nor uploaded)
+    step_hold: resampling keeps the last value instead of interpolating
+    """
+    def __init__(self, key, source, typecode, decimal_points, source_field=None, enabled=True, step_hold=False):
+        self.key = key
+        self.source = source
+        self.source_field = source_field or key
+        self.typecode = typecode
+        self.decimal_points = decimal_points
+        self.enabled = enabled
+        self.step_hold = step_hold
+
+    def __repr__(self):
+        return "TelemetryChannel(%s)" % self.key
+
+
+# All known channels, in frame value order
+# The enabled channels make up the F1Laps telemetry payload, so new channels are disabled by default
+TELEMETRY_CHANNELS = [
+    TelemetryChannel("lap_distance", SOURCE_LAP, "f", 2),
+    TelemetryChannel("lap_time", SOURCE_LAP, "i", 0),
+    TelemetryChannel("speed", SOURCE_TELEMETRY, "h", 0),
+    TelemetryChannel("brake", SOURCE_TELEMETRY, "f", 3),
+    TelemetryChannel("throttle", SOURCE_TELEMETRY, "f", 3),
+    TelemetryChannel("gear", SOURCE_TELEMETRY, "b", 0, step_hold=True),
+    TelemetryChannel("steer", SOURCE_TELEMETRY, "f", 3),
+    TelemetryChannel("drs", SOURCE_TELEMETRY, "b", 0, step_hold=True),
+    TelemetryChannel("engine_rpm", SOURCE_TELEMETRY, "H", 0, enabled=False),
+    TelemetryChannel("tyre_front_left_temp_surface", SOURCE_TELEMETRY, "B", 0, "tyre_front_left_temp_max_surface", enabled=False),
+    TelemetryChannel("tyre_front_right_temp_surface", SOURCE_TELEMETRY, "B", 0, "tyre_front_right_temp_max_surface", enabled=False),
+    TelemetryChannel("tyre_rear_left_temp_surface", SOURCE_TELEMETRY, "B", 0, "tyre_rear_left_temp_max_surface", enabled=False),
+    TelemetryChannel("tyre_rear_right_temp_surface", SOURCE_TELEMETRY, "B", 0, "tyre_rear_right_temp_max_surface", enabled=False),
+    TelemetryChannel("brake_front_left_temp", SOURCE_TELEMETRY, "H", 0, enabled=False),
+    TelemetryChannel("brake_front_right_temp", SOURCE_TELEMETRY, "H", 0, enabled=False),
+    TelemetryChannel("brake_rear_left_temp", SOURCE_TELEMETRY, "H", 0, enabled=False),
+    TelemetryChannel("brake_rear_right_temp", SOURCE_TELEMETRY, "H", 0, enabled=False),
+    TelemetryChannel("ers_store_energy", SOURCE_CAR_STATUS, "i", 0, enabled=False),
+    TelemetryChannel("g_force_lateral", SOURCE_MOTION, "f", 3, enabled=False),
+    TelemetryChannel("g_force_longitudinal", SOURCE_MOTION, "f", 3, enabled=False),
+    TelemetryChannel("g_force_vertical", SOURCE_MOTION, "f", 3, enabled=False),
+]
+
+
+class TelemetryChannelSchema:
+    """
+    The enabled telemetry channels and everything derived from them
+
+    Extractors are precomputed per source packet: a tuple of
+    (source field, column index, decimal points) of the enabled channels
+    of that packet. Updating a frame only loops over these, so disabled
+    channels cost nothing per frame.
+    """
+
+    def __init__(self, channels=TELEMETRY_CHANNELS, enabled_keys=None):
+        if enabled_keys is None:
+            self.channels = [channel for channel in channels if channel.enabled]
+        else:
+            unknown_keys = set(enabled_keys) - set(channel.key for channel in channels)
+            if unknown_keys:
+                raise ValueError("Unknown telemetry channels %s" % ", ".join(sorted(unknown_keys)))
+            self.channels = [channel for channel in channels if channel.key in enabled_keys]
+        missing_keys = set(REQUIRED_CHANNEL_KEYS) - set(channel.key for channel in self.channels)
+        if missing_keys:
+            raise ValueError("Telemetry channels %s can't be disabled" % ", ".join(sorted(missing_keys)))
+
+        self.key_index_map = {channel.key: index for index, channel in enumerate(self.channels)}
+        self.key_round_map = {channel.key: channel.decimal_points for channel in self.channels}
+        self.key_typecode_map = {channel.key: channel.typecode for channel in self.channels}
+        self.step_hold_columns = [index for index, channel in enumerate(self.channels) if channel.step_hold]
+
+        self.extractors = {}
+        for index, channel in enumerate(self.channels):
+            self.extractors.setdefault(channel.source, []).append((channel.source_field, index, channel.decimal_points))
+        self.extractors = {source: tuple(extractor) for source, extractor in self.extractors.items()}
+        # For values of unknown source, check all channels
+        self.all_channels_extractor = tuple(
+            (channel.source_field, index, channel.decimal_points) for index, channel in enumerate(self.channels))
+
+    def __len__(self):
+        return len(self.channels)
+
+    def get_extractor(self, source=None):
+        """ Return the (source field, column index, decimal points) tuples of a source packet """
+        if source is None:
+            return self.all_channels_extractor
+        return self.extractors.get(source, ())
+
+    def has_source(self, source):
+        """ Check if any enabled channel comes from a source packet """
+        return source in self.extractors
+
+    def create_frame_store(self):
+        return TelemetryFrameStore(
+            [channel.typecode for channel in self.channels],
+            [channel.decimal_points for channel in self.channels]
+        )
+
+
+# The channels that are enabled by default
+DEFAULT_TELEMETRY_SCHEMA = TelemetryChannelSchema()
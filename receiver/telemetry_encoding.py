@@ -0,0 +1,238 @@
+import base64
+import json
+import struct
+import sys
+import zlib
+from array import array
+
+
+# Telemetry payload encodings
+# json: the {frame id: [values]} dict as JSON text (default)
+# delta_zlib_v1: quantized, delta-encoded fixed-width integers, zlib compressed and base64 encoded
+TELEMETRY_ENCODING_JSON = "json"
+TELEMETRY_ENCODING_DELTA_ZLIB = "delta_zlib_v1"
+TELEMETRY_ENCODINGS = [TELEMETRY_ENCODING_JSON, TELEMETRY_ENCODING_DELTA_ZLIB]
+
+# Binary format version, frame count and column count
+PAYLOAD_HEADER_STRUCT = struct.Struct("<BIB")
+PAYLOAD_VERSION = 1
+# Per column: decimal points, presence flag and integer typecode
+COLUMN_HEADER_STRUCT = struct.Struct("<BBc")
+# Presence flags
+ALL_VALUES_PRESENT = 0
+PRESENCE_BITMAP = 1
+# Smallest unsigned typecode first
+UNSIGNED_TYPECODES = "BHIQ"
+ZLIB_LEVEL = 6
+
+
+def zigzag(value):
+    """ Map signed to unsigned ints, so that small negative deltas stay small """
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def pack_deltas(values):
+    """ Delta-encode a list of ints and pack them into the smallest fixed-width typecode """
+    deltas = []
+    previous_value = 0
+    for value in values:
+        deltas.append(zigzag(value - previous_value))
+        previous_value = value
+    max_delta = max(deltas) if deltas else 0
+    for typecode in UNSIGNED_TYPECODES:
+        if max_delta < 1 << (array(typecode).itemsize * 8):
+            packed = array(typecode, deltas)
+            if sys.byteorder == "big":
+                packed.byteswap()
+            return typecode, packed.tobytes()
+    raise ValueError("Telemetry delta %s doesn't fit in 64 bits" % max_delta)
+
+
+def unpack_deltas(typecode, data, offset, count):
+    """ Return the delta-decoded ints and the offset after them """
+    packed = array(typecode)
+    end = offset + count * packed.itemsize
+    packed.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        packed.byteswap()
+    values = []
+    value = 0
+    for delta in packed:
+        value += unzigzag(delta)
+        values.append(value)
+    return values, end
+
+
+def encode_frame_store(frame_store, encoding=TELEMETRY_ENCODING_JSON):
+    """ Encode the frames of a TelemetryFrameStore as a telemetry payload string """
+    if encoding == TELEMETRY_ENCODING_JSON:
+        return json.dumps(frame_store.to_dict())
+    if encoding == TELEMETRY_ENCODING_DELTA_ZLIB:
+        return encode_delta_zlib(frame_store)
+    raise ValueError("Unknown telemetry encoding %s" % encoding)
+
+
+def encode_delta_zlib(frame_store):
+    """
+    Column by column, each channel gets quantized to an int with its decimal points,
+    delta-encoded against the previous frame and packed as fixed-width ints.
+    Unset values are left out and marked in a presence bitmap.
+    """
+    frame_ids = frame_store.frame_ids
+    frame_count = len(frame_ids)
+    chunks = [PAYLOAD_HEADER_STRUCT.pack(PAYLOAD_VERSION, frame_count, frame_store.column_count)]
+    typecode, packed = pack_deltas(frame_ids)
+    chunks.append(typecode.encode())
+    chunks.append(packed)
+
+    present_masks = frame_store.present_masks
+    for column_index, column in enumerate(frame_store.columns):
+        decimal_points = frame_store.column_decimal_points[column_index]
+        scale = 10 ** decimal_points
+        bit = 1 << column_index
+        bitmap = bytearray((frame_count + 7) // 8)
+        quantized_values = []
+        for row in range(frame_count):
+            if present_masks[row] & bit:
+                bitmap[row >> 3] |= 1 << (row & 7)
+                quantized_values.append(round(column[row] * scale))
+        presence = ALL_VALUES_PRESENT if len(quantized_values) == frame_count else PRESENCE_BITMAP
+        typecode, packed = pack_deltas(quantized_values)
+        chunks.append(COLUMN_HEADER_STRUCT.pack(decimal_points, presence, typecode.encode()))
+        if presence == PRESENCE_BITMAP:
+            chunks.append(bytes(bitmap))
+        chunks.append(packed)
+
+    compressed = zlib.compress(b"".join(chunks), ZLIB_LEVEL)
+    return base64.b64encode(compressed).decode("ascii")
+
+
+def decode_telemetry_string(telemetry_string, encoding=TELEMETRY_ENCODING_JSON):
+    """
+    Decode a telemetry payload string back to {frame id: [values]}
+    Values of the delta_zlib encoding come back quantized: ints for channels
+    without decimal points, floats for the others
+    """
+    if encoding == TELEMETRY_ENCODING_JSON:
+        return {int(frame_id): values for frame_id, values in json.loads(telemetry_string).items()}
+    if encoding == TELEMETRY_ENCODING_DELTA_ZLIB:
+        return decode_delta_zlib(telemetry_string)
+    raise ValueError("Unknown telemetry encoding %s" % encoding)
+
+
+def decode_delta_zlib(telemetry_string):
+    data = zlib.decompress(base64.b64decode(telemetry_string))
+    version, frame_count, column_count = PAYLOAD_HEADER_STRUCT.unpack_from(data, 0)
+    if version != PAYLOAD_VERSION:
+        raise ValueError("Unknown telemetry payload version %s" % version)
+    offset = PAYLOAD_HEADER_STRUCT.size
+    typecode = data[offset:offset + 1].decode()
+    frame_ids, offset = unpack_deltas(typecode, data, offset + 1, frame_count)
+    frames = [[None] * column_count for _ in range(frame_count)]
+
+    for column_index in range(column_count):
+        decimal_points, presence, typecode = COLUMN_HEADER_STRUCT.unpack_from(data, offset)
+        offset += COLUMN_HEADER_STRUCT.size
+        if presence == PRESENCE_BITMAP:
+            bitmap = data[offset:offset + (frame_count + 7) // 8]
+            offset += len(bitmap)
+            rows = [row for row in range(frame_count) if bitmap[row >> 3] & (1 << (row & 7))]
+        else:
+            rows = range(frame_count)
+        values, offset = unpack_deltas(typecode.decode(), data, offset, len(rows))
+        for row, value in zip(rows, values):
+            frames[row][column_index] = round(value / 10 ** decimal_points, decimal_points) if decimal_points else value
+    return dict(zip(frame_ids, frames))
+
+
+class IncrementalJSONEncoder:
+    """
+    Encodes the frames of a TelemetryFrameStore to JSON while the lap is driven
+
+    Frames that are more than stable_frame_window frames older than the newest
+    frame get encoded as they come in, so that finishing the lap only encodes
+    the last few frames. The encoded frames are the first rows of the frame 
+    store - whenever a row gets changed, it and all rows after it must be
+    invalidated. get_string() is identical to json.dumps(frame_store.to_dict()).
+
+    The encoded frames are kept in one buffer, with the end offset of each 
+    frame, so that they don't take more memory than the JSON itself. Once
+    get_string() encoded all frames, the buffer is released and only the 
+    returned string is kept (the lap's serialized payload holds the same 
+    string), until frames change again.
+    """
+
+    def __init__(self, frame_store, stable_frame_window):
+        self.frame_store = frame_store
+        self.stable_frame_window = stable_frame_window
+        self.reset()
+
+    def reset(self):
+        """ Drop all encoded frames, e.g. when the frame store got cleared """
+        self.buffer = bytearray()
+        # JSON of all encoded frames, instead of the buffer (see get_string)
+        self.string = None
+        self.frame_end_offsets = array("I")
+
+    def __len__(self):
+        """ Number of encoded frames """
+        return len(self.frame_end_offsets)
+
+    def get_memory_size(self):
+        encoded_size = len(self.string) if self.string is not None else len(self.buffer)
+        return encoded_size + len(self.frame_end_offsets) * self.frame_end_offsets.itemsize
+
+    def get_buffer(self, end_offset=None):
+        """ Return the buffer, brought back from the string if get_string() released it """
+        if self.buffer is None:
+            # The string is the buffer in braces
+            self.buffer = bytearray(self.string[1:-1 if end_offset is None else end_offset + 1].encode("ascii"))
+            self.string = None
+        return self.buffer
+
+    def invalidate_from(self, row):
+        """ Drop the encoded frames of a row and all rows after it """
+        if row < len(self.frame_end_offsets):
+            end_offset = self.frame_end_offsets[row - 1] if row else 0
+            del self.get_buffer(end_offset)[end_offset:]
+            del self.frame_end_offsets[row:]
+
+    def encode_row(self, row):
+        return '"%s": %s' % (self.frame_store.frame_ids[row], json.dumps(self.frame_store.get_frame_values(row)))
+
+    def encode_rows(self, row_count):
+        """ Encode the rows after the encoded rows, up to row_count rows """
+        buffer = self.get_buffer()
+        for row in range(len(self.frame_end_offsets), row_count):
+            if row:
+                buffer += b", "
+            # json.dumps() escapes non-ASCII characters, so this is always ASCII
+            buffer += self.encode_row(row).encode("ascii")
+            self.frame_end_offsets.append(len(buffer))
+
+    def encode_stable_frames(self):
+        """ Encode the frames that are far enough behind the newest frame """
+        frame_ids = self.frame_store.frame_ids
+        if not frame_ids:
+            return
+        stable_frame_id = frame_ids[-1] - self.stable_frame_window
+        row_count = len(self.frame_end_offsets)
+        while row_count < len(frame_ids) and frame_ids[row_count] <= stable_frame_id:
+            row_count += 1
+        if row_count > len(self.frame_end_offsets):
+            self.encode_rows(row_count)
+
+    def get_string(self):
+        """ 
+        Return the JSON of all frames, encoding only the frames that aren't encoded yet
+        Keeps the string instead of the buffer, so the JSON is only held once
+        """
+        if self.string is None or len(self.frame_end_offsets) < len(self.frame_store):
+            self.encode_rows(len(self.frame_store))
+            self.string = "{%s}" % self.buffer.decode("ascii")
+            self.buffer = None
+        return self.string
@@ -0,0 +1,199 @@
+from array import array
+from bisect import bisect_left
+import logging
+log = logging.getLogger(__name__)
+
+
+INTEGER_TYPECODES = "bBhHiIlLqQ"
+# Typecode of the frame id column - frame identifiers are uint32 in the UDP spec
+FRAME_ID_TYPECODE = "I"
+
+
+def get_mask_typecode(column_count):
+    """ Smallest array typecode that has a bit for each column """
+    for typecode in "BHIQ":
+        if array(typecode).itemsize * 8 >= column_count:
+            return typecode
+    raise ValueError("Telemetry frame store supports at most 64 columns")
+
+
+class TelemetryFrameStore:
+    """
+    Columnar storage of telemetry frames
+
+    Each channel is a typed array column, with a parallel frame id column
+    sorted by frame id. Two bitmask columns keep track of which values are
+    set (unset values are None) and which values were ints, so that frames
+    come back exactly as they were stored - and json.dumps() of to_dict()
+    is identical to the old dict of lists.
+
+    Float values are stored rounded to the column's decimal points. If a
+    value doesn't survive the round-trip through the column's typecode
+    (e.g. it overflows), the column gets upgraded to double precision.
+    """
+
+    def __init__(self, column_typecodes, column_decimal_points):
+        self.column_typecodes = list(column_typecodes)
+        self.column_decimal_points = list(column_decimal_points)
+        self.column_count = len(self.column_typecodes)
+        self.mask_typecode = get_mask_typecode(self.column_count)
+        self.clear()
+
+    def clear(self):
+        """ Remove all frames """
+        self.frame_ids = array(FRAME_ID_TYPECODE)
+        self.columns = [array(typecode) for typecode in self.column_typecodes]
+        self.present_masks = array(self.mask_typecode)
+        self.int_masks = array(self.mask_typecode)
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def get_memory_size(self):
+        """ Bytes used by the frame values (without the array object overhead) """
+        arrays = [self.frame_ids, self.present_masks, self.int_masks] + self.columns
+        return sum(len(values) * values.itemsize for values in arrays)
+
+    def __contains__(self, frame_id):
+        return self.find_row(frame_id) is not None
+
+    def find_row(self, frame_id):
+        """ Return the row index of a frame id, or None """
+        frame_ids = self.frame_ids
+        if frame_ids and frame_ids[-1] == frame_id:
+            # Fast path: frames mostly get updated in the order they arrive
+            return len(frame_ids) - 1
+        row = bisect_left(frame_ids, frame_id)
+        if row < len(frame_ids) and frame_ids[row] == frame_id:
+            return row
+        return None
+
+    def get_or_create_row(self, frame_id):
+        """ Return the row index of a frame id, adding an empty frame if it doesn't exist """
+        frame_ids = self.frame_ids
+        if not frame_ids or frame_ids[-1] < frame_id:
+            row = len(frame_ids)
+            frame_ids.append(frame_id)
+            for column in self.columns:
+                column.append(0)
+            self.present_masks.append(0)
+            self.int_masks.append(0)
+            return row
+        row = bisect_left(frame_ids, frame_id)
+        if frame_ids[row] != frame_id:
+            # Out of order frame
+            frame_ids.insert(row, frame_id)
+            for column in self.columns:
+                column.insert(row, 0)
+            self.present_masks.insert(row, 0)
+            self.int_masks.insert(row, 0)
+        return row
+
+    def set_value(self, row, column_index, value):
+        """ Set a (rounded) value of a frame """
+        bit = 1 << column_index
+        if value is None:
+            self.present_masks[row] &= ~bit
+            return
+        column = self.columns[column_index]
+        is_int = isinstance(value, int)
+        stored_value = value
+        if column.typecode in INTEGER_TYPECODES and not is_int:
+            stored_value = int(value) if value.is_integer() else None
+        try:
+            if stored_value is None:
+                raise TypeError("Can't store %s in an integer column" % value)
+            column[row] = stored_value
+            if not is_int and column.typecode == "f" and \
+               round(column[row], self.column_decimal_points[column_index]) != value:
+                raise OverflowError("%s loses precision as float" % value)
+        except (OverflowError, TypeError, ValueError):
+            column = self.upgrade_column(column_index)
+            column[row] = value
+        self.present_masks[row] |= bit
+        if is_int:
+            self.int_masks[row] |= bit
+        else:
+            self.int_masks[row] &= ~bit
+
+    def upgrade_column(self, column_index):
+        """ Switch a column to double precision floats """
+        log.debug("Upgrading telemetry column %s from typecode %s to d" % (column_index, self.columns[column_index].typecode))
+        self.columns[column_index] = array("d", self.columns[column_index])
+        return self.columns[column_index]
+
+    def get_value(self, row, column_index):
+        """ Return a value of a frame as it was stored """
+        bit = 1 << column_index
+        if not self.present_masks[row] & bit:
+            return None
+        value = self.columns[column_index][row]
+        if self.int_masks[row] & bit:
+            return int(value)
+        if self.columns[column_index].typecode == "f":
+            # Undo float32 noise
+            return round(value, self.column_decimal_points[column_index])
+        return float(value)
+
+    def get_frame_values(self, row):
+        """ Return all values of a frame as a list """
+        return [self.get_value(row, column_index) for column_index in range(self.column_count)]
+
+    def add_frame(self, frame_id, values):
+        """ Add or overwrite a frame from a list of values """
+        row = self.get_or_create_row(frame_id)
+        for column_index, value in enumerate(values):
+            self.set_value(row, column_index, value)
+        return row
+
+    def remove_row(self, row):
+        del self.frame_ids[row]
+        for column in self.columns:
+            del column[row]
+        del self.present_masks[row]
+        del self.int_masks[row]
+
+    def remove(self, frame_id):
+        """ Remove a frame; returns False if it didn't exist """
+        row = self.find_row(frame_id)
+        if row is None:
+            return False
+        self.remove_row(row)
+        return True
+
+    def truncate_from(self, frame_id):
+        """ Remove all frames with a frame id >= frame_id; returns the number of removed frames """
+        row = bisect_left(self.frame_ids, frame_id)
+        removed_count = len(self.frame_ids) - row
+        if removed_count:
+            del self.frame_ids[row:]
+            for column in self.columns:
+                del column[row:]
+            del self.present_masks[row:]
+            del self.int_masks[row:]
+        return removed_count
+
+    def keep_only(self, frame_id):
+        """ Remove all frames except the given one """
+        row = self.find_row(frame_id)
+        if row is None:
+            self.clear()
+            return
+        values = self.get_frame_values(row)
+        self.clear()
+        self.add_frame(frame_id, values)
+
+    def get_first_frame_id(self):
+        return self.frame_ids[0] if self.frame_ids else None
+
+    def get_last_frame_id(self):
+        return self.frame_ids[-1] if self.frame_ids else None
+
+    def items(self):
+        """ Iterate over (frame id, values list) in frame id order """
+        for row, frame_id in enumerate(self.frame_ids):
+            yield frame_id, self.get_frame_values(row)
+
+    def to_dict(self):
+        """ Materialize the frames as {frame id: [values]} """
+        return dict(self.items())
@@ -0,0 +1,92 @@
+import math
+
+from receiver.telemetry_frame_store import TelemetryFrameStore
+
+
+# Default distance between two resampled frames, in meters
+DEFAULT_DISTANCE_STEP = 2
+
+
+def get_distance_samples(frame_store, distance_column):
+    """
+    Return the rows and distances of the frames that can be resampled:
+    frames with a lap distance that's bigger than the previous frame's
+    (pauses repeat a distance, the pre line cross has negative distances)
+    """
+    rows = []
+    distances = []
+    last_distance = -math.inf
+    for row in range(len(frame_store)):
+        distance = frame_store.get_value(row, distance_column)
+        if distance is None or distance < 0 or distance <= last_distance:
+            continue
+        rows.append(row)
+        distances.append(distance)
+        last_distance = distance
+    return rows, distances
+
+
+def interpolate(sample_distances, sample_values, grid_distances, step_hold=False):
+    """
+    Interpolate values at sorted grid distances in one pass over both sequences
+    Grid distances outside the samples get the first or last value
+    step_hold keeps the last sample's value instead of interpolating (e.g. for gears)
+    """
+    sample_count = len(sample_distances)
+    values = []
+    index = 0
+    for grid_distance in grid_distances:
+        while index < sample_count - 1 and sample_distances[index + 1] <= grid_distance:
+            index += 1
+        distance = sample_distances[index]
+        if grid_distance <= distance or index == sample_count - 1 or step_hold:
+            values.append(sample_values[index])
+            continue
+        next_distance = sample_distances[index + 1]
+        weight = (grid_distance - distance) / (next_distance - distance)
+        values.append(sample_values[index] + (sample_values[index + 1] - sample_values[index]) * weight)
+    return values
+
+
+def resample_by_distance(frame_store, distance_column, step_hold_columns=(), distance_step=DEFAULT_DISTANCE_STEP):
+    """
+    Resample the frames of a TelemetryFrameStore to a fixed lap distance grid
+
+    Returns a new TelemetryFrameStore with the same columns, whose frame ids are
+    the grid indexes: frame i is at lap distance i * distance_step. So laps of
+    the same track have the same frames, regardless of the game's send rate,
+    pauses or flashbacks. Columns are linearly interpolated, except for
+    step_hold_columns, which keep the value of the last frame before.
+    """
+    if distance_step <= 0:
+        raise ValueError("Distance step needs to be positive")
+    resampled_store = TelemetryFrameStore(frame_store.column_typecodes, frame_store.column_decimal_points)
+    rows, distances = get_distance_samples(frame_store, distance_column)
+    if not rows:
+        return resampled_store
+    first_index = math.ceil(distances[0] / distance_step)
+    last_index = math.floor(distances[-1] / distance_step)
+    grid_indexes = range(first_index, last_index + 1)
+    grid_distances = [grid_index * distance_step for grid_index in grid_indexes]
+    for grid_index in grid_indexes:
+        resampled_store.get_or_create_row(grid_index)
+
+    for column_index in range(frame_store.column_count):
+        decimal_points = frame_store.column_decimal_points[column_index]
+        if column_index == distance_column:
+            values = grid_distances
+        else:
+            sample_distances = []
+            sample_values = []
+            for row, distance in zip(rows, distances):
+                value = frame_store.get_value(row, column_index)
+                if value is not None:
+                    sample_distances.append(distance)
+                    sample_values.append(value)
+            if not sample_values:
+                continue
+            values = interpolate(sample_distances, sample_values, grid_distances, column_index in step_hold_columns)
+        for row, value in enumerate(values):
+            # round() without decimal points returns an int
+            resampled_store.set_value(row, column_index, round(value, decimal_points) if decimal_points else round(value))
+    return resampled_store
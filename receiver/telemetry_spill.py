@@ -0,0 +1,114 @@
+import mmap
+import tempfile
+import logging
+log = logging.getLogger(__name__)
+
+
+# Laps keep their telemetry in memory until all laps together use more than this
+DEFAULT_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+# Laps that are this many laps behind the current lap get spilled, even if they weren't uploaded
+DEFAULT_MAX_LAPS_IN_MEMORY = 5
+
+
+class TelemetrySpillFile:
+    """
+    Append-only temporary file holding the telemetry JSON of spilled laps
+    Segments are read back through a memory map of the file
+    """
+
+    def __init__(self):
+        self.file = None
+        self.size = 0
+        self.map = None
+
+    def append(self, telemetry_string):
+        """ Write a telemetry string and return its SpilledTelemetry segment """
+        if self.file is None:
+            # Deleted by the OS once it's closed
+            self.file = tempfile.TemporaryFile(prefix="f1laps_telemetry_")
+        data = telemetry_string.encode("utf-8")
+        self.file.seek(self.size)
+        self.file.write(data)
+        self.file.flush()
+        spilled_telemetry = SpilledTelemetry(self, self.size, len(data))
+        self.size += len(data)
+        return spilled_telemetry
+
+    def read(self, offset, length):
+        """ Return the telemetry string of a segment """
+        if self.map is None or len(self.map) < offset + length:
+            # The file grew since it was mapped
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length].decode("utf-8")
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.size = 0
+
+
+class SpilledTelemetry:
+    """ Location of a lap's telemetry JSON in the spill file """
+
+    def __init__(self, spill_file, offset, length):
+        self.spill_file = spill_file
+        self.offset = offset
+        self.length = length
+
+    def read(self):
+        return self.spill_file.read(self.offset, self.length)
+
+
+class TelemetrySpillPolicy:
+    """
+    Decides when the telemetry of completed laps moves from memory to disk
+
+    Laps become spillable once they got uploaded to F1Laps, or once they're
+    more than max_laps_in_memory laps behind the current lap. Spillable laps
+    get spilled, oldest first, as long as all laps together use more telemetry
+    memory (frames and cached serialized telemetry, see LapBase.get_memory_size)
+    than the memory budget. The current lap is never spilled.
+    """
+
+    def __init__(self, memory_budget_bytes=DEFAULT_MEMORY_BUDGET_BYTES, max_laps_in_memory=DEFAULT_MAX_LAPS_IN_MEMORY):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_laps_in_memory = max_laps_in_memory
+        self.spill_file = TelemetrySpillFile()
+        self.spilled_lap_count = 0
+
+    def is_spillable(self, lap, current_lap_number):
+        if lap.lap_number >= current_lap_number or not lap.telemetry:
+            return False
+        if lap.has_been_uploaded:
+            return True
+        return self.max_laps_in_memory is not None and lap.lap_number <= current_lap_number - self.max_laps_in_memory
+
+    def apply(self, lap_list):
+        """ Spill laps of a {lap number: lap} dict until they fit in the memory budget """
+        if not lap_list:
+            return 0
+        current_lap_number = max(lap_list)
+        memory_size = sum(lap.get_memory_size() for lap in lap_list.values())
+        spilled_count = 0
+        for lap_number in sorted(lap_list):
+            if memory_size <= self.memory_budget_bytes:
+                break
+            lap = lap_list[lap_number]
+            if not self.is_spillable(lap, current_lap_number):
+                continue
+            memory_size -= lap.get_memory_size()
+            lap.spill_telemetry(self.spill_file)
+            spilled_count += 1
+        if spilled_count:
+            self.spilled_lap_count += spilled_count
+            log.debug("Spilled telemetry of %s laps to disk (%s bytes left in memory)" % (spilled_count, memory_size))
+        return spilled_count
+
+    def close(self):
+        self.spill_file.close()
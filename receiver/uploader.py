@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+log = logging.getLogger(__name__)
+
+
+# How often the upload worker checks if it got killed (in seconds)
+UPLOAD_POLL_TIMEOUT = 0.5
+# Number of recent uploads used for the latency stats
+LATENCY_SAMPLE_COUNT = 100
+
+
+class UploadJob:
+    """
+    A single F1Laps upload
+    upload is a callable doing the actual API call(s) and returning success
+    prepare is an optional callable that runs as soon as the job is enqueued, 
+    e.g. to build the payload and store it in the outbox; upload then gets
+    its return value as argument
+    Jobs with the same coalesce_key replace each other while they're queued
+    """
+    def __init__(self, description, upload, coalesce_key=None, prepare=None):
+        self.description = description
+        self.upload = upload
+        self.coalesce_key = coalesce_key
+        self.prepare = prepare
+        # Future of the prepare call, set by the uploader
+        self.prepared = None
+
+    def __str__(self):
+        return self.description
+
+
+class F1LapsUploader(threading.Thread):
+    """
+    Background worker that sends laps and sessions to F1Laps
+
+    The packet processing thread only enqueues jobs, so it never builds
+    payloads or waits for a HTTP request. Jobs get prepared (payload built
+    and stored in the outbox) right away on a separate thread, so that jobs
+    queued behind a slow request are already stored. Queued session updates
+    for the same session are coalesced, so only the newest one gets sent.
+    """
+
+    def __init__(self):
+        super(F1LapsUploader, self).__init__()
+        # Never keep the app alive because of pending uploads
+        self.daemon = True
+        self.kill_event = threading.Event()
+        self.condition = threading.Condition()
+
+        # Pending jobs, oldest first, and the pending jobs by coalesce key
+        self.jobs = deque()
+        self.jobs_by_coalesce_key = {}
+        # Runs the prepare calls of jobs, in the order they were enqueued
+        self.prepare_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="f1laps-upload-prepare")
+
+        # Counters
+        self.uploaded_count = 0
+        self.failed_count = 0
+        self.coalesced_count = 0
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLE_COUNT)
+
+    def enqueue(self, job):
+        """ Add an upload job, or replace a queued job with the same coalesce key """
+        if job.prepare:
+            job.prepared = self.prepare_executor.submit(job.prepare)
+        with self.condition:
+            queued_job = self.jobs_by_coalesce_key.get(job.coalesce_key) if job.coalesce_key else None
+            if queued_job:
+                # Keep the queue position, but send the newest payload
+                queued_job.description = job.description
+                queued_job.upload = job.upload
+                queued_job.prepared = job.prepared
+                self.coalesced_count += 1
+                log.debug("Coalesced upload %s with queued upload" % job)
+            else:
+                self.jobs.append(job)
+                if job.coalesce_key:
+                    self.jobs_by_coalesce_key[job.coalesce_key] = job
+            self.condition.notify()
+
+    def after_prepared(self, callback):
+        """ Call callback once the jobs enqueued so far are prepared, e.g. to release what they read """
+        self.prepare_executor.submit(callback)
+
+    def kill(self):
+        """ Stop the worker once all queued uploads have been sent """
+        self.kill_event.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def run(self):
+        log.info("F1Laps uploader started running")
+        while not (self.kill_event.is_set() and not self.get_queue_depth()):
+            self.process_next_job(timeout=UPLOAD_POLL_TIMEOUT)
+        log.info("F1Laps uploader stopped (%s)" % self.get_stats())
+
+    def process_next_job(self, timeout=None):
+        """ Wait for the next job and upload it; returns False if there was none """
+        with self.condition:
+            if not self.jobs:
+                self.condition.wait(timeout)
+                if not self.jobs:
+                    return False
+            job = self.jobs.popleft()
+            if job.coalesce_key:
+                self.jobs_by_coalesce_key.pop(job.coalesce_key, None)
+        start_time = time.perf_counter()
+        try:
+            if job.prepared:
+                success = job.upload(job.prepared.result())
+            else:
+                success = job.upload()
+        except Exception as ex:
+            log.info("Upload %s failed with exception: %s" % (job, ex))
+            success = False
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        with self.condition:
+            self.latencies_ms.append(latency_ms)
+            if success:
+                self.uploaded_count += 1
+            else:
+                self.failed_count += 1
+        log.debug("Upload %s finished in %.0fms (success: %s)" % (job, latency_ms, success))
+        return True
+
+    def get_queue_depth(self):
+        with self.condition:
+            return len(self.jobs)
+
+    def get_stats(self):
+        """ Return queue depth, upload counters and latency of recent uploads """
+        with self.condition:
+            latencies_ms = list(self.latencies_ms)
+            return {
+                "queue_depth": len(self.jobs),
+                "uploaded": self.uploaded_count,
+                "failed": self.failed_count,
+                "coalesced": self.coalesced_count,
+                "latency_ms_last": round(latencies_ms[-1]) if latencies_ms else None,
+                "latency_ms_avg": round(sum(latencies_ms) / len(latencies_ms)) if latencies_ms else None,
+                "latency_ms_max": round(max(latencies_ms)) if latencies_ms else None,
+            }
@@ -0,0 +1,33 @@
+import argparse
+
+from receiver.replay import CaptureReplay, NoopUploadSink, FileUploadSink, ServerUploadSink, REPLAY_SPEED_MAX
+
+
+def get_upload_sink(sink):
+    """ noop, file:<path> or the base URL of an F1Laps stand-in, e.g. http://127.0.0.1:8000/api/ """
+    if sink == "noop":
+        return NoopUploadSink()
+    if sink.startswith("file:"):
+        return FileUploadSink(sink[len("file:"):])
+    return ServerUploadSink(sink)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay packet captures through the F1Laps processors")
+    parser.add_argument("capture_paths", nargs="+", help="capture files, replayed in the given order")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 is real time (default: 1)")
+    parser.add_argument("--max", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--sink", default="noop", help="where uploads go: noop, file:<path> or an API base URL (default: noop)")
+    args = parser.parse_args()
+
+    upload_sink = get_upload_sink(args.sink)
+    replay = CaptureReplay(args.capture_paths, upload_sink, speed=REPLAY_SPEED_MAX if args.max else args.speed)
+    stats = replay.run()
+    if hasattr(upload_sink, "close"):
+        upload_sink.close()
+
+    print("%s packets in %.2fs (%.0f packets/s), %s failed" % (
+        stats["packets"], stats["seconds"], stats["packets_per_second"] or 0, stats["failed"]))
+    for stage, seconds in stats["stage_seconds"].items():
+        print("  %-8s %10.1f ms" % (stage, seconds * 1000))
+    print("Uploads: %s" % stats["uploads"])
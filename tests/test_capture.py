@@ -0,0 +1,83 @@
+from unittest import TestCase
+from unittest.mock import patch
+import os
+import socket
+import struct
+import tempfile
+
+from receiver.capture import PacketCaptureWriter, PacketCaptureReader, CAPTURE_RECORDS_OFFSET
+from receiver.receiver import RaceReceiver
+
+
+def make_packet(packet_format, packet_id, payload=b""):
+    return struct.pack("<HBBBB", packet_format, 1, 0, 1, packet_id) + payload
+
+
+class PacketCaptureTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_packets_are_written_with_index(self):
+        writer = PacketCaptureWriter(self.directory.name)
+        packets = [make_packet(2022, 0, b"motion"), make_packet(2022, 2, b"lap"), make_packet(2022, 2, b"lap 2"), b"x"]
+        for timestamp_ns, packet in enumerate(packets, start=100):
+            writer.record(packet, timestamp_ns)
+        self.assertEqual(writer.write_queued_packets(), 4)
+        writer.close_file()
+        path, = writer.file_paths
+        reader = PacketCaptureReader(path)
+        self.assertEqual(list(reader), list(enumerate(packets, start=100)))
+        self.assertEqual(reader.packet_count, 4)
+        self.assertEqual(reader.first_timestamp_ns, 100)
+        # Packets that are too short for a header aren't indexed
+        self.assertEqual(reader.packet_counts, {(2022, 0): 1, (2022, 2): 2})
+
+    def test_files_are_rotated_by_size(self):
+        writer = PacketCaptureWriter(self.directory.name, max_file_bytes=CAPTURE_RECORDS_OFFSET + 100)
+        for _ in range(5):
+            writer.record(make_packet(2022, 6, b"t" * 40))
+        writer.write_queued_packets()
+        writer.close_file()
+        self.assertEqual(len(writer.file_paths), 3)
+        self.assertEqual([PacketCaptureReader(path).packet_count for path in writer.file_paths], [2, 2, 1])
+
+    def test_packets_are_dropped_when_writer_falls_behind(self):
+        writer = PacketCaptureWriter(self.directory.name, max_queued_packets=2)
+        for _ in range(3):
+            writer.record(make_packet(2022, 6))
+        self.assertEqual(writer.get_stats()["dropped"], 1)
+        self.assertEqual(writer.write_queued_packets(), 2)
+        writer.close_file()
+
+    def test_unclosed_capture_can_be_read(self):
+        writer = PacketCaptureWriter(self.directory.name)
+        writer.record(make_packet(2022, 6), 1)
+        writer.record(make_packet(2022, 6), 2)
+        writer.write_queued_packets()
+        path = writer.capture_file.path
+        # Cut off in the middle of the last record
+        with open(path, "r+b") as capture_file:
+            capture_file.truncate(os.path.getsize(path) - 2)
+        self.assertEqual([timestamp_ns for timestamp_ns, _ in PacketCaptureReader(path)], [1])
+        writer.capture_file.file.close()
+
+    def test_receiver_captures_received_packets(self):
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.bind(("127.0.0.1", 0))
+        self.addCleanup(udp_socket.close)
+        with patch('receiver.receiver.RaceReceiver.get_socket', return_value=udp_socket):
+            race_receiver = RaceReceiver("key_123", host_ip="127.0.0.1", capture_directory=self.directory.name)
+        packet = make_packet(2022, 2, b"lap")
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(sender.close)
+        sender.sendto(packet, udp_socket.getsockname())
+        race_receiver.receive_packets()
+        race_receiver.capture_writer.write_queued_packets()
+        race_receiver.capture_writer.close_file()
+        (_, captured_packet), = PacketCaptureReader(race_receiver.capture_writer.file_paths[0])
+        self.assertEqual(captured_packet, packet)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,12 @@ class FileHandlerTest(TestCase):
         self.assertEqual(self.config.get("API_KEY"), "vettel4tw")
         self.assertEqual(self.config.get("UDP_BROADCAST_ENABLED"), True)
 
+    def test_get_capture_directory(self):
+        self.config.set("CAPTURE_DIRECTORY", "/tmp/f1laps-captures")
+        self.assertEqual(ConfigFile().load().get("CAPTURE_DIRECTORY"), "/tmp/f1laps-captures")
+        self.config.set("CAPTURE_DIRECTORY", None)
+        self.assertEqual(ConfigFile().load().get("CAPTURE_DIRECTORY"), None)
+
     def test_get_path_executable_parent(self):
         path = get_path_executable_parent("f1laps_configuration.txt")
         self.assertTrue("f1laps_configuration.txt" in path)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from benchmarks.hot_paths import compare_results, measure, get_benchmarks, BenchmarkFixtures, SAMPLE_PACKETS
+
+
+class HotPathBenchmarkTest(TestCase):
+    def test_regressions_beyond_threshold_are_flagged(self):
+        baseline_results = {"unpack": 1.0, "serialize": 2.0, "removed": 1.0}
+        results = {"unpack": 1.2, "serialize": 2.6, "new": 5.0}
+        comparisons, regressions = compare_results(results, baseline_results, threshold=0.25)
+        # Benchmarks that aren't in both runs aren't compared
+        self.assertEqual([comparison[0] for comparison in comparisons], ["serialize", "unpack"])
+        self.assertEqual(regressions, ["serialize"])
+
+    def test_measure_skips_setup_time(self):
+        calls = []
+        seconds = measure(lambda: calls.append("operation"), ops_per_call=2,
+                          setup=lambda: sum(range(10000)), repeat=1)
+        self.assertGreater(len(calls), 0)
+        # Way below the time of the setup
+        self.assertLess(seconds, 0.0001)
+
+    def test_benchmarks_are_filtered_before_anything_is_built(self):
+        fixtures = BenchmarkFixtures()
+        names = [name for name, _ in get_benchmarks(fixtures, "unpack_udp_packet")]
+        self.assertEqual(names, ["unpack_udp_packet[%s]" % name for name in sorted(SAMPLE_PACKETS)])
+        self.assertEqual(get_benchmarks(fixtures, "no such benchmark"), [])
+        self.assertEqual(fixtures.fixtures, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+from unittest import TestCase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import gzip
+import json
+import threading
+import requests
+
+from receiver.http_client import F1LapsHTTPClient, get_http_client, CAPABILITIES_HEADER, CAPABILITY_GZIP_REQUESTS
+from receiver.f12022.api import F1LapsAPI2022
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        self.do_POST()
+
+    def do_GET(self):
+        if self.path == "/slow/":
+            self.server.release_slow_requests.wait(5)
+        body = b'{"results": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if self.server.capabilities is not None:
+            self.send_header(CAPABILITIES_HEADER, self.server.capabilities)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            if self.server.gzip_rejected_status_code:
+                self.send_response(self.server.gzip_rejected_status_code)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+        self.server.received_bodies.append((self.headers.get("Content-Encoding"), payload))
+        self.send_response(400 if payload.get("invalid") else 201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class F1LapsHTTPClientTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.server.daemon_threads = True
+        self.server.release_slow_requests = threading.Event()
+        self.server.gzip_rejected_status_code = None
+        self.server.capabilities = None
+        self.server.received_bodies = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%s/" % self.server.server_address[1]
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.release_slow_requests.set)
+
+    def test_requests_reuse_the_connection(self):
+        client = F1LapsHTTPClient()
+        self.addCleanup(client.close)
+        for _ in range(3):
+            self.assertEqual(client.get(self.url).status_code, 200)
+        stats = client.get_stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 2)
+        self.assertIsNotNone(stats["latency_ms_avg"])
+
+    def test_read_timeout(self):
+        client = F1LapsHTTPClient(read_timeout=0.1)
+        self.addCleanup(client.close)
+        with self.assertRaises(requests.Timeout):
+            client.get(self.url + "slow/")
+        self.assertEqual(client.get_stats()["failed"], 1)
+
+    def test_api_returns_none_on_timeout(self):
+        client = F1LapsHTTPClient(read_timeout=0.1)
+        self.addCleanup(client.close)
+        api = F1LapsAPI2022("key_123", "f12022", http_client=client)
+        self.assertIsNone(api.call_api_get(self.url + "slow/", headers={}))
+
+    def test_bodies_are_uncompressed_by_default(self):
+        client = F1LapsHTTPClient(gzip_min_bytes=1000)
+        self.addCleanup(client.close)
+        big_payload = {"telemetry_data_string": "1" * 10000}
+        client.get(self.url)
+        self.assertEqual(client.request_json("POST", self.url, big_payload).status_code, 201)
+        self.assertEqual(self.server.received_bodies, [(None, big_payload)])
+
+    def test_big_json_bodies_are_compressed_for_capable_hosts(self):
+        self.server.capabilities = "%s, other" % CAPABILITY_GZIP_REQUESTS
+        client = F1LapsHTTPClient(gzip_min_bytes=1000)
+        self.addCleanup(client.close)
+        client.get(self.url)
+        self.assertTrue(client.has_capability(self.url + "laps/", CAPABILITY_GZIP_REQUESTS))
+        small_payload = {"telemetry_data_string": "1" * 10}
+        big_payload = {"telemetry_data_string": "1" * 10000}
+        self.assertEqual(client.request_json("POST", self.url, small_payload).status_code, 201)
+        self.assertEqual(client.request_json("POST", self.url, big_payload).status_code, 201)
+        self.assertEqual(self.server.received_bodies, [(None, small_payload), ("gzip", big_payload)])
+        stats = client.get_stats()
+        self.assertEqual(stats["body_bytes_uncompressed"], len(json.dumps(small_payload)) + len(json.dumps(big_payload)))
+        self.assertLess(stats["body_bytes_sent"], 1000)
+
+    def test_compression_is_switched_off_for_hosts_that_reject_it(self):
+        for status_code in [415, 400]:
+            self.server.gzip_rejected_status_code = status_code
+            self.server.received_bodies = []
+            client = F1LapsHTTPClient(gzip_min_bytes=1000)
+            self.addCleanup(client.close)
+            big_payload = {"telemetry_data_string": "1" * 10000}
+            self.assertEqual(client.request_json("PUT", self.url, big_payload, compress=True).status_code, 201)
+            self.assertEqual(client.gzip_rejected_hosts, {"127.0.0.1:%s" % self.server.server_address[1]})
+            self.assertEqual(client.request_json("POST", self.url, big_payload, compress=True).status_code, 201)
+            self.assertEqual(self.server.received_bodies, [(None, big_payload), (None, big_payload)])
+            self.assertEqual(client.get_stats()["requests"], 3)
+
+    def test_invalid_payload_keeps_compression_on(self):
+        client = F1LapsHTTPClient(gzip_min_bytes=1000)
+        self.addCleanup(client.close)
+        invalid_payload = {"invalid": True, "telemetry_data_string": "1" * 10000}
+        self.assertEqual(client.request_json("POST", self.url, invalid_payload, compress=True).status_code, 400)
+        # Sent again uncompressed, which got a 400 too
+        self.assertEqual([encoding for encoding, _ in self.server.received_bodies], ["gzip", None])
+        self.assertEqual(client.gzip_rejected_hosts, set())
+
+    def test_api_instances_share_the_client(self):
+        self.assertIs(F1LapsAPI2022("key_123", "f12022").http_client, get_http_client())
+        self.assertIs(F1LapsAPI2022("key_456", "f12021").http_client, get_http_client())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+from benchmarks.mock_f1laps_api import MockF1LapsAPI
+from benchmarks.session_resync import drive_race
+from receiver.api_base import F1LapsAPIBase
+from receiver.http_client import F1LapsHTTPClient
+from receiver.session_sync import SessionSyncState
+
+
+class MockF1LapsAPITest(TestCase):
+    def start(self, **mock_api_kwargs):
+        self.mock_api = MockF1LapsAPI(**mock_api_kwargs)
+        base_url = self.mock_api.start()
+        self.addCleanup(self.mock_api.stop)
+        http_client = F1LapsHTTPClient()
+        self.addCleanup(http_client.close)
+        self.api = F1LapsAPIBase("key_123", "f12022", http_client=http_client, base_url=base_url)
+
+    def sync_session(self, session):
+        success, session.f1_laps_session_id = session.sync_session_to_f1laps(self.api)
+        self.assertTrue(success)
+
+    def test_session_is_synced(self):
+        self.start()
+        drive_race(self.sync_session, lap_count=3, frames_per_lap=10, session_sync_state=SessionSyncState())
+        stats = self.mock_api.get_stats()
+        self.assertEqual(stats["requests"], {"POST grandprixs/sessions/": 1, "PUT grandprixs/sessions/<id>/": 2})
+        self.assertEqual(stats["status_codes"], {201: 1, 200: 2})
+        session, = self.mock_api.sessions.values()
+        self.assertEqual(session["udp_session_uid"], "uid_123")
+        self.assertEqual(sorted(session["laps"]), [1, 2, 3])
+        self.assertEqual(session["laps"][3]["sector_1_time_ms"], 30000)
+        # The server advertises partial lap_times, so the last update only held lap 3
+        self.assertTrue(session["lap_times_partial"])
+        self.assertEqual([lap["lap_number"] for lap in session["lap_times"]], [3])
+
+    def test_session_is_synced_with_all_laps_without_partial_updates(self):
+        self.start(accepts_gzip=False, supports_partial_updates=False)
+        drive_race(self.sync_session, lap_count=3, frames_per_lap=10, session_sync_state=SessionSyncState())
+        self.assertEqual(self.mock_api.get_stats()["status_codes"], {201: 1, 200: 2})
+        session, = self.mock_api.sessions.values()
+        self.assertNotIn("lap_times_partial", session)
+        self.assertEqual([lap["lap_number"] for lap in session["lap_times"]], [1, 2, 3])
+
+    def test_lap_is_created(self):
+        self.start()
+        def sync_lap(session):
+            self.assertTrue(session.sync_lap_to_f1laps(session.lap_list[max(session.lap_list)], self.api))
+        drive_race(sync_lap, lap_count=2, frames_per_lap=10)
+        self.assertEqual(self.mock_api.get_stats()["requests"], {"POST laps/": 2})
+        self.assertEqual([lap["sector_1_time_ms"] for lap in self.mock_api.laps], [30000, 30000])
+        self.assertTrue(all(lap["telemetry_data_string"] for lap in self.mock_api.laps))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+from unittest import TestCase
+from unittest.mock import patch
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from receiver.outbox import F1LapsOutbox, OutboxWorker, OUTBOX_KIND_LAP, OUTBOX_KIND_SESSION, RETRY_BACKOFF_BASE_SECONDS
+from receiver.f12022.session import F12022Session
+from receiver.uploader import F1LapsUploader
+from receiver.receiver import RaceReceiver
+
+
+class F1LapsOutboxTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "outbox.sqlite3")
+        self.outbox = F1LapsOutbox(self.path)
+        self.addCleanup(self.outbox.close)
+
+    def make_due(self):
+        """ Turn the entries into ones left over from an earlier run """
+        self.outbox.connection.execute("UPDATE outbox SET next_attempt_at = 0, in_flight_pid = NULL")
+
+    def test_uploaded_entries_are_deleted(self):
+        entry = self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        self.assertEqual(len(self.outbox), 1)
+        self.outbox.finish(entry, True)
+        self.assertEqual(len(self.outbox), 0)
+
+    def test_failed_entries_are_retried_with_backoff(self):
+        entry = self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        # Not retried while it's being uploaded
+        self.assertEqual(self.outbox.claim_due_entries(), [])
+        self.outbox.finish(entry, False)
+        next_attempt_at = self.outbox.connection.execute("SELECT next_attempt_at FROM outbox").fetchone()[0]
+        self.assertAlmostEqual(next_attempt_at, time.time() + RETRY_BACKOFF_BASE_SECONDS, delta=5)
+        self.make_due()
+        entry, = self.outbox.claim_due_entries()
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.payload, '{"sector_1_time": 1}')
+        self.outbox.finish(entry, False, is_retry=True)
+        next_attempt_at = self.outbox.connection.execute("SELECT next_attempt_at FROM outbox").fetchone()[0]
+        self.assertAlmostEqual(next_attempt_at, time.time() + 2 * RETRY_BACKOFF_BASE_SECONDS, delta=5)
+
+    def test_entries_in_flight_are_not_retried(self):
+        entry = self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        # However long the live upload takes
+        self.outbox.connection.execute("UPDATE outbox SET next_attempt_at = 0")
+        self.assertEqual(self.outbox.claim_due_entries(), [])
+        # Nor is a claimed retry claimed twice
+        self.outbox.finish(entry, False)
+        self.make_due()
+        self.assertEqual(len(self.outbox.claim_due_entries()), 1)
+        self.assertEqual(self.outbox.claim_due_entries(), [])
+
+    def test_entries_in_flight_of_earlier_runs_are_retried(self):
+        self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        self.outbox.close()
+        self.outbox = F1LapsOutbox(self.path)
+        self.outbox.pid += 1
+        self.assertEqual(len(self.outbox.claim_due_entries()), 1)
+
+    def test_session_entries_are_coalesced(self):
+        entry = self.outbox.add(OUTBOX_KIND_SESSION, "f12022", {"lap_times": [1]}, coalesce_key="f12022-uid")
+        newer_entry = self.outbox.add(OUTBOX_KIND_SESSION, "f12022", {"lap_times": [1, 2]}, coalesce_key="f12022-uid")
+        self.assertEqual(len(self.outbox), 1)
+        self.assertEqual(entry.entry_id, newer_entry.entry_id)
+        # The older payload's upload doesn't remove the newer payload
+        self.outbox.finish(entry, True)
+        self.assertEqual(len(self.outbox), 1)
+        self.outbox.finish(newer_entry, True)
+        self.assertEqual(len(self.outbox), 0)
+
+    def test_entries_survive_restarts(self):
+        self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        self.outbox.close()
+        self.outbox = F1LapsOutbox(self.path)
+        self.assertEqual(len(self.outbox), 1)
+
+    def test_oldest_entries_are_dropped_when_full(self):
+        self.outbox.max_payload_bytes = 50
+        first_entry = self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"telemetry_data_string": "x" * 20})
+        self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"telemetry_data_string": "y" * 20})
+        self.assertEqual(len(self.outbox), 1)
+        self.assertEqual(self.outbox.get_stats()["dropped"], 1)
+        self.make_due()
+        self.assertNotEqual(self.outbox.claim_due_entries()[0].entry_id, first_entry.entry_id)
+
+    @patch('receiver.outbox.F1LapsAPIBase.session_create_or_update')
+    @patch('receiver.outbox.F1LapsAPIBase.lap_create')
+    def test_worker_uploads_due_entries(self, mock_lap_create, mock_session_sync):
+        mock_lap_create.return_value = True
+        mock_session_sync.return_value = True, "123"
+        self.outbox.add(OUTBOX_KIND_LAP, "f12022", {"sector_1_time": 1})
+        self.outbox.add(OUTBOX_KIND_SESSION, "f12022", {"f1laps_session_id": None, "lap_times": []}, coalesce_key="f12022-uid")
+        self.make_due()
+        worker = OutboxWorker(self.outbox, "key_123")
+        self.assertEqual(worker.process_due_entries(), 2)
+        mock_lap_create.assert_called_once_with(sector_1_time=1)
+        mock_session_sync.assert_called_once_with(f1laps_session_id=None, lap_times=[])
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.get_stats()["retried"], 2)
+
+    @patch('receiver.f12022.session.F1LapsAPI2022.lap_create')
+    def test_failed_lap_upload_stays_in_outbox(self, mock_lap_create):
+        mock_lap_create.return_value = False
+        # Time trial session (syncs individual laps)
+        session = F12022Session("key_123", True, "uid_123", 13, 1, False, 90, 1, 3, outbox=self.outbox)
+        session.team_id = 1
+        lap = session.add_lap(1)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 1, 2, 3
+        self.assertFalse(session.sync_to_f1laps(1))
+        self.assertEqual(len(self.outbox), 1)
+        self.assertEqual(self.outbox.connection.execute("SELECT attempts FROM outbox").fetchone()[0], 1)
+
+    @patch('receiver.f12022.session.F1LapsAPI2022.lap_create')
+    def test_uploader_stores_lap_in_outbox(self, mock_lap_create):
+        mock_lap_create.side_effect = Exception("Connection reset")
+        uploader = F1LapsUploader()
+        session = F12022Session("key_123", True, "uid_123", 13, 1, False, 90, 1, 3, outbox=self.outbox, uploader=uploader)
+        session.team_id = 1
+        lap = session.add_lap(1)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 1, 2, 3
+        self.assertTrue(session.sync_to_f1laps(1))
+        # The packet processing thread only enqueues the upload, the uploader stores it before sending it
+        prepared = threading.Event()
+        uploader.after_prepared(prepared.set)
+        self.assertTrue(prepared.wait(5))
+        self.assertEqual(len(self.outbox), 1)
+        mock_lap_create.assert_not_called()
+        self.assertTrue(uploader.process_next_job(timeout=0))
+        # The failed upload isn't in flight anymore, so it gets retried
+        self.assertEqual(self.outbox.connection.execute("SELECT attempts, in_flight_pid FROM outbox").fetchone(), (1, None))
+
+
+    @patch('receiver.receiver.RaceReceiver.get_socket')
+    def test_receiver_closes_outbox_on_kill(self, mock_get_socket):
+        race_receiver = RaceReceiver("key_123", host_ip="127.0.0.1")
+        race_receiver.outbox = self.outbox
+        race_receiver.kill()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            len(self.outbox)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from receiver.game_version import CrossGamePacketHeader, unpack_packet_header
+from receiver.packet_dispatch import PACKET_DISPATCH_TABLE, get_packet_handler
+from receiver.receiver import RaceReceiver
+from receiver.f12020.processor import F12020Processor
+from receiver.f12021.processor import F12021Processor
+from receiver.f12022.processor import F12022Processor
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+from receiver.f12022.packets.motion import PacketMotionData
+
+
+def build_header_bytes(packet_format, packet_id):
+    header = CrossGamePacketHeader()
+    header.packetFormat = packet_format
+    header.gameMajorVersion = 1
+    header.packetVersion = 1
+    header.packetId = packet_id
+    header.sessionUID = 123456789
+    header.sessionTime = 12.5
+    header.frameIdentifier = 1000
+    header.playerCarIndex = 19
+    header.secondaryPlayerCarIndex = 255
+    return bytes(header)
+
+
+class PacketDispatchTest(TestCase):
+    def test_unpack_packet_header_matches_ctypes_header(self):
+        packet = build_header_bytes(2022, 6) + b"\x00" * 10
+        header = unpack_packet_header(memoryview(packet))
+        ctypes_header = CrossGamePacketHeader.from_buffer_copy(packet)
+        for field_name, _ in CrossGamePacketHeader._fields_:
+            self.assertEqual(getattr(header, field_name), getattr(ctypes_header, field_name))
+
+    def test_dispatch_table_covers_all_game_versions(self):
+        self.assertEqual(PACKET_DISPATCH_TABLE[(2020, 1)].game_version, "f12020")
+        self.assertEqual(PACKET_DISPATCH_TABLE[(2021, 11)].game_version, "f12021")
+        handler = PACKET_DISPATCH_TABLE[(2022, 6)]
+        self.assertEqual(handler.processor_class, F12022Processor)
+        self.assertEqual(handler.packet_type, PacketCarTelemetryData)
+
+    def test_unknown_packets_have_no_handler(self):
+        # F1 22 motion packets are dispatched, the processor skips them without motion channels
+        self.assertEqual(get_packet_handler(unpack_packet_header(build_header_bytes(2022, 0))).packet_type, PacketMotionData)
+        self.assertEqual(get_packet_handler(unpack_packet_header(build_header_bytes(2019, 1))), None)
+
+
+@patch('receiver.receiver.RaceReceiver.get_socket')
+class RaceReceiverDispatchTest(TestCase):
+    def test_process_packet_starts_processor_and_passes_header(self, mock_get_socket):
+        race_receiver = RaceReceiver("key_123", host_ip="127.0.0.1")
+        packet = build_header_bytes(2020, 3)
+        with patch.object(F12020Processor, 'process') as mock_process:
+            race_receiver.process_packet(packet)
+            self.assertIsInstance(race_receiver.processor, F12020Processor)
+            args = mock_process.call_args[0]
+            self.assertEqual(args[0], packet)
+            self.assertEqual(args[1].packetId, 3)
+            self.assertEqual(args[2], PACKET_DISPATCH_TABLE[(2020, 3)].packet_type)
+
+    def test_process_packet_drops_unknown_packets(self, mock_get_socket):
+        race_receiver = RaceReceiver("key_123", host_ip="127.0.0.1")
+        with patch.object(F12022Processor, 'process') as mock_process:
+            race_receiver.process_packet(build_header_bytes(2022, 99))
+            race_receiver.process_packet(b"short")
+            mock_process.assert_not_called()
+
+    def test_packets_without_handler_start_processor(self, mock_get_socket):
+        race_receiver = RaceReceiver("key_123", host_ip="127.0.0.1")
+        # F1 2021 packet ID the processor doesn't handle
+        with patch.object(F12021Processor, 'process') as mock_process:
+            race_receiver.process_packet(build_header_bytes(2021, 99))
+            self.assertIsInstance(race_receiver.processor, F12021Processor)
+            mock_process.assert_not_called()
+        # Unknown games don't start a processor
+        race_receiver.process_packet(build_header_bytes(2019, 1))
+        self.assertIsInstance(race_receiver.processor, F12021Processor)
+
+
+if __name__ == '__main__':
+    unittest.main()
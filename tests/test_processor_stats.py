@@ -0,0 +1,110 @@
+from unittest import TestCase
+import threading
+
+from receiver.processor_stats import ProcessorStats, LatencyHistogram, get_bucket_index, get_bucket_upper_bound, \
+    NULL_PACKET_TIMER, STAGE_DECODE, STAGE_SERIALIZE, STAGE_HANDLER
+from receiver.f12022.processor import F12022Processor
+from receiver.f12022.packets.session import PacketSessionData
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+
+
+def build_packet(packet_class, packet_id):
+    packet = packet_class()
+    packet.header.packetFormat = 2022
+    packet.header.packetId = packet_id
+    packet.header.sessionUID = 42
+    return packet
+
+
+class LatencyHistogramTest(TestCase):
+    def test_buckets_hold_their_durations(self):
+        for duration_ns in [0, 1, 15, 16, 17, 100, 1000, 12345, 10 ** 6, 10 ** 9]:
+            bucket_index = get_bucket_index(duration_ns)
+            self.assertLessEqual(duration_ns, get_bucket_upper_bound(bucket_index))
+            if bucket_index:
+                self.assertGreater(duration_ns, get_bucket_upper_bound(bucket_index - 1))
+
+    def test_percentiles_are_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for duration_ns in range(1000, 101000, 1000):
+            histogram.record(duration_ns)
+        for percentile, expected_ns in [(50, 50000), (90, 90000), (99, 99000)]:
+            self.assertGreaterEqual(histogram.get_percentile_ns(percentile), expected_ns)
+            self.assertLessEqual(histogram.get_percentile_ns(percentile), expected_ns * 1.125)
+        summary = histogram.get_summary()
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["mean_us"], 50.5)
+        self.assertEqual(summary["max_us"], 100.0)
+
+    def test_empty_histogram(self):
+        self.assertIsNone(LatencyHistogram().get_percentile_ns(50))
+        self.assertEqual(LatencyHistogram().get_summary(), {"count": 0})
+
+
+class ProcessorStatsTest(TestCase):
+    def test_every_nth_packet_is_timed(self):
+        stats = ProcessorStats("F1 2022", {6: "PacketCarTelemetryData"}, sample_interval=4, log_interval=None)
+        timers = [stats.start_packet(6) for _ in range(8)]
+        self.assertEqual(sum(timer is not NULL_PACKET_TIMER for timer in timers), 2)
+        for timer in timers:
+            timer.stage_done(STAGE_DECODE)
+        packet_type_stats = stats.get_stats()["packet_types"]["PacketCarTelemetryData"]
+        self.assertEqual(packet_type_stats["packets"], 8)
+        self.assertEqual(packet_type_stats[STAGE_DECODE]["count"], 2)
+
+    def test_log_stats(self):
+        stats = ProcessorStats("F1 2022", sample_interval=1, log_interval=None)
+        stats.start_packet(3).stage_done(STAGE_HANDLER)
+        stats.count_error(3)
+        with self.assertLogs("receiver.processor_stats", level="INFO") as logs:
+            stats.log_stats()
+        self.assertIn("F1 2022 processor: 1 packets", logs.output[0])
+        self.assertIn("packet 3: 1 packets, 1 errors, 0 skipped, handler p50", logs.output[1])
+
+    def test_stats_can_be_read_while_packets_are_counted(self):
+        stats = ProcessorStats("F1 2022", sample_interval=1, log_interval=None)
+        done = threading.Event()
+        def count_packets():
+            try:
+                # New packet types keep growing the counter dicts
+                for packet_id in range(5000):
+                    stats.start_packet(packet_id).stage_done(STAGE_DECODE)
+                    stats.count_error(packet_id)
+            finally:
+                done.set()
+        thread = threading.Thread(target=count_packets)
+        thread.start()
+        while not done.is_set():
+            stats.get_stats()
+        thread.join()
+        self.assertEqual(stats.get_stats()["errors"], 5000)
+
+
+class F12022ProcessorStatsTest(TestCase):
+    def test_processor_counts_and_times_packets(self):
+        processor = F12022Processor("key_123", True, stats_sample_interval=1)
+        session_packet = build_packet(PacketSessionData, 1)
+        session_packet.sessionType = 10
+        processor.process(bytes(build_packet(PacketCarTelemetryData, 6)))
+        processor.process(bytes(session_packet))
+        processor.process(bytes(build_packet(PacketCarTelemetryData, 6)))
+        processor.process(bytes(build_packet(PacketCarTelemetryData, 6))[:20])
+
+        stats = processor.processor_stats.get_stats()
+        self.assertEqual(stats["packets"], 4)
+        self.assertEqual(stats["errors"], 1)
+        telemetry_stats = stats["packet_types"]["PacketCarTelemetryData"]
+        self.assertEqual(telemetry_stats["packets"], 3)
+        self.assertEqual(telemetry_stats["errors"], 1)
+        self.assertEqual(telemetry_stats["skipped"], 1)
+        self.assertEqual(stats["skipped"], 1)
+        # The one before the session packet is skipped before decoding,
+        # and only the one after it gets processed
+        self.assertEqual(telemetry_stats[STAGE_DECODE]["count"], 2)
+        self.assertEqual(telemetry_stats[STAGE_SERIALIZE]["count"], 1)
+        self.assertEqual(telemetry_stats[STAGE_HANDLER]["count"], 1)
+        self.assertEqual(stats["packet_types"]["PacketSessionData"][STAGE_HANDLER]["count"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
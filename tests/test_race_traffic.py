@@ -0,0 +1,64 @@
+from unittest import TestCase
+import os
+import tempfile
+
+from benchmarks.race_traffic import SyntheticRace, write_capture
+from receiver.capture import PacketCaptureReader
+from receiver.game_version import unpack_packet_header
+from receiver.http_client import set_http_client
+from receiver.packet_dispatch import PacketRouter
+from receiver.replay import NoopUploadSink
+
+
+class SyntheticRaceTest(TestCase):
+    def drive(self, race):
+        upload_sink = NoopUploadSink()
+        previous_http_client = set_http_client(upload_sink)
+        self.addCleanup(set_http_client, previous_http_client)
+        packet_router = PacketRouter("key_123")
+        for _, packet in race:
+            packet_router.process_packet(packet)
+        return packet_router.processor.session, upload_sink
+
+    def test_race_is_processed_and_synced(self):
+        race = SyntheticRace(lap_count=3, send_rate_hz=10, team_id=4, flashback_laps=[2], pit_laps=[1], penalty_laps=[2])
+        session, upload_sink = self.drive(race)
+        self.assertEqual(session.session_udp_uid, race.session_uid)
+        self.assertEqual(session.team_id, 4)
+        self.assertEqual(len(session.participants), 22)
+        self.assertEqual(sorted(session.lap_list), [1, 2, 3])
+        self.assertEqual(session.lap_list[1].sector_1_ms, 30000)
+        self.assertEqual(session.lap_list[2].tyre_compound_visual, 17)
+        self.assertEqual(len(session.lap_list[2].penalties), 1)
+        self.assertEqual(session.finish_position, 1)
+        self.assertEqual(session.points, 25)
+        requests = upload_sink.get_stats()["requests"]
+        self.assertEqual(requests["POST grandprixs/sessions/"], 1)
+        # After laps 1 and 2, and after the final classification
+        self.assertEqual(requests["PUT grandprixs/sessions/<id>/"], 2)
+
+    def test_flashback_goes_back_in_frames(self):
+        race = SyntheticRace(lap_count=2, send_rate_hz=10, car_count=2, flashback_laps=[1])
+        frames = [unpack_packet_header(packet).frameIdentifier for _, packet in race]
+        self.assertEqual(sum(1 for previous, frame in zip(frames, frames[1:]) if frame < previous), 1)
+
+    def test_dropped_packets_are_deterministic(self):
+        race = SyntheticRace(lap_count=1, send_rate_hz=10, car_count=2, drop_rate=0.1)
+        packets = list(race)
+        self.assertGreater(race.dropped_count, 0)
+        self.assertEqual(len(packets), race.sent_count)
+        self.assertEqual(list(race), packets)
+
+    def test_race_is_written_to_capture(self):
+        race = SyntheticRace(lap_count=1, send_rate_hz=10, car_count=2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "race.f1cap")
+            packet_count = write_capture(race, path)
+            reader = PacketCaptureReader(path)
+            self.assertEqual(reader.packet_count, packet_count)
+            self.assertEqual([packet for _, packet in reader], [packet for _, packet in race])
+            self.assertEqual(reader.packet_counts[(2022, 8)], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+from unittest import TestCase
+import json
+import os
+import tempfile
+
+from receiver.capture import PacketCaptureWriter
+from receiver.http_client import get_http_client
+from receiver.replay import CaptureReplay, NoopUploadSink, FileUploadSink
+from receiver.f12022.processor import F12022Processor
+from receiver.f12022.packets.session import PacketSessionData
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+
+
+def build_packet(packet_class, packet_id):
+    packet = packet_class()
+    packet.header.packetFormat = 2022
+    packet.header.packetId = packet_id
+    packet.header.sessionUID = 42
+    return packet
+
+
+class CaptureReplayTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        session_packet = build_packet(PacketSessionData, 1)
+        session_packet.sessionType = 10
+        session_packet.trackId = 5
+        telemetry_packet = build_packet(PacketCarTelemetryData, 6)
+        writer = PacketCaptureWriter(self.directory.name)
+        # Telemetry before the session gets skipped; 100ms between packets
+        for index, packet in enumerate([telemetry_packet, session_packet, telemetry_packet, b"short"]):
+            writer.record(bytes(packet), 1000 + index * 100 * 1000 * 1000)
+        writer.write_queued_packets()
+        writer.close_file()
+        self.capture_paths = writer.file_paths
+
+    def test_replay_feeds_packets_to_processor(self):
+        http_client = get_http_client()
+        replay = CaptureReplay(self.capture_paths)
+        stats = replay.run()
+        processor = replay.packet_router.processor
+        self.assertIsInstance(processor, F12022Processor)
+        self.assertEqual(str(processor.session), "Monaco Other Race (ID F12022-42)")
+        self.assertEqual(processor.get_skipped_packet_counts()["no_session"], 1)
+        self.assertEqual(stats["packets"], 4)
+        self.assertEqual(stats["failed"], 0)
+        self.assertEqual(set(stats["stage_seconds"]), {"read", "route", "process", "upload"})
+        # Max throughput doesn't follow the capture's timing
+        self.assertLess(stats["seconds"], 0.3)
+        # The F1Laps client is back in place
+        self.assertIs(get_http_client(), http_client)
+
+    def test_replay_follows_capture_timing(self):
+        stats = CaptureReplay(self.capture_paths, speed=2).run()
+        self.assertGreaterEqual(stats["seconds"], 0.15)
+
+    def test_http_client_is_restored_on_error(self):
+        http_client = get_http_client()
+        path = os.path.join(self.directory.name, "not_a_capture.f1cap")
+        with open(path, "wb") as not_a_capture:
+            not_a_capture.write(b"\x00" * 1024)
+        with self.assertRaises(ValueError):
+            CaptureReplay(self.capture_paths + [path]).run()
+        self.assertIs(get_http_client(), http_client)
+
+
+class UploadSinkTest(TestCase):
+    def test_noop_sink_answers_like_f1laps(self):
+        sink = NoopUploadSink()
+        response = sink.request_json("POST", "https://www.f1laps.com/api/f12022/grandprixs/sessions/", {"lap_times": []})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"id": "replay-1"})
+        response = sink.request_json("PUT", "https://www.f1laps.com/api/f12022/grandprixs/sessions/replay-1/", {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sink.get("https://www.f1laps.com/api/f12022/grandprixs/sessions/?udp_session_uid=42").json(), {"results": []})
+        self.assertEqual(sink.get_stats()["requests"], {"POST grandprixs/sessions/": 1, "PUT grandprixs/sessions/<id>/": 1})
+
+    def test_file_sink_writes_json_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "uploads.jsonl")
+            sink = FileUploadSink(path)
+            sink.request_json("POST", "https://www.f1laps.com/api/f12022/laps/", {"lap_number": 1})
+            sink.close()
+            with open(path) as uploads_file:
+                upload, = [json.loads(line) for line in uploads_file]
+        self.assertEqual(upload, {"method": "POST", "endpoint": "f12022/laps/", "params": {"lap_number": 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
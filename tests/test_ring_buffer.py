@@ -0,0 +1,143 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from receiver.receiver import RaceReceiver
+from receiver.ring_buffer import PacketRingBuffer, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST
+
+
+def write_packet(ring_buffer, payload):
+    """ Helper that mimics a socket recv_into() call """
+    slot_index = ring_buffer.acquire_write_slot()
+    slot = ring_buffer.get_slot(slot_index)
+    slot[:len(payload)] = payload
+    return ring_buffer.commit(slot_index, len(payload))
+
+
+def read_packet(ring_buffer):
+    """ Helper that pops, copies and releases the next packet """
+    slot_index = ring_buffer.pop(timeout=0)
+    if slot_index is None:
+        return None
+    packet = bytes(ring_buffer.view(slot_index))
+    ring_buffer.release(slot_index)
+    return packet
+
+
+class QueuedSocket:
+    """ Socket stand-in with datagrams already waiting to be received """
+    def __init__(self, datagrams):
+        self.datagrams = list(datagrams)
+
+    def recv_into(self, buffer, nbytes=0, flags=0):
+        if not self.datagrams:
+            raise BlockingIOError()
+        datagram = self.datagrams.pop(0)
+        buffer[:len(datagram)] = datagram
+        return len(datagram)
+
+
+class PacketRingBufferTest(TestCase):
+    def test_write_and_read_in_order(self):
+        ring_buffer = PacketRingBuffer(depth=4, slot_size=16)
+        self.assertTrue(write_packet(ring_buffer, b"one"))
+        self.assertTrue(write_packet(ring_buffer, b"two"))
+        self.assertEqual(len(ring_buffer), 2)
+        self.assertEqual(read_packet(ring_buffer), b"one")
+        self.assertEqual(read_packet(ring_buffer), b"two")
+        self.assertEqual(read_packet(ring_buffer), None)
+        self.assertEqual(ring_buffer.get_stats(), {
+            "depth": 4, "pending": 0, "enqueued": 2, "dropped": 0, "high_water_mark": 2
+        })
+
+    def test_slots_get_reused(self):
+        ring_buffer = PacketRingBuffer(depth=2, slot_size=16)
+        for index in range(10):
+            write_packet(ring_buffer, b"packet %d" % index)
+            self.assertEqual(read_packet(ring_buffer), b"packet %d" % index)
+        self.assertEqual(ring_buffer.get_stats()["dropped"], 0)
+        self.assertEqual(ring_buffer.get_stats()["high_water_mark"], 1)
+
+    def test_overflow_drop_oldest(self):
+        ring_buffer = PacketRingBuffer(depth=2, slot_size=16, overflow_policy=OVERFLOW_DROP_OLDEST)
+        write_packet(ring_buffer, b"one")
+        write_packet(ring_buffer, b"two")
+        write_packet(ring_buffer, b"three")
+        self.assertEqual(read_packet(ring_buffer), b"two")
+        self.assertEqual(read_packet(ring_buffer), b"three")
+        self.assertEqual(ring_buffer.get_stats()["dropped"], 1)
+        self.assertEqual(ring_buffer.get_stats()["enqueued"], 3)
+
+    def test_overflow_drop_newest(self):
+        ring_buffer = PacketRingBuffer(depth=2, slot_size=16, overflow_policy=OVERFLOW_DROP_NEWEST)
+        write_packet(ring_buffer, b"one")
+        write_packet(ring_buffer, b"two")
+        self.assertFalse(write_packet(ring_buffer, b"three"))
+        self.assertEqual(read_packet(ring_buffer), b"one")
+        self.assertEqual(read_packet(ring_buffer), b"two")
+        self.assertEqual(ring_buffer.get_stats()["dropped"], 1)
+        self.assertEqual(ring_buffer.get_stats()["enqueued"], 2)
+
+    def test_slot_held_by_reader_is_not_overwritten(self):
+        ring_buffer = PacketRingBuffer(depth=2, slot_size=16, overflow_policy=OVERFLOW_DROP_OLDEST)
+        write_packet(ring_buffer, b"one")
+        reader_slot_index = ring_buffer.pop(timeout=0)
+        write_packet(ring_buffer, b"two")
+        write_packet(ring_buffer, b"three")
+        self.assertEqual(bytes(ring_buffer.view(reader_slot_index)), b"one")
+        ring_buffer.release(reader_slot_index)
+        self.assertEqual(read_packet(ring_buffer), b"three")
+
+    def test_abort_returns_slot(self):
+        ring_buffer = PacketRingBuffer(depth=1, slot_size=16)
+        slot_index = ring_buffer.acquire_write_slot()
+        ring_buffer.abort(slot_index)
+        self.assertTrue(write_packet(ring_buffer, b"one"))
+
+    def test_commit_and_pop_batch(self):
+        ring_buffer = PacketRingBuffer(depth=4, slot_size=16)
+        received_slots = []
+        for payload in [b"one", b"two", b"three"]:
+            slot_index = ring_buffer.acquire_write_slot()
+            ring_buffer.get_slot(slot_index)[:len(payload)] = payload
+            received_slots.append((slot_index, len(payload)))
+        self.assertEqual(ring_buffer.commit_batch(received_slots), 3)
+        slot_indexes = ring_buffer.pop_batch(2, timeout=0)
+        self.assertEqual([bytes(ring_buffer.view(i)) for i in slot_indexes], [b"one", b"two"])
+        for slot_index in slot_indexes:
+            ring_buffer.release(slot_index)
+        self.assertEqual(read_packet(ring_buffer), b"three")
+        self.assertEqual(ring_buffer.pop_batch(2, timeout=0), [])
+        self.assertEqual(ring_buffer.get_stats()["high_water_mark"], 3)
+
+    def receive_all(self, overflow_policy):
+        """ Receive 10 waiting datagrams into a ring of 4 slots """
+        udp_socket = QueuedSocket([b"packet %d" % index for index in range(10)])
+        with patch('receiver.receiver.RaceReceiver.get_socket', return_value=udp_socket):
+            race_receiver = RaceReceiver("key_123", ring_buffer_depth=4, ring_buffer_overflow_policy=overflow_policy)
+        while udp_socket.datagrams:
+            race_receiver.receive_packets()
+        ring_buffer = race_receiver.ring_buffer
+        packets = []
+        while len(ring_buffer):
+            packets.append(read_packet(ring_buffer))
+        return packets, ring_buffer.get_stats()
+
+    def test_receive_batch_larger_than_depth_drops_oldest(self):
+        packets, stats = self.receive_all(OVERFLOW_DROP_OLDEST)
+        self.assertEqual(packets, [b"packet %d" % index for index in range(6, 10)])
+        self.assertEqual(stats["enqueued"], 10)
+        self.assertEqual(stats["dropped"], 6)
+
+    def test_receive_batch_larger_than_depth_drops_newest(self):
+        packets, stats = self.receive_all(OVERFLOW_DROP_NEWEST)
+        self.assertEqual(packets, [b"packet %d" % index for index in range(4)])
+        self.assertEqual(stats["enqueued"], 4)
+        self.assertEqual(stats["dropped"], 6)
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            PacketRingBuffer(depth=2, overflow_policy="drop_everything")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+import json
+
+from receiver.f12022.api import F1LapsAPI2022
+from receiver.f12022.session import F12022Session
+from receiver.session_sync import SessionSyncState, FULL_SYNC_REQUIRED_STATUS_CODE, CAPABILITY_PARTIAL_LAP_TIMES
+
+
+class StandInF1LapsAPI(F1LapsAPI2022):
+    """ Local stand-in for the F1Laps session endpoints, merging partial lap_times updates """
+
+    def __init__(self):
+        super(StandInF1LapsAPI, self).__init__("key_123", "f12022")
+        self.sessions = {}
+        self.requests = []
+        self.capabilities = {CAPABILITY_PARTIAL_LAP_TIMES}
+        self.supports_partial_updates = True
+
+    def has_capability(self, capability):
+        return capability in self.capabilities
+
+    def call_api(self, method, endpoint, params=None):
+        self.requests.append((method, params))
+        if method == "POST":
+            self.sessions["1"] = {lap["lap_number"]: lap for lap in params["lap_times"]}
+            return MagicMock(status_code=201, content=json.dumps({"id": "1"}))
+        session_laps = self.sessions[endpoint.split("/")[-2]]
+        if params.get("lap_times_partial"):
+            if not self.supports_partial_updates:
+                return MagicMock(status_code=FULL_SYNC_REQUIRED_STATUS_CODE, content=json.dumps({"detail": "Send all laps"}))
+        else:
+            session_laps.clear()
+        session_laps.update({lap["lap_number"]: lap for lap in params["lap_times"]})
+        return MagicMock(status_code=200)
+
+
+class SessionSyncStateTest(TestCase):
+    def test_prepare_sync_leaves_out_acknowledged_laps(self):
+        state = SessionSyncState()
+        lap_1 = {"lap_number": 1, "sector_1_time_ms": 1}
+        lap_2 = {"lap_number": 2, "sector_1_time_ms": 2}
+        lap_times, lap_hashes = state.prepare_sync([lap_1], full_sync=True)
+        self.assertEqual(lap_times, [lap_1])
+        state.acknowledge(lap_hashes, full_sync=True)
+        lap_times, lap_hashes = state.prepare_sync([lap_1, lap_2])
+        self.assertEqual(lap_times, [lap_2])
+        self.assertEqual(set(lap_hashes), {1, 2})
+        # A changed lap gets sent again
+        state.acknowledge(lap_hashes)
+        lap_times, _ = state.prepare_sync([{"lap_number": 1, "sector_1_time_ms": 3}, lap_2])
+        self.assertEqual(lap_times, [{"lap_number": 1, "sector_1_time_ms": 3}])
+        # Unless it's a full sync
+        lap_times, _ = state.prepare_sync([lap_1, lap_2], full_sync=True)
+        self.assertEqual(lap_times, [lap_1, lap_2])
+
+    def test_stats_count_acknowledged_syncs(self):
+        state = SessionSyncState()
+        lap_1 = {"lap_number": 1, "sector_1_time_ms": 1}
+        lap_2 = {"lap_number": 2, "sector_1_time_ms": 2}
+        lap_1_size, lap_2_size = [len(json.dumps(lap, sort_keys=True)) for lap in (lap_1, lap_2)]
+        state.acknowledge(state.prepare_sync([lap_1], full_sync=True)[1], full_sync=True)
+        # Preparing a sync that never gets acknowledged doesn't count
+        state.prepare_sync([lap_1, lap_2])
+        self.assertEqual(state.get_stats()["bytes_sent"], lap_1_size)
+        state.acknowledge(state.prepare_sync([lap_1, lap_2])[1])
+        stats = state.get_stats()
+        self.assertEqual(stats["full_syncs"], 1)
+        self.assertEqual(stats["delta_syncs"], 1)
+        self.assertEqual(stats["bytes_sent"], lap_1_size + lap_2_size)
+        self.assertEqual(stats["bytes_saved"], lap_1_size)
+
+    def test_reset_forgets_acknowledged_laps(self):
+        state = SessionSyncState()
+        lap_1 = {"lap_number": 1}
+        state.acknowledge(state.prepare_sync([lap_1])[1])
+        self.assertEqual(state.prepare_sync([lap_1])[0], [])
+        state.reset()
+        self.assertEqual(state.prepare_sync([lap_1])[0], [lap_1])
+
+
+class F12022SessionDeltaSyncTest(TestCase):
+    def setUp(self):
+        self.api = StandInF1LapsAPI()
+        patcher = patch('receiver.f12022.session.F1LapsAPI2022', return_value=self.api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5,
+                                     session_sync_state=SessionSyncState())
+        self.session.team_id = 1
+
+    def complete_lap(self, lap_number):
+        lap = self.session.add_lap(lap_number)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 30000, 30000, 30000
+        return self.session.sync_to_f1laps(lap_number)
+
+    def test_updates_only_send_changed_laps(self):
+        self.assertTrue(self.complete_lap(1))
+        self.assertTrue(self.complete_lap(2))
+        self.assertTrue(self.complete_lap(3))
+        sent_laps = [[lap["lap_number"] for lap in params["lap_times"]] for _, params in self.api.requests]
+        self.assertEqual(sent_laps, [[1], [2], [3]])
+        self.assertEqual(sorted(self.api.sessions["1"]), [1, 2, 3])
+        # A changed lap gets sent again
+        self.session.lap_list[2].recompute_sector_3_time(91000)
+        self.assertTrue(self.session.sync_to_f1laps(lap_number=None, sync_entire_session=True))
+        self.assertEqual(self.api.requests[-1][1]["lap_times"], [self.session.lap_list[2].json_serialize()])
+        self.assertEqual(self.api.sessions["1"][2]["sector_3_time_ms"], 31000)
+        self.assertGreater(self.session.session_sync_state.get_stats()["bytes_saved"], 0)
+
+    def test_falls_back_to_full_sync_when_required(self):
+        self.complete_lap(1)
+        self.complete_lap(2)
+        self.api.sessions["1"].clear()
+        self.api.supports_partial_updates = False
+        self.assertTrue(self.complete_lap(3))
+        # The rejected partial update, then all laps
+        self.assertTrue(self.api.requests[-2][1]["lap_times_partial"])
+        self.assertNotIn("lap_times_partial", self.api.requests[-1][1])
+        self.assertEqual(sorted(self.api.sessions["1"]), [1, 2, 3])
+        # Only the accepted requests count: the session create, lap 2 and all laps
+        sync_state = self.session.session_sync_state
+        lap_sizes = {lap_number: sync_state.lap_fingerprints[lap_number][2] for lap_number in (1, 2, 3)}
+        stats = sync_state.get_stats()
+        self.assertEqual(stats["full_syncs"], 2)
+        self.assertEqual(stats["delta_syncs"], 1)
+        self.assertEqual(stats["bytes_sent"], lap_sizes[1] + lap_sizes[2] + sum(lap_sizes.values()))
+
+    def test_full_syncs_without_partial_lap_times_capability(self):
+        self.api.capabilities = set()
+        self.assertTrue(self.complete_lap(1))
+        self.assertTrue(self.complete_lap(2))
+        self.assertTrue(self.complete_lap(3))
+        sent_laps = [[lap["lap_number"] for lap in params["lap_times"]] for _, params in self.api.requests]
+        self.assertEqual(sent_laps, [[1], [1, 2], [1, 2, 3]])
+        self.assertFalse(any("lap_times_partial" in params for _, params in self.api.requests))
+        self.assertEqual(self.session.session_sync_state.get_stats()["full_syncs"], 3)
+
+    def test_failed_update_is_sent_again(self):
+        self.complete_lap(1)
+        self.api.call_api = MagicMock(return_value=None)
+        self.assertFalse(self.complete_lap(2))
+        del self.api.call_api
+        self.assertTrue(self.complete_lap(3))
+        self.assertEqual(sorted(self.api.sessions["1"]), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import ctypes
+import math
+import random
+from unittest import TestCase
+
+from receiver.struct_decoder import StructDecoder, get_struct_decoder
+from receiver.f12021.packets.helpers import HeaderFieldsToPacketType as F12021HeaderFieldsToPacketType
+from receiver.f12022.packets.helpers import HeaderFieldsToPacketType as F12022HeaderFieldsToPacketType, unpack_udp_packet
+from receiver.f12022.packets.motion import PacketMotionData
+from receiver.f12022.packets.event import PacketEventData
+from receiver.f12022.packets.session import PacketSessionData
+from receiver.f12022.packets.lap import PacketLapData
+from receiver.f12022.processor import F12022Processor
+
+
+def serialize_or_exception(packet):
+    """ Random data may contain invalid indexes, in which case both decoders need to raise the same """
+    try:
+        return repr(packet.serialize())
+    except Exception as ex:
+        return type(ex)
+
+
+def build_random_packet(packet_type, seed):
+    rng = random.Random(seed)
+    return bytes(rng.getrandbits(8) for _ in range(ctypes.sizeof(packet_type)))
+
+
+class StructDecoderTest(TestCase):
+
+    def assertFieldsEqual(self, ctypes_value, decoded_value, path):
+        """ Compare a ctypes decoded value with the generated decoder's, field by field """
+        if isinstance(ctypes_value, (ctypes.Structure, ctypes.Union)):
+            for field in ctypes_value._fields_:
+                self.assertFieldsEqual(getattr(ctypes_value, field[0]), getattr(decoded_value, field[0]), 
+                                       "%s.%s" % (path, field[0]))
+        elif isinstance(ctypes_value, ctypes.Array):
+            self.assertEqual(len(ctypes_value), len(decoded_value), path)
+            for index, element in enumerate(ctypes_value):
+                self.assertFieldsEqual(element, decoded_value[index], "%s[%s]" % (path, index))
+        elif isinstance(ctypes_value, float) and math.isnan(ctypes_value):
+            self.assertTrue(math.isnan(decoded_value), path)
+        else:
+            self.assertEqual(ctypes_value, decoded_value, path)
+
+    def test_decoders_match_ctypes(self):
+        packet_types = list(F12021HeaderFieldsToPacketType.values()) + \
+                       list(F12022HeaderFieldsToPacketType.values()) + [PacketMotionData]
+        for packet_type in packet_types:
+            decoder = StructDecoder(packet_type)
+            self.assertEqual(decoder.size, ctypes.sizeof(packet_type))
+            for seed in range(3):
+                packet = build_random_packet(packet_type, seed)
+                self.assertFieldsEqual(packet_type.from_buffer_copy(packet), decoder.decode(packet), packet_type.__name__)
+
+    def test_decoder_copies_writable_buffers(self):
+        packet = bytearray(build_random_packet(PacketMotionData, 1))
+        decoded_packet = StructDecoder(PacketMotionData).decode(memoryview(packet))
+        speed = decoded_packet.carMotionData[3].worldVelocityX
+        packet[:] = bytes(len(packet))
+        self.assertEqual(repr(decoded_packet.carMotionData[3].worldVelocityX), repr(speed))
+
+    def test_decoded_packets_serialize_like_ctypes(self):
+        for packet_type in F12022HeaderFieldsToPacketType.values():
+            packet = bytearray(build_random_packet(packet_type, 7))
+            packet_type.from_buffer(packet).header.playerCarIndex = 5
+            # Exercise the union branches of the event packet
+            if packet_type is PacketEventData:
+                packet_type.from_buffer(packet).eventStringCode = b"PENA"
+            if packet_type is PacketSessionData:
+                packet_type.from_buffer(packet).numWeatherForecastSamples = 3
+            ctypes_data = serialize_or_exception(unpack_udp_packet(bytes(packet), packet_type=packet_type))
+            decoded_data = serialize_or_exception(
+                unpack_udp_packet(bytes(packet), packet_type=packet_type, use_struct_decoder=True))
+            self.assertEqual(decoded_data, ctypes_data)
+
+
+    def test_decoders_are_generated_on_first_use(self):
+        decoder = get_struct_decoder(PacketLapData)
+        self.assertIsInstance(decoder, StructDecoder)
+        self.assertIs(get_struct_decoder(PacketLapData), decoder)
+
+    def test_processor_uses_struct_decoder(self):
+        processor = F12022Processor("key_123", True, player_car_only=False, use_struct_decoder=True)
+        session_packet = PacketSessionData()
+        session_packet.header.packetFormat = 2022
+        session_packet.header.packetId = 1
+        session_packet.trackId = 5
+        processor.process(bytes(session_packet))
+        self.assertEqual(processor.session.track_id, 5)
+
+if __name__ == '__main__':
+    unittest.main()
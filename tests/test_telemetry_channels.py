@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+from receiver.lap_telemetry_base import LapTelemetryBase, KEY_INDEX_MAP, KEY_ROUND_MAP
+from receiver.f12022.lap import F12022Lap
+from receiver.telemetry_channels import TelemetryChannelSchema, DEFAULT_TELEMETRY_SCHEMA, \
+                                        SOURCE_LAP, SOURCE_TELEMETRY, SOURCE_MOTION
+
+
+class TelemetryChannelSchemaTest(TestCase):
+
+    def test_default_channels(self):
+        self.assertEqual(KEY_INDEX_MAP, {"lap_distance": 0, "lap_time": 1, "speed": 2, "brake": 3, 
+                                         "throttle": 4, "gear": 5, "steer": 6, "drs": 7})
+        self.assertEqual(KEY_ROUND_MAP, {"lap_distance": 2, "lap_time": 0, "speed": 0, "brake": 3, 
+                                         "throttle": 3, "gear": 0, "steer": 3, "drs": 0})
+        self.assertEqual(DEFAULT_TELEMETRY_SCHEMA.get_extractor(SOURCE_LAP), (("lap_distance", 0, 2), ("lap_time", 1, 0)))
+        self.assertEqual(DEFAULT_TELEMETRY_SCHEMA.step_hold_columns, [5, 7])
+        self.assertFalse(DEFAULT_TELEMETRY_SCHEMA.has_source(SOURCE_MOTION))
+
+    def test_enabled_keys(self):
+        schema = TelemetryChannelSchema(enabled_keys=["lap_distance", "engine_rpm", "g_force_lateral"])
+        self.assertEqual(schema.key_index_map, {"lap_distance": 0, "engine_rpm": 1, "g_force_lateral": 2})
+        self.assertEqual(schema.get_extractor(SOURCE_TELEMETRY), (("engine_rpm", 1, 0),))
+        self.assertTrue(schema.has_source(SOURCE_MOTION))
+        with self.assertRaises(ValueError):
+            TelemetryChannelSchema(enabled_keys=["lap_distance", "unknown"])
+        with self.assertRaises(ValueError):
+            TelemetryChannelSchema(enabled_keys=["speed"])
+
+    def test_update_only_stores_source_channels(self):
+        schema = TelemetryChannelSchema(enabled_keys=["lap_distance", "speed", "tyre_front_left_temp_surface", "g_force_lateral"])
+        telemetry = LapTelemetryBase(lap_number=1, session_type=10, schema=schema)
+        telemetry.update({"frame_identifier": 1000, "lap_distance": 10.123, "speed": 999}, SOURCE_LAP)
+        telemetry.update({"frame_identifier": 1000, "speed": 200, "tyre_front_left_temp_max_surface": 95}, SOURCE_TELEMETRY)
+        telemetry.update({"frame_identifier": 1000, "g_force_lateral": -1.23456}, SOURCE_MOTION)
+        self.assertEqual(telemetry.frame_dict, {1000: [10.12, 200, 95, -1.235]})
+
+    def test_lap_update_telemetry_channels(self):
+        schema = TelemetryChannelSchema(enabled_keys=["lap_distance", "g_force_lateral"])
+        lap = F12022Lap(lap_number=1, session_type=10, telemetry_enabled=True, telemetry_schema=schema)
+        # No telemetry yet, nothing gets stored
+        lap.update_telemetry_channels(SOURCE_MOTION, {"frame_identifier": 999, "g_force_lateral": 1.0})
+        self.assertIsNone(lap.telemetry)
+        lap.update(lap_values={"sector_1_ms": 0}, telemetry_values={"frame_identifier": 1000, "lap_distance": 10, "lap_time": 100}, 
+                   telemetry_source=SOURCE_LAP)
+        lap.update_telemetry_channels(SOURCE_MOTION, {"frame_identifier": 1000, "g_force_lateral": 1.5})
+        self.assertEqual(lap.telemetry.frame_dict, {1000: [10, 1.5]})
+        # Sources without enabled channels are ignored
+        lap.update_telemetry_channels(SOURCE_TELEMETRY, {"frame_identifier": 1001, "speed": 200})
+        self.assertEqual(list(lap.telemetry.frame_dict), [1000])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+from unittest import TestCase
+
+from receiver.lap_telemetry_base import LapTelemetryBase
+from receiver.f12022.lap import F12022Lap
+from receiver.f12022.session import F12022Session
+from receiver.telemetry_encoding import encode_frame_store, decode_telemetry_string, \
+                                        TELEMETRY_ENCODING_JSON, TELEMETRY_ENCODING_DELTA_ZLIB
+
+
+def create_lap_telemetry(frame_count=100):
+    lap_telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+    for index in range(frame_count):
+        lap_telemetry.update({
+            "frame_identifier": 1000 + index * 2,
+            "lap_distance": 10 + index * 1.23,
+            "lap_time": index * 33,
+            "speed": 200 + index % 7,
+            "brake": (index % 10) / 10.0,
+            "throttle": 1.0 - (index % 10) / 10.0,
+            "gear": 3 + index % 3,
+            "steer": -0.5 + (index % 4) * 0.333,
+            "drs": index % 2,
+        })
+    return lap_telemetry
+
+
+class TelemetryEncodingTest(TestCase):
+
+    def test_json_encoding_is_unchanged(self):
+        lap_telemetry = create_lap_telemetry()
+        telemetry_string = encode_frame_store(lap_telemetry.frames, TELEMETRY_ENCODING_JSON)
+        self.assertEqual(telemetry_string, json.dumps(lap_telemetry.frame_dict))
+        self.assertEqual(decode_telemetry_string(telemetry_string), lap_telemetry.frame_dict)
+
+    def test_delta_zlib_round_trip(self):
+        lap_telemetry = create_lap_telemetry()
+        telemetry_string = encode_frame_store(lap_telemetry.frames, TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(decode_telemetry_string(telemetry_string, TELEMETRY_ENCODING_DELTA_ZLIB), lap_telemetry.frame_dict)
+        self.assertLess(len(telemetry_string), len(json.dumps(lap_telemetry.frame_dict)) / 4)
+
+    def test_delta_zlib_round_trip_with_unset_and_negative_values(self):
+        lap_telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+        lap_telemetry.frame_dict = {
+            1000: [5, 50, None, None, None, None, -0.75, None],
+            1001: [5.5, None, 300, 0.5, 1.0, -1, None, 0],
+            1005: [None, None, None, None, None, None, None, None],
+        }
+        telemetry_string = encode_frame_store(lap_telemetry.frames, TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(decode_telemetry_string(telemetry_string, TELEMETRY_ENCODING_DELTA_ZLIB), lap_telemetry.frame_dict)
+
+    def test_delta_zlib_empty_lap(self):
+        lap_telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+        telemetry_string = encode_frame_store(lap_telemetry.frames, TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(decode_telemetry_string(telemetry_string, TELEMETRY_ENCODING_DELTA_ZLIB), {})
+
+    def test_unknown_encoding(self):
+        lap_telemetry = create_lap_telemetry(1)
+        with self.assertRaises(ValueError):
+            encode_frame_store(lap_telemetry.frames, "xml")
+
+    def test_lap_and_session_params_with_encoding(self):
+        session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5, 
+                                telemetry_encoding=TELEMETRY_ENCODING_DELTA_ZLIB)
+        lap = F12022Lap(lap_number=1, session_type=10, telemetry_enabled=True)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 1, 2, 3
+        lap.telemetry = create_lap_telemetry(10)
+        session.lap_list[1] = lap
+        lap_params = session.get_f1laps_lap_params(lap)
+        self.assertEqual(lap_params["telemetry_data_encoding"], TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(decode_telemetry_string(lap_params["telemetry_data_string"], TELEMETRY_ENCODING_DELTA_ZLIB), 
+                         lap.telemetry.frame_dict)
+        lap_times = session.get_f1laps_lap_times_list()
+        self.assertEqual(lap_times[0]["telemetry_data_encoding"], TELEMETRY_ENCODING_DELTA_ZLIB)
+        # JSON stays the default, without an encoding param
+        session.telemetry_encoding = TELEMETRY_ENCODING_JSON
+        self.assertNotIn("telemetry_data_encoding", session.get_f1laps_lap_params(lap))
+        self.assertEqual(session.get_f1laps_lap_params(lap)["telemetry_data_string"], json.dumps(lap.telemetry.frame_dict))
+
+
+if __name__ == '__main__':
+    unittest.main()
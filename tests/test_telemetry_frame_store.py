@@ -0,0 +1,71 @@
+import json
+from unittest import TestCase
+
+from receiver.telemetry_frame_store import TelemetryFrameStore
+
+
+def create_store():
+    return TelemetryFrameStore(["f", "i", "h", "f", "b"], [2, 0, 0, 3, 0])
+
+
+class TelemetryFrameStoreTest(TestCase):
+
+    def test_values_round_trip_with_types(self):
+        store = create_store()
+        store.add_frame(1000, [5, 50, None, 0.123, -1])
+        store.add_frame(1001, [5.0, 50.0, 300, 1.0, 0])
+        store.add_frame(1002, [1234.57, None, None, None, None])
+        frame_dict = {
+            1000: [5, 50, None, 0.123, -1],
+            1001: [5.0, 50.0, 300, 1.0, 0],
+            1002: [1234.57, None, None, None, None],
+        }
+        self.assertEqual(store.to_dict(), frame_dict)
+        # Ints stay ints and floats stay floats
+        self.assertEqual(json.dumps(store.to_dict()), json.dumps(frame_dict))
+
+    def test_set_value_and_unset(self):
+        store = create_store()
+        row = store.get_or_create_row(1000)
+        store.set_value(row, 2, 100)
+        self.assertEqual(store.get_value(row, 2), 100)
+        store.set_value(row, 2, None)
+        self.assertEqual(store.get_value(row, 2), None)
+
+    def test_out_of_order_frames_get_sorted(self):
+        store = create_store()
+        for frame_id in [1000, 1002, 1001]:
+            store.add_frame(frame_id, [frame_id, None, None, None, None])
+        self.assertEqual(list(store.to_dict()), [1000, 1001, 1002])
+        self.assertEqual(store.find_row(1001), 1)
+        self.assertEqual(store.find_row(999), None)
+        self.assertEqual(store.get_first_frame_id(), 1000)
+        self.assertEqual(store.get_last_frame_id(), 1002)
+
+    def test_column_upgrade_keeps_values(self):
+        store = create_store()
+        store.add_frame(1000, [5, 70000, None, None, 1000])
+        store.add_frame(1001, [1000000.01, 1.5, None, None, None])
+        self.assertEqual(store.to_dict(), {
+            1000: [5, 70000, None, None, 1000],
+            1001: [1000000.01, 1.5, None, None, None],
+        })
+        self.assertEqual(store.columns[0].typecode, "d")
+        self.assertEqual(store.columns[4].typecode, "d")
+
+    def test_remove_truncate_and_keep_only(self):
+        store = create_store()
+        for frame_id in range(1000, 1010):
+            store.add_frame(frame_id, [frame_id, None, None, None, None])
+        self.assertTrue(store.remove(1005))
+        self.assertFalse(store.remove(1005))
+        self.assertEqual(store.truncate_from(1007), 3)
+        self.assertEqual(len(store), 6)
+        store.keep_only(1002)
+        self.assertEqual(store.to_dict(), {1002: [1002, None, None, None, None]})
+        store.clear()
+        self.assertEqual(store.to_dict(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
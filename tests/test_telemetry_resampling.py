@@ -0,0 +1,68 @@
+import json
+from unittest import TestCase
+
+from receiver.lap_telemetry_base import LapTelemetryBase
+from receiver.f12022.lap import F12022Lap
+from receiver.f12022.session import F12022Session
+from receiver.telemetry_resampling import interpolate, resample_by_distance
+
+
+class TelemetryResamplingTest(TestCase):
+
+    def test_interpolate(self):
+        self.assertEqual(interpolate([0, 10], [0, 100], [0, 2.5, 5, 10]), [0, 25, 50, 100])
+        # Outside the samples, the edge values are used
+        self.assertEqual(interpolate([2, 4], [20, 40], [0, 6]), [20, 40])
+        # Step hold keeps the last value
+        self.assertEqual(interpolate([0, 10, 20], [3, 4, 5], [0, 5, 10, 19], step_hold=True), [3, 3, 4, 4])
+
+    def test_resample_lap(self):
+        telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+        telemetry.frame_dict = {
+            1000: [1.0, 10, 100, 0.0, 1.0, 3, 0.0, 0],
+            # Pause: same distance, gets ignored
+            1001: [1.0, 10, 100, 0.0, 1.0, 3, 0.0, 0],
+            1002: [5.0, 50, 140, 0.4, 0.6, 4, -0.2, 1],
+            # Telemetry packet missing
+            1003: [7.0, 70, None, None, None, None, None, None],
+        }
+        resampled_frames = telemetry.get_resampled_frames(distance_step=2)
+        self.assertEqual(resampled_frames.to_dict(), {
+            1: [2, 20, 110, 0.1, 0.9, 3, -0.05, 0],
+            2: [4, 40, 130, 0.3, 0.7, 3, -0.15, 0],
+            3: [6, 60, 140, 0.4, 0.6, 4, -0.2, 1],
+        })
+
+    def test_resample_ignores_negative_distance_and_empty_lap(self):
+        telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+        self.assertEqual(telemetry.get_resampled_frames(distance_step=2).to_dict(), {})
+        telemetry.frame_dict = {1000: [-5.0, 10, 100, None, None, None, None, None]}
+        self.assertEqual(telemetry.get_resampled_frames(distance_step=2).to_dict(), {})
+        with self.assertRaises(ValueError):
+            resample_by_distance(telemetry.frames, 0, distance_step=0)
+
+    def test_resampled_frame_count_doesnt_depend_on_send_rate(self):
+        resampled_frame_counts = set()
+        for frames_per_meter in [1, 3]:
+            telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+            for index in range(500 * frames_per_meter):
+                telemetry.update({"frame_identifier": 1000 + index, "lap_distance": 1 + index / frames_per_meter, "speed": 200})
+            resampled_frame_counts.add(len(telemetry.get_resampled_frames(distance_step=2)))
+        self.assertEqual(resampled_frame_counts, {250})
+
+    def test_session_upload_with_distance_step(self):
+        session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5, telemetry_distance_step=2)
+        lap = F12022Lap(lap_number=1, session_type=10, telemetry_enabled=True)
+        lap.sector_1_ms, lap.sector_2_ms, lap.sector_3_ms = 1, 2, 3
+        lap.telemetry = LapTelemetryBase(lap_number=1, session_type=10)
+        lap.telemetry.frame_dict = {1000: [1.0, 10, 100, None, None, None, None, None],
+                                    1001: [3.0, 30, 120, None, None, None, None, None]}
+        session.lap_list[1] = lap
+        lap_params = session.get_f1laps_lap_params(lap)
+        self.assertEqual(lap_params["telemetry_distance_step"], 2)
+        self.assertEqual(json.loads(lap_params["telemetry_data_string"]), {"1": [2, 20, 110, None, None, None, None, None]})
+        self.assertEqual(session.get_f1laps_lap_times_list()[0]["telemetry_distance_step"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
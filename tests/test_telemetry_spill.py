@@ -0,0 +1,107 @@
+import json
+from unittest import TestCase
+
+from receiver.f12022.lap import F12022Lap
+from receiver.telemetry_encoding import decode_telemetry_string, TELEMETRY_ENCODING_DELTA_ZLIB
+from receiver.telemetry_spill import TelemetrySpillFile, TelemetrySpillPolicy
+
+
+def create_lap(lap_number, frame_count=100):
+    lap = F12022Lap(lap_number=lap_number, session_type=10, telemetry_enabled=True)
+    lap.init_telemetry()
+    for index in range(frame_count):
+        lap.telemetry.update({"frame_identifier": lap_number * 10000 + index, "lap_distance": 1 + index * 1.5, 
+                              "lap_time": index * 16, "speed": 200 + index % 50, "brake": 0.123})
+    return lap
+
+
+class TelemetrySpillFileTest(TestCase):
+
+    def test_append_and_read(self):
+        spill_file = TelemetrySpillFile()
+        first_segment = spill_file.append('{"1": [1.5]}')
+        self.assertEqual(first_segment.read(), '{"1": [1.5]}')
+        # Reading after the file grew
+        second_segment = spill_file.append('{"2": [2.5]}' * 1000)
+        self.assertEqual(second_segment.read(), '{"2": [2.5]}' * 1000)
+        self.assertEqual(first_segment.read(), '{"1": [1.5]}')
+        spill_file.close()
+
+
+class TelemetrySpillPolicyTest(TestCase):
+
+    def test_spills_uploaded_laps_over_budget(self):
+        lap_list = {lap_number: create_lap(lap_number) for lap_number in [1, 2, 3]}
+        telemetry_strings = {lap_number: lap.get_telemetry_string() for lap_number, lap in lap_list.items()}
+        lap_list[1].has_been_uploaded = True
+        lap_list[3].has_been_uploaded = True
+        # Within budget, nothing happens
+        policy = TelemetrySpillPolicy(memory_budget_bytes=10 * 1024 * 1024)
+        self.assertEqual(policy.apply(lap_list), 0)
+        # Over budget, only uploaded laps that aren't the current lap get spilled
+        policy = TelemetrySpillPolicy(memory_budget_bytes=0)
+        self.assertEqual(policy.apply(lap_list), 1)
+        self.assertIsNone(lap_list[1].telemetry)
+        self.assertIsNotNone(lap_list[2].telemetry)
+        self.assertIsNotNone(lap_list[3].telemetry)
+        # Spilled telemetry gets read back when the lap gets serialized
+        for lap_number, lap in lap_list.items():
+            self.assertEqual(lap.get_telemetry_string(), telemetry_strings[lap_number])
+        self.assertEqual(json.loads(lap_list[1].json_serialize()["telemetry_data_string"]), json.loads(telemetry_strings[1]))
+        policy.close()
+
+    def test_spilled_laps_dont_cache_their_telemetry_string(self):
+        lap = create_lap(1)
+        serialized_lap = lap.json_serialize()
+        telemetry_string = serialized_lap["telemetry_data_string"]
+        # The serialized lap shares the telemetry JSON, the compact encoding is counted on top
+        self.assertEqual(lap.get_memory_size(), lap.telemetry.get_memory_size())
+        compact_string = lap.json_serialize(TELEMETRY_ENCODING_DELTA_ZLIB)["telemetry_data_string"]
+        self.assertEqual(lap.get_memory_size(), lap.telemetry.get_memory_size() + len(compact_string))
+        lap.has_been_uploaded = True
+        policy = TelemetrySpillPolicy(memory_budget_bytes=0)
+        self.assertEqual(policy.apply({1: lap, 2: create_lap(2)}), 1)
+        self.assertEqual(lap.get_memory_size(), 0)
+        self.assertTrue(all("telemetry_data_string" not in cached_lap for _, _, cached_lap in lap.serialized_lap_cache.values()))
+        # The telemetry gets read back from the spill file
+        self.assertEqual(lap.json_serialize(), serialized_lap)
+        self.assertEqual(lap.json_serialize(TELEMETRY_ENCODING_DELTA_ZLIB)["telemetry_data_string"], compact_string)
+        self.assertEqual(lap.get_memory_size(), 0)
+        policy.close()
+
+    def test_serialized_laps_count_towards_the_budget(self):
+        lap_list = {lap_number: create_lap(lap_number) for lap_number in [1, 2]}
+        lap_list[1].has_been_uploaded = True
+        memory_size = sum(lap.get_memory_size() for lap in lap_list.values())
+        policy = TelemetrySpillPolicy(memory_budget_bytes=memory_size)
+        self.assertEqual(policy.apply(lap_list), 0)
+        lap_list[2].json_serialize(TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(policy.apply(lap_list), 1)
+        policy.close()
+
+    def test_spills_old_laps_that_werent_uploaded(self):
+        lap_list = {lap_number: create_lap(lap_number, 10) for lap_number in range(1, 8)}
+        policy = TelemetrySpillPolicy(memory_budget_bytes=0, max_laps_in_memory=5)
+        self.assertEqual(policy.apply(lap_list), 2)
+        self.assertEqual([lap_number for lap_number, lap in lap_list.items() if lap.spilled_telemetry], [1, 2])
+        policy.close()
+
+    def test_spilled_lap_reloads(self):
+        lap = create_lap(1)
+        frame_dict = lap.telemetry.frame_dict
+        policy = TelemetrySpillPolicy(memory_budget_bytes=0)
+        lap.has_been_uploaded = True
+        policy.apply({1: lap, 2: create_lap(2)})
+        self.assertIsNone(lap.telemetry)
+        # Other encodings get encoded from the spilled frames
+        telemetry_string = lap.get_telemetry_string(TELEMETRY_ENCODING_DELTA_ZLIB)
+        self.assertEqual(decode_telemetry_string(telemetry_string, TELEMETRY_ENCODING_DELTA_ZLIB), frame_dict)
+        # New telemetry of a spilled lap brings back its frames
+        lap.update(lap_values={"sector_1_ms": 0}, telemetry_values={"frame_identifier": 20000, "lap_distance": 200, "lap_time": 1})
+        self.assertIsNone(lap.spilled_telemetry)
+        self.assertEqual(len(lap.telemetry.frame_dict), len(frame_dict) + 1)
+        policy.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import threading
+from unittest import TestCase
+
+from receiver.uploader import F1LapsUploader, UploadJob
+
+
+class F1LapsUploaderTest(TestCase):
+    def test_jobs_are_uploaded_in_order(self):
+        uploader = F1LapsUploader()
+        uploaded = []
+        uploader.enqueue(UploadJob("lap 1", lambda: uploaded.append(1) or True))
+        uploader.enqueue(UploadJob("lap 2", lambda: uploaded.append(2) or True))
+        self.assertEqual(uploader.get_queue_depth(), 2)
+        self.assertTrue(uploader.process_next_job(timeout=0))
+        self.assertTrue(uploader.process_next_job(timeout=0))
+        self.assertFalse(uploader.process_next_job(timeout=0))
+        self.assertEqual(uploaded, [1, 2])
+        stats = uploader.get_stats()
+        self.assertEqual(stats["queue_depth"], 0)
+        self.assertEqual(stats["uploaded"], 2)
+        self.assertEqual(stats["failed"], 0)
+        self.assertIsNotNone(stats["latency_ms_last"])
+
+    def test_session_updates_are_coalesced(self):
+        uploader = F1LapsUploader()
+        uploaded = []
+        uploader.enqueue(UploadJob("session v1", lambda: uploaded.append("v1") or True, coalesce_key="uid_1"))
+        uploader.enqueue(UploadJob("lap", lambda: uploaded.append("lap") or True))
+        uploader.enqueue(UploadJob("session v2", lambda: uploaded.append("v2") or True, coalesce_key="uid_1"))
+        uploader.enqueue(UploadJob("other session", lambda: uploaded.append("other") or True, coalesce_key="uid_2"))
+        self.assertEqual(uploader.get_queue_depth(), 3)
+        while uploader.process_next_job(timeout=0):
+            pass
+        self.assertEqual(uploaded, ["v2", "lap", "other"])
+        self.assertEqual(uploader.get_stats()["coalesced"], 1)
+        # Once the queued job got sent, a new one is queued again
+        uploader.enqueue(UploadJob("session v3", lambda: uploaded.append("v3") or True, coalesce_key="uid_1"))
+        self.assertEqual(uploader.get_queue_depth(), 1)
+
+    def test_jobs_are_prepared_when_enqueued(self):
+        uploader = F1LapsUploader()
+        prepared, uploaded = [], []
+        # The first upload is stuck, the jobs behind it get prepared anyway
+        upload_started, upload_released = threading.Event(), threading.Event()
+        def stuck_upload():
+            upload_started.set()
+            return upload_released.wait(5)
+        uploader.enqueue(UploadJob("stuck", stuck_upload))
+        thread = threading.Thread(target=uploader.process_next_job)
+        thread.start()
+        self.assertTrue(upload_started.wait(5))
+        uploader.enqueue(UploadJob("session v1", lambda payload: uploaded.append(payload) or True, coalesce_key="uid_1",
+                                   prepare=lambda: prepared.append("v1") or "v1"))
+        uploader.enqueue(UploadJob("session v2", lambda payload: uploaded.append(payload) or True, coalesce_key="uid_1",
+                                   prepare=lambda: prepared.append("v2") or "v2"))
+        all_prepared = threading.Event()
+        uploader.after_prepared(all_prepared.set)
+        self.assertTrue(all_prepared.wait(5))
+        self.assertEqual(prepared, ["v1", "v2"])
+        upload_released.set()
+        thread.join(5)
+        # The coalesced job uploads the newest prepared payload
+        self.assertTrue(uploader.process_next_job(timeout=0))
+        self.assertEqual(uploaded, ["v2"])
+
+    def test_failed_and_raising_jobs_are_counted(self):
+        uploader = F1LapsUploader()
+        def raise_error():
+            raise ValueError("API down")
+        uploader.enqueue(UploadJob("failing", lambda: False))
+        uploader.enqueue(UploadJob("raising", raise_error))
+        uploader.process_next_job(timeout=0)
+        uploader.process_next_job(timeout=0)
+        self.assertEqual(uploader.get_stats()["failed"], 2)
+
+    def test_worker_thread_drains_queue_on_kill(self):
+        uploader = F1LapsUploader()
+        uploaded = []
+        for index in range(3):
+            uploader.enqueue(UploadJob("lap", lambda index=index: uploaded.append(index) or True))
+        uploader.start()
+        uploader.kill()
+        uploader.join(timeout=5)
+        self.assertFalse(uploader.is_alive())
+        self.assertEqual(uploaded, [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -198,6 +198,34 @@ class F12022LapTest(TestCase):
         self.assertEqual(lap.tyre_front_right_temp_max_surface, 60)
         self.assertEqual(lap.tyre_rear_left_temp_max_inner, 11)
 
+    def test_json_serialize_is_cached_until_lap_changes(self):
+        lap = F12022Lap(lap_number=2, session_type=13, telemetry_enabled=True)
+        lap.update(lap_values={"sector_1_ms": 1}, telemetry_values={"lap_distance": 5, "frame_identifier": 1000, "lap_time": 50})
+        serialized_lap = lap.json_serialize()
+        self.assertIs(lap.json_serialize(), serialized_lap)
+        # Lap changes
+        lap.update(lap_values={"sector_2_ms": 2}, telemetry_values={"lap_distance": 5, "frame_identifier": 1000, "lap_time": 50})
+        self.assertEqual(lap.json_serialize()["sector_2_time_ms"], 2)
+        lap.recompute_sector_3_time(10)
+        self.assertEqual(lap.json_serialize()["sector_3_time_ms"], 7)
+        # Upload state isn't part of the payload
+        serialized_lap = lap.json_serialize()
+        lap.has_been_uploaded = True
+        self.assertIs(lap.json_serialize(), serialized_lap)
+        # Telemetry changes
+        serialized_lap = lap.json_serialize()
+        lap.telemetry.update({"lap_distance": 6, "frame_identifier": 1001})
+        self.assertIsNot(lap.json_serialize(), serialized_lap)
+        self.assertEqual(lap.json_serialize()["telemetry_data_string"], lap.get_telemetry_string())
+        # Penalties
+        penalty = F12022Penalty()
+        penalty.frame_id = 1002
+        lap.add_penalty(penalty)
+        self.assertEqual(len(lap.json_serialize()["penalties"]), 1)
+        lap.process_flashback_event(1001)
+        self.assertEqual(lap.json_serialize()["penalties"], [])
+        self.assertEqual(lap.json_serialize()["telemetry_data_string"], '{"1000": [5, 50, null, null, null, null, null, null]}')
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,3 +1,4 @@
+import json
 from unittest import TestCase
 
 from receiver.f12022.telemetry import F12022LapTelemetry
@@ -88,6 +89,80 @@ class F12022LapTelemetryTest(TestCase):
         self.assertEqual(len(telemetry.frame_dict), 1)
         self.assertEqual(telemetry.last_lap_distance, None)
 
+    def test_clean_frame_outlap_removes_new_frame(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        telemetry.update(telemetry_dict = {"lap_distance": 50, "frame_identifier": 1000})
+        telemetry.update(telemetry_dict = {"lap_distance": 100, "frame_identifier": 1001})
+        # Distance drops while the first frame was early in the lap: outlap, new frame gets removed
+        telemetry.update(telemetry_dict = {"lap_distance": 10, "frame_identifier": 1002})
+        self.assertEqual(list(telemetry.frame_dict), [1000, 1001])
+        self.assertEqual(telemetry.frames_popped_list, [1002])
+        self.assertEqual(telemetry.last_lap_distance, 100)
+        # The popped frame doesn't come back
+        telemetry.update(telemetry_dict = {"speed": 100, "frame_identifier": 1002})
+        self.assertEqual(list(telemetry.frame_dict), [1000, 1001])
+
+    def test_clean_frame_new_lap_removes_old_frames(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        telemetry.update(telemetry_dict = {"lap_distance": 300, "frame_identifier": 1000})
+        telemetry.update(telemetry_dict = {"lap_distance": 400, "frame_identifier": 1001})
+        # Distance drops after a frame late in the lap: new lap, old frames get removed
+        telemetry.update(telemetry_dict = {"lap_distance": 10, "speed": 120, "frame_identifier": 1002})
+        self.assertEqual(telemetry.frame_dict, {1002: [10, None, 120, None, None, None, None, None]})
+        self.assertEqual(telemetry.last_lap_distance, 10)
+
+    def test_process_flashback_event_with_out_of_order_frames(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        for index, frame_id in enumerate([1000, 1003, 1001, 1004, 1002]):
+            telemetry.update(telemetry_dict = {"lap_distance": 10 + index, "frame_identifier": frame_id})
+        self.assertEqual(list(telemetry.frame_dict), [1000, 1001, 1002, 1003, 1004])
+        telemetry.process_flashback_event(1002)
+        self.assertEqual(list(telemetry.frame_dict), [1000, 1001])
+
+    def test_telemetry_string_is_encoded_while_driving(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        for index in range(200):
+            telemetry.update(telemetry_dict = {"lap_distance": 10 + index * 1.5, "lap_time": index * 16, "frame_identifier": 1000 + index})
+            telemetry.update(telemetry_dict = {"speed": 100 + index, "brake": 0.1234, "frame_identifier": 1000 + index})
+        # Only the frames in the encode window are left for the end of the lap
+        self.assertEqual(len(telemetry.json_encoder), 200 - telemetry.ENCODE_FRAME_WINDOW)
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+        # A late update of an encoded frame gets re-encoded
+        telemetry.update(telemetry_dict = {"throttle": 1, "frame_identifier": 1010})
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+
+    def test_telemetry_string_is_kept_instead_of_the_buffer(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        for index in range(200):
+            telemetry.update(telemetry_dict = {"lap_distance": 10 + index * 1.5, "frame_identifier": 1000 + index})
+        telemetry_string = telemetry.get_telemetry_string()
+        # The buffer is released, the JSON is only held once
+        self.assertIsNone(telemetry.json_encoder.buffer)
+        self.assertIs(telemetry.get_telemetry_string(), telemetry_string)
+        self.assertEqual(telemetry.get_memory_size(), telemetry.frames.get_memory_size() + len(telemetry_string) + 200 * 4)
+        # New and changed frames bring back the buffer
+        telemetry.update(telemetry_dict = {"lap_distance": 400, "frame_identifier": 1200})
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+        telemetry.update(telemetry_dict = {"speed": 200, "frame_identifier": 1150})
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+        telemetry.process_flashback_event(1100)
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+
+    def test_telemetry_string_after_flashback_and_new_lap(self):
+        telemetry = F12022LapTelemetry(lap_number=2, session_type=11)
+        for index in range(200):
+            telemetry.update(telemetry_dict = {"lap_distance": 300 + index, "frame_identifier": 1000 + index})
+        telemetry.process_flashback_event(1050)
+        self.assertEqual(len(telemetry.json_encoder), 50)
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+        # Frames after the flashback replace the flashed back frames
+        for index in range(50, 150):
+            telemetry.update(telemetry_dict = {"lap_distance": 300 + index + 0.5, "frame_identifier": 1100 + index})
+        self.assertEqual(telemetry.get_telemetry_string(), json.dumps(telemetry.frame_dict))
+        # New lap removes all frames
+        telemetry.update(telemetry_dict = {"lap_distance": 10, "frame_identifier": 1300})
+        self.assertEqual(telemetry.get_telemetry_string(), '{"1300": [10, null, null, null, null, null, null, null]}')
+
     
 
 if __name__ == '__main__':
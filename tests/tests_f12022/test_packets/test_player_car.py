@@ -0,0 +1,51 @@
+import ctypes
+import random
+from unittest import TestCase
+
+from receiver.player_car_decoder import PlayerCarPacket
+from receiver.f12022.packets.helpers import unpack_udp_packet, PacketTypeToPlayerCarDecoder, HeaderFieldsToPacketType
+from receiver.f12022.packets.lap import PacketLapData
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+from receiver.f12022.packets.car_status import PacketCarStatusData
+from receiver.f12022.packets.car_damage import PacketCarDamageData
+
+
+def build_random_packet(packet_type, player_car_index, seed=2022):
+    """ Random packet body with a valid header for the given player car """
+    rng = random.Random(seed)
+    packet = bytearray(rng.getrandbits(8) for _ in range(ctypes.sizeof(packet_type)))
+    header = packet_type.from_buffer(packet).header
+    header.packetFormat = 2022
+    header.packetId = {v: k for k, v in HeaderFieldsToPacketType.items()}[packet_type]
+    header.playerCarIndex = player_car_index
+    return bytes(packet)
+
+
+class PlayerCarDecoderTest(TestCase):
+
+    def test_all_car_array_packets_have_a_decoder(self):
+        self.assertEqual(set(PacketTypeToPlayerCarDecoder), 
+            {PacketLapData, PacketCarTelemetryData, PacketCarStatusData, PacketCarDamageData})
+
+    def test_player_car_serialize_matches_full_packet(self):
+        for packet_type in PacketTypeToPlayerCarDecoder:
+            for player_car_index in [0, 7, 21]:
+                packet = build_random_packet(packet_type, player_car_index, seed=player_car_index)
+                full_packet = unpack_udp_packet(packet, packet_type=packet_type)
+                player_car_packet = unpack_udp_packet(packet, packet_type=packet_type, player_car_only=True)
+                self.assertIsInstance(player_car_packet, PlayerCarPacket)
+                # repr() so that NaN floats in the random data compare equal
+                self.assertEqual(repr(player_car_packet.serialize()), repr(full_packet.serialize()))
+
+    def test_invalid_player_car_index_serializes_to_none(self):
+        packet = build_random_packet(PacketLapData, 255)
+        self.assertEqual(unpack_udp_packet(packet, packet_type=PacketLapData).serialize(), None)
+        self.assertEqual(unpack_udp_packet(packet, packet_type=PacketLapData, player_car_only=True).serialize(), None)
+
+    def test_player_car_packet_does_not_create_session(self):
+        packet = build_random_packet(PacketCarStatusData, 3)
+        self.assertFalse(unpack_udp_packet(packet, player_car_only=True).creates_session_object)
+
+
+if __name__ == '__main__':
+    unittest.main()
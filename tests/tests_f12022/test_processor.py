@@ -4,6 +4,10 @@ from unittest.mock import patch, MagicMock
 from receiver.f12022.processor import F12022Processor
 from receiver.f12022.session import F12022Session
 from receiver.f12022.types import map_game_mode_to_f1laps
+from receiver.f12022.packets.session import PacketSessionData
+from receiver.f12022.packets.telemetry import PacketCarTelemetryData
+from receiver.f12022.packets.motion import PacketMotionData
+from receiver.telemetry_channels import TelemetryChannelSchema, SOURCE_LAP
 
 
 class F12022SessionTest(TestCase):
@@ -217,8 +221,81 @@ class F12022SessionTest(TestCase):
         processor.session.get_current_lap().telemetry.last_lap_distance = 1001
         self.assertTrue(processor.process_motion_packet(packet_data))
 
-    
-    
+    def test_process_motion_packet_updates_motion_channels(self):
+        schema = TelemetryChannelSchema(enabled_keys=["lap_distance", "g_force_lateral"])
+        processor = F12022Processor("key_123", True, telemetry_schema=schema)
+        processor.session = processor.create_session({
+            "session_uid": "uid_123", "session_type": 10, "track_id": 1, "is_online_game": False, "ai_difficulty": 90,
+            "weather_id": 1, "game_mode": 5, "season_link_identifier": 1,
+        })
+        processor.session.add_lap(1)
+        lap = processor.session.get_current_lap()
+        lap.update(lap_values={"sector_1_ms": 0}, telemetry_values={"frame_identifier": 1000, "lap_distance": 10, "lap_time": 100},
+                   telemetry_source=SOURCE_LAP)
+        motion_packet = PacketMotionData()
+        motion_packet.header.packetFormat = 2022
+        motion_packet.header.packetId = 0
+        motion_packet.header.frameIdentifier = 1000
+        motion_packet.carMotionData[0].gForceLateral = 1.5
+        processor.process(bytes(motion_packet))
+        self.assertEqual(lap.telemetry.frame_dict, {1000: [10, 1.5]})
+        self.assertEqual(processor.get_skipped_packet_counts()["unused"], 0)
+
+    def test_process_skips_motion_packets_without_motion_channels(self):
+        processor = F12022Processor("key_123", True)
+        processor.session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5)
+        motion_packet = PacketMotionData()
+        motion_packet.header.packetFormat = 2022
+        motion_packet.header.packetId = 0
+        with patch('receiver.f12022.processor.unpack_udp_packet') as mock_unpack:
+            processor.process(bytes(motion_packet))
+            mock_unpack.assert_not_called()
+        self.assertEqual(processor.get_skipped_packet_counts(), {"no_session": 0, "spectating": 0, "unused": 1})
+
+    @patch('receiver.f12022.processor.unpack_udp_packet')
+    def test_process_skips_non_session_packets_without_session(self, mock_unpack):
+        processor = F12022Processor("key_123", True)
+        telemetry_packet = PacketCarTelemetryData()
+        telemetry_packet.header.packetFormat = 2022
+        telemetry_packet.header.packetId = 6
+        processor.process(bytes(telemetry_packet))
+        mock_unpack.assert_not_called()
+        self.assertEqual(processor.get_skipped_packet_counts(), {"no_session": 1, "spectating": 0, "unused": 0})
+
+    def test_process_skips_packets_while_spectating(self):
+        processor = F12022Processor("key_123", True)
+        session_packet = PacketSessionData()
+        session_packet.header.packetFormat = 2022
+        session_packet.header.packetId = 1
+        session_packet.isSpectating = 1
+        processor.process(bytes(session_packet))
+        self.assertTrue(processor.is_spectating)
+        self.assertEqual(processor.session, None)
+        processor.process(bytes(PacketCarTelemetryData()), packet_type=PacketCarTelemetryData)
+        self.assertEqual(processor.get_skipped_packet_counts(), {"no_session": 0, "spectating": 1, "unused": 0})
+        # Stopping spectating creates a session
+        session_packet.isSpectating = 0
+        processor.process(bytes(session_packet))
+        self.assertFalse(processor.is_spectating)
+        self.assertNotEqual(processor.session, None)
+
+    def test_replaced_session_closes_its_spill_file(self):
+        processor = F12022Processor("key_123", True)
+        processor.session = processor.create_session({
+            "session_uid": "uid_123", "session_type": 10, "track_id": 1, "is_online_game": False, "ai_difficulty": 90,
+            "weather_id": 1, "game_mode": 5, "season_link_identifier": 1,
+        })
+        spill_file = processor.session.telemetry_spill_policy.spill_file
+        spill_file.append("{}")
+        processor.process_session_packet({"session_uid": "uid_456", "session_type": 10, "track_id": 1, "is_online_game": False,
+                                          "ai_difficulty": 90, "weather_id": 1, "game_mode": 5, "season_link_identifier": 1})
+        self.assertEqual(processor.session.session_udp_uid, "uid_456")
+        self.assertIsNone(spill_file.file)
+        new_spill_file = processor.session.telemetry_spill_policy.spill_file
+        new_spill_file.append("{}")
+        processor.kill()
+        self.assertIsNone(new_spill_file.file)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -2,6 +2,7 @@ from unittest import TestCase
 from unittest.mock import patch
 
 from receiver.f12022.session import F12022Session
+from receiver.uploader import F1LapsUploader
 
 
 class F12022SessionTest(TestCase):
@@ -116,6 +117,41 @@ class F12022SessionTest(TestCase):
         self.assertEqual(mock_lap_sync.call_count, 0)
         self.assertFalse(lap.has_been_synced_to_f1l)
     
+    @patch('receiver.f12022.session.F1LapsAPI2022.session_create_or_update')
+    @patch('receiver.f12022.session.F1LapsAPI2022.lap_create')
+    def test_sync_to_f1laps_with_uploader(self, mock_lap_sync, mock_session_sync):
+        mock_session_sync.return_value = True, "123"
+        mock_lap_sync.return_value = True
+        uploader = F1LapsUploader()
+        session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5, uploader=uploader)
+        session.team_id = 1
+        session.add_lap(1)
+        session.lap_list[1].sector_1_ms = 1
+        session.lap_list[1].sector_2_ms = 2
+        session.lap_list[1].sector_3_ms = 3
+        # Syncing only enqueues, and repeated session syncs get coalesced
+        self.assertTrue(session.sync_to_f1laps(1))
+        self.assertTrue(session.sync_to_f1laps(lap_number=None, sync_entire_session=True))
+        self.assertEqual(mock_session_sync.call_count, 0)
+        self.assertEqual(uploader.get_queue_depth(), 1)
+        # The worker sends it and stores the F1Laps session ID
+        uploader.process_next_job(timeout=0)
+        self.assertEqual(mock_session_sync.call_count, 1)
+        self.assertEqual(mock_session_sync.call_args.kwargs["f1laps_session_id"], None)
+        self.assertEqual(session.f1_laps_session_id, "123")
+        # Next update uses the F1Laps session ID
+        session.sync_to_f1laps(lap_number=None, sync_entire_session=True)
+        uploader.process_next_job(timeout=0)
+        self.assertEqual(mock_session_sync.call_args.kwargs["f1laps_session_id"], "123")
+        # Time trial laps are enqueued too
+        session.session_type = 13
+        self.assertTrue(session.sync_to_f1laps(1))
+        self.assertTrue(session.lap_list[1].has_been_synced_to_f1l)
+        self.assertEqual(mock_lap_sync.call_count, 0)
+        uploader.process_next_job(timeout=0)
+        self.assertEqual(mock_lap_sync.call_count, 1)
+        self.assertEqual(mock_lap_sync.call_args.kwargs["sector_3_time"], 3)
+    
     def test_set_team_id_and_game_mode_update(self):
         # Time trial session
         session = F12022Session("key_123", True, "uid_123", 10, 1, False, 90, 1, 5)